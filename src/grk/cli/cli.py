@@ -1,460 +1,689 @@
-"""CLI commands for interacting with Grok LLM."""
+"""CLI commands for interacting with Grok LLM.
+
+Only the standard library, rich's console and the session client layer are
+imported here. The SDK, the configuration models, YAML and the runners are
+imported inside the commands that use them, so `grk --help` and the session
+client commands start without paying for them.
+"""
 
 import os
-import json
 import time
 import sys
 import subprocess
 import socket
-from concurrent.futures import ThreadPoolExecutor
-from rich.live import Live
-from rich.spinner import Spinner
 from rich.console import Console
 from pathlib import Path
-from ..config.config import load_config, create_default_config
-from ..core.runner import run_grok
-from ..config.config_handler import list_configs
-from ..core.session import recv_full
-from ..utils.utils import print_instruction_tree, get_synopsis, GrkException
+from typing import List, Union
+from ..core.runtime import (
+    READY_FD_ENV,
+    DaemonFiles,
+    daemon_files,
+    daemon_lock,
+    session_id,
+    wait_ready,
+)
+from ..core.framing import MAX_FRAME_SIZE, FrameError
+from ..core.session_client import SessionConnection
+from ..utils.utils import (
+    print_instruction_tree,
+    print_apply_report,
+    print_encoding_report,
+    print_race_report,
+    print_retries,
+    print_usage,
+    get_synopsis,
+    split_globs,
+    GrkException,
+)
 from ..utils.logging import setup_logging
+from ..utils.tokens import estimate_tokens
 from treeparse import cli, group, command, argument, option
 
 logger = setup_logging()
 
+# Seconds `session up` waits for a new daemon, which imports the SDK first
+DAEMON_START_TIMEOUT = 30
+
 
 def init_func():
     """Initialize .grkrc with default profiles."""
+    from ..config.config import create_default_config
+
     create_default_config()
 
 
 def list_func():
     """List the configurations from .grkrc with YAML syntax highlighting."""
+    from ..config.config_handler import list_configs
+
     list_configs()
 
 
-def run_func(file: str, message: str, profile: str = "default"):
+def run_func(
+    file: str,
+    message: str,
+    profile: str = "default",
+    stream: bool = False,
+    include: str = None,
+    exclude: str = None,
+    apply: bool = False,
+    race: str = None,
+):
     """Run the Grok LLM processing using the specified profile (single-shot mode)."""
-    if not Path(file).exists() or Path(file).is_dir():
+    from ..config.config import load_config
+    from ..core.race import RaceLeg
+    from ..core.runner import run_grok
+
+    if not Path(file).exists():
         raise GrkException(f"Invalid file: {file}")
     api_key = os.environ.get("XAI_API_KEY")
     if not api_key:
         raise GrkException("API key is required via XAI_API_KEY environment variable.")
     config = load_config(profile)
-    run_grok(file, message, config, api_key, profile)
+    run_grok(
+        file,
+        message,
+        config,
+        api_key,
+        profile,
+        stream=stream,
+        include=split_globs(include),
+        exclude=split_globs(exclude),
+        apply=apply,
+        race=[RaceLeg.from_dict(leg) for leg in race_legs(race)] or None,
+    )
 
 
-def session_up_func(file: str, profile: str = "default"):
-    """Start a background session process with initial codebase."""
-    if not Path(file).exists() or Path(file).is_dir():
-        raise GrkException(f"Invalid file: {file}")
+def race_legs(race: str = None) -> List[dict]:
+    """Resolve comma-separated profile names into the model, temperature and resilience each races with."""
+    names = dict.fromkeys(p.strip() for p in (race or "").split(",") if p.strip())
+    if not names:
+        return []
+    from ..config.config import load_config
+
+    legs = []
+    for name in names:
+        config = load_config(name)
+        leg = {
+            "profile": name,
+            "model": config.model or "grok-4-fast",
+            "temperature": config.temperature or 0,
+        }
+        if config.resilience:
+            leg["resilience"] = config.resilience.model_dump()
+        legs.append(leg)
+    return legs
+
+
+def batch_func(manifest: str, concurrency: int = 4):
+    """Run many prompt jobs from a JSONL/YAML manifest concurrently."""
+    from ..core.batch import run_batch
+
+    if not Path(manifest).exists() or Path(manifest).is_dir():
+        raise GrkException(f"Invalid manifest: {manifest}")
     api_key = os.environ.get("XAI_API_KEY")
     if not api_key:
-        raise GrkException("API key required via XAI_API_KEY environment variable.")
-    config = load_config(profile)
-    pid_file = Path(".grk_session.pid")
-    port_file = Path(".grk_session.port")
-    session_file = Path(".grk_session.json")
-    log_file = Path(".grk_daemon.log")
-    args_file = Path(".grk_session.args.json")
-    if pid_file.exists():
-        with pid_file.open() as f:
-            pid = int(f.read().strip())
-        try:
-            os.kill(pid, 0)
-            raise GrkException(
-                f"Session already running (PID {pid}). Run 'grk session down' to stop it."
-            )
-        except OSError:
-            logger.info("Cleaning up stale PID file")
-            pid_file.unlink()
-            port_file.unlink(missing_ok=True)
-            session_file.unlink(missing_ok=True)
-            log_file.unlink(missing_ok=True)
-
-    # Serialize config and args to file
-    args_dict = {
-        "file": file,
-        "config": config.model_dump(exclude_none=True),
-        "api_key": api_key,
-    }
-    args_file.write_text(json.dumps(args_dict))
+        raise GrkException("API key is required via XAI_API_KEY environment variable.")
+    results = run_batch(manifest, api_key, concurrency)
+    failed = [r for r in results if r.error]
+    if failed:
+        raise GrkException(f"{len(failed)} of {len(results)} batch jobs failed")
+
+
+def stats_summary_func(by: str = "model", days: float = None):
+    """Aggregate the usage ledger per model, profile, day or mode."""
+    from rich.table import Table
+    from ..core.ledger import GROUPS, aggregate, ledger_path, load_entries
+
+    if by not in GROUPS:
+        raise GrkException(f"Invalid grouping '{by}', expected one of {', '.join(GROUPS)}")
+    entries = load_entries(days=days)
+    console = Console()
+    if not entries:
+        console.print(f"[yellow]No requests recorded in {ledger_path()}[/yellow]")
+        return
+    table = Table(title=f"Requests per {by}")
+    for column in (
+        by,
+        "Requests",
+        "Errors",
+        "Cached",
+        "Retries",
+        "Latency p50/p90/p99",
+        "TTFT p50/p90",
+    ):
+        table.add_column(column, justify="left" if column == by else "right")
+    table.add_column("Prompt tokens (cached)", justify="right")
+    table.add_column("Completion tokens", justify="right")
+    for row in aggregate(entries, by):
+        ttft = (
+            f"{row.ttft_p50:.2f}s / {row.ttft_p90:.2f}s"
+            if row.ttft_p50 is not None
+            else "-"
+        )
+        cached_share = (
+            row.cached_prompt_tokens / row.prompt_tokens if row.prompt_tokens else 0.0
+        )
+        table.add_row(
+            row.key,
+            str(row.requests),
+            str(row.errors),
+            str(row.cached),
+            str(row.retries),
+            f"{row.latency_p50:.2f}s / {row.latency_p90:.2f}s / {row.latency_p99:.2f}s",
+            ttft,
+            f"{row.prompt_tokens} ({cached_share:.0%})",
+            str(row.completion_tokens),
+        )
+    console.print(table)
+
+
+def stats_recent_func(limit: int = 20):
+    """Show the most recent requests in the usage ledger."""
+    from rich.table import Table
+    from ..core.ledger import ledger_path, load_entries
+
+    entries = load_entries(limit=limit)
+    console = Console()
+    if not entries:
+        console.print(f"[yellow]No requests recorded in {ledger_path()}[/yellow]")
+        return
+    table = Table(title="Recent requests")
+    for column in ("Time", "Mode", "Profile", "Model", "Outcome"):
+        table.add_column(column)
+    for column in ("Latency", "TTFT", "Tokens in/out", "Bytes in/out"):
+        table.add_column(column, justify="right")
+    for entry in entries:
+        outcome = entry.outcome if not entry.error else f"{entry.outcome}: {entry.error}"
+        table.add_row(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.timestamp)),
+            entry.mode,
+            entry.profile,
+            entry.model,
+            outcome,
+            f"{entry.latency:.2f}s",
+            f"{entry.first_token_time:.2f}s" if entry.first_token_time is not None else "-",
+            f"{entry.prompt_tokens}/{entry.completion_tokens}",
+            f"{entry.request_bytes}/{entry.response_bytes}",
+        )
+    console.print(table)
+
+
+def daemon_alive() -> bool:
+    """Return whether the session daemon is running, cleaning up stale files if not."""
+    files = daemon_files()
+    if not files.pid.exists():
+        return False
+    pid = int(files.pid.read_text().strip())
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        logger.info("Cleaning up stale PID file")
+        files.pid.unlink(missing_ok=True)
+        files.sock.unlink(missing_ok=True)
+        files.port.unlink(missing_ok=True)
+        return False
+
+
+def ensure_daemon():
+    """Start the session daemon unless it is running.
+
+    The check and the start happen under the daemon lock, so concurrent
+    commands start a single daemon.
+    """
+    with daemon_lock():
+        if not daemon_alive():
+            start_daemon()
+
+def start_daemon():
+    """Launch the per-user session daemon and wait until it is listening.
+
+    The daemon reports readiness, or the error that kept it from listening, on
+    an inherited pipe, so this returns as soon as it accepts connections.
+    """
+    files = daemon_files()
+    files.sock.unlink(missing_ok=True)
+    files.port.unlink(missing_ok=True)
     # note no leading spaces
     code = """
-import json
 import traceback
 import sys
-from pathlib import Path
-from grk.core.session import daemon_process
-from grk.config.models import ProfileConfig
+from grk.core.runtime import ReadyChannel
+ready = ReadyChannel.from_env()
 try:
-    args_file = Path('.grk_session.args.json')
-    args = json.loads(args_file.read_text())
-    args_file.unlink()
-    config = ProfileConfig(**args['config'])
-    daemon_process(args['file'], config, args['api_key'])
+    from grk.core.session import daemon_process
+    daemon_process(ready)
 except Exception as e:
+    ready.send(error=f"{type(e).__name__}: {e}")
     print("Daemon error:", file=sys.stderr)
     traceback.print_exc(file=sys.stderr)
     sys.exit(1)
     """
 
+    windows = sys.platform.startswith("win")
     creation_flags = 0
-    if sys.platform.startswith("win"):
+    if windows:
         creation_flags = (
             subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
         )
-    with open(log_file, "w") as log:
-        p = subprocess.Popen(
-            [sys.executable, "-c", code],
-            stdout=log,
-            stderr=log,
-            creationflags=creation_flags,
-            start_new_session=not sys.platform.startswith("win"),
+    read_fd, write_fd = (None, None) if windows else os.pipe()
+    env = dict(os.environ)
+    if write_fd is not None:
+        env[READY_FD_ENV] = str(write_fd)
+    try:
+        with open(files.log, "w") as log:
+            p = subprocess.Popen(
+                [sys.executable, "-c", code],
+                stdout=log,
+                stderr=log,
+                cwd=str(files.pid.parent),
+                env=env,
+                creationflags=creation_flags,
+                start_new_session=not windows,
+                pass_fds=() if write_fd is None else (write_fd,),
+            )
+    finally:
+        if write_fd is not None:
+            os.close(write_fd)  # Only the daemon may hold the write end
+    files.pid.write_text(str(p.pid))
+    start_time = time.time()
+    try:
+        if read_fd is None:
+            message = poll_ready(files, DAEMON_START_TIMEOUT)
+        else:
+            message = wait_ready(read_fd, DAEMON_START_TIMEOUT)
+    except TimeoutError:
+        raise GrkException(
+            f"Daemon did not start listening within {DAEMON_START_TIMEOUT} seconds. "
+            f"Logs in {files.log}"
+        )
+    finally:
+        if read_fd is not None:
+            os.close(read_fd)
+    if message and message.get("ready"):
+        logger.info(
+            f"Session daemon started with PID {p.pid} in "
+            f"{time.time() - start_time:.2f} seconds. Logs in {files.log}"
         )
-    pid = p.pid
-    pid_file.write_text(str(pid))
-    session_file.write_text(
-        json.dumps({"pid": pid, "profile": profile, "initial_file": file})
-    )
-    # Wait for daemon to start and write port file
-    if os.environ.get("PYTEST_CURRENT_TEST") is not None:
-        logger.info(f"Session started with PID {pid}. Logs in {log_file}")
         return
-    for _ in range(10):  # Poll for up to 10 seconds
-        time.sleep(1)
-        if port_file.exists():
-            logger.info(f"Session started with PID {pid}. Logs in {log_file}")
-            return
-    # If port file not found after waiting
-    log_content = log_file.read_text() if log_file.exists() else "No logs available"
-    raise GrkException(f"Daemon failed to start. Logs:\n{log_content}")
+    files.pid.unlink(missing_ok=True)
+    error = (message or {}).get("error") or "exited before it was listening"
+    raise GrkException(f"Daemon failed to start: {error}. Logs in {files.log}")
 
 
-def session_msg_func(message: str, output: str = "__temp.json", input_file: str = None):
-    """Send a message to the background session."""
-    if input_file and (not Path(input_file).exists() or Path(input_file).is_dir()):
-        raise GrkException(f"Invalid input file: {input_file}")
-    console = Console()
-    pid_file = Path(".grk_session.pid")
-    port_file = Path(".grk_session.port")
-    session_file = Path(".grk_session.json")
-    log_file = Path(".grk_daemon.log")
-    if not pid_file.exists():
+def poll_ready(files: DaemonFiles, timeout: float) -> dict:
+    """Wait for the daemon's socket or port file where no readiness pipe can be inherited."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if files.sock.exists() or files.port.exists():
+            return {"ready": True}
+        time.sleep(0.05)
+    raise TimeoutError(f"Daemon not listening within {timeout} seconds")
+
+
+def connect_daemon() -> socket.socket:
+    """Connect to the session daemon, explaining what is wrong if it is unreachable."""
+    files = daemon_files()
+    if not files.pid.exists():
         raise GrkException("No session running")
-    if not port_file.exists():
-        raise GrkException("Port file missing; session may have failed to start")
-    port = int(port_file.read_text().strip())
-    if session_file.exists():
-        session_data = json.loads(session_file.read_text())
-        profile = session_data.get("profile", "default")
-        initial_file = session_data.get("initial_file", "unknown")
+    if files.sock.exists():
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = str(files.sock)
+    elif files.port.exists():
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = ("127.0.0.1", int(files.port.read_text().strip()))
     else:
-        profile = "default"
-        initial_file = "unknown"
-    config = load_config(profile)
-    model_used = config.model or "grok-4-fast"
+        raise GrkException(
+            "Socket and port files missing; session may have failed to start"
+        )
+    try:
+        client.connect(address)
+    except (ConnectionRefusedError, FileNotFoundError):
+        client.close()
+        error_msg = "Session not responding."
+        if daemon_alive():
+            error_msg += " Process is running but not listening."
+        else:
+            error_msg += " Process is not running. Cleaning up."
+        if files.log.exists():
+            log_content = files.log.read_text()
+            error_msg += f"\nDaemon log:\n{log_content}"
+        else:
+            error_msg += " No daemon log found."
+        raise GrkException(error_msg)
+    return client
+
 
-    # Get current instruction summary
-    client_list = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+def open_session() -> SessionConnection:
+    """Open a connection to the session daemon and negotiate its frame size."""
+    max_frame = int(os.environ.get("GRK_MAX_FRAME_SIZE") or MAX_FRAME_SIZE)
+    conn = SessionConnection(connect_daemon(), max_frame=max_frame)
     try:
-        client_list.connect(("127.0.0.1", port))
-        request_list = {"cmd": "list"}
-        send_request(client_list, request_list)
-        response_list = recv_response(client_list)
-        data_list = json.loads(response_list)
-        if "error" in data_list:
-            console.print(f"[bold red]Error:[/bold red] {data_list['error']}")
-            return
-        instruction_list = data_list.get("instructions", [])
-    except Exception as e:
-        raise GrkException(f"Failed to get instruction list: {str(e)}")
-    finally:
-        client_list.close()
+        conn.negotiate()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def daemon_request(request: dict, model_used: str = None) -> Union[dict, str]:
+    """Send one request to the session daemon and return its result."""
+    with open_session() as conn:
+        rid = conn.send(request)
+        return wait_for_frame(conn, rid, model_used=model_used)["data"]
+
+
+def session_up_func(
+    file: str,
+    profile: str = "default",
+    name: str = "default",
+    include: str = None,
+    exclude: str = None,
+):
+    """Start a session with initial codebase in the background session daemon."""
+    from ..config.config import load_config
+
+    if not Path(file).exists():
+        raise GrkException(f"Invalid file: {file}")
+    api_key = os.environ.get("XAI_API_KEY")
+    if not api_key:
+        raise GrkException("API key required via XAI_API_KEY environment variable.")
+    config = load_config(profile)
+    ensure_daemon()
+    sid = session_id(name, ".")
+    request = {
+        "cmd": "up",
+        "session": sid,
+        "name": name,
+        "project": str(Path.cwd()),
+        "file": str(Path(file).resolve()),
+        "profile": profile,
+        "config": config.model_dump(exclude_none=True),
+        "api_key": api_key,
+        "include": split_globs(include),
+        "exclude": split_globs(exclude),
+    }
+    data = daemon_request(request)
+    if isinstance(data, dict) and "error" in data:
+        raise GrkException(data["error"])
+    if isinstance(data, dict) and data.get("fold"):
+        Console().print(f"[bold green]{data['fold']}[/bold green]")
+    files = daemon_files()
+    pid = files.pid.read_text().strip()
+    logger.info(f"Session '{name}' started with PID {pid}. Logs in {files.log}")
+
+
+def session_msg_func(
+    message: str,
+    output: str = "__temp.json",
+    input_file: str = None,
+    stream: bool = False,
+    name: str = "default",
+    apply: bool = False,
+    race: str = None,
+):
+    """Send a message to a background session."""
+    if input_file and (not Path(input_file).exists() or Path(input_file).is_dir()):
+        raise GrkException(f"Invalid input file: {input_file}")
+    console = Console()
+    sid = session_id(name, ".")
 
-    # Prepare adding list
-    adding = []
     input_content = Path(input_file).read_text() if input_file else None
-    if input_content:
-        input_synopsis = get_synopsis(input_content)
+    request = {
+        "cmd": "query",
+        "session": sid,
+        "prompt": message,
+        "output": str(Path(output).resolve()),
+        "input_content": input_content,
+        "stream": stream,
+        "backlog": True,
+        "apply": apply,
+    }
+    legs = race_legs(race)
+    if legs:
+        request["race"] = legs
+    with open_session() as conn:
+        # The daemon answers with the instruction backlog before running the query
+        rid = conn.send(request)
+        frame = wait_for_frame(conn, rid)
+        if frame["type"] == "result":
+            data = frame["data"]
+            error = data.get("error") if isinstance(data, dict) else data
+            console.print(f"[bold red]Error:[/bold red] {error}")
+            return
+        backlog = frame["data"]
+        instruction_list = backlog.get("instructions", [])
+        profile = backlog.get("profile", "default")
+        initial_file = backlog.get("initial_file", "unknown")
+        model_used = backlog.get("model")
+        if not model_used:
+            from ..config.config import load_config
+
+            model_used = load_config(profile).model or "grok-4-fast"
+
+        # Prepare adding list
+        adding = []
+        if input_content:
+            input_synopsis = get_synopsis(input_content)
+            adding.append(
+                {
+                    "role": "user",
+                    "name": "Unnamed",
+                    "synopsis": f"Additional input: ```txt {input_synopsis}```",
+                    "tokens": estimate_tokens(input_content),
+                }
+            )
+        prompt_synopsis = get_synopsis(message)
         adding.append(
             {
                 "role": "user",
                 "name": "Unnamed",
-                "synopsis": f"Additional input: ```txt {input_synopsis}```",
+                "synopsis": prompt_synopsis,
+                "tokens": estimate_tokens(message),
             }
         )
-    prompt_synopsis = get_synopsis(message)
-    adding.append({"role": "user", "name": "Unnamed", "synopsis": prompt_synopsis})
-
-    # Print instruction backlog and current submission separately
-    print_instruction_tree(console, instruction_list, title="Instruction Backlog:")
-    print_instruction_tree(console, adding, title="Current Submission:")
 
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client.connect(("127.0.0.1", port))
+        # Print instruction backlog and current submission separately
+        print_instruction_tree(
+            console,
+            instruction_list,
+            title="Instruction Backlog:",
+            files=backlog.get("file_tokens"),
+        )
+        print_instruction_tree(console, adding, title="Current Submission:")
 
         console.print(
             "[bold green]Querying grk session[/bold green] with the following settings:"
         )
+        console.print(f" Session: [cyan]{name}[/cyan]")
         console.print(f" Profile: [cyan]{profile}[/cyan]")
         console.print(f" Model: [yellow]{model_used}[/yellow]")
+        if legs:
+            raced = ", ".join(f"{leg['profile']} ({leg['model']})" for leg in legs)
+            console.print(f" Race: [yellow]{raced}[/yellow]")
         console.print(f" Initial file: [cyan]{initial_file}[/cyan]")
+        if backlog.get("encoding_tokens"):
+            print_encoding_report(
+                console, backlog["encoding_tokens"], backlog.get("context_format")
+            )
         console.print(f" Prompt: [cyan]{message}[/cyan]")
         console.print(f" Output: [cyan]{output}[/cyan]")
         if input_file:
             console.print(f" Additional input file: [cyan]{input_file}[/cyan]")
 
-        request = {
-            "cmd": "query",
-            "prompt": message,
-            "output": output,
-            "input_content": input_content,
-        }
-        send_request(client, request)
-
-        response = recv_response(client, model_used=model_used)
+        frame = wait_for_frame(conn, rid, model_used=model_used)
+        if frame["type"] == "chunk":
+            frame = print_stream(conn, rid, frame, console)
+        data = frame["data"]
 
-        data = json.loads(response)
-        if "error" in data:
-            console.print(f"[bold red]Error:[/bold red] {data['error']}")
-            return
-        if data.get("message"):
-            console.print(
-                f"[bold green]Message from Grok:[/bold green] {data['message']}"
-            )
-        console.print("[bold green]Summary:[/bold green]")
-        console.print(data["summary"])
-        if "thinking_time" in data:
-            console.print(
-                f"[bold green]Thinking time:[/bold green] {data['thinking_time']:.2f} seconds"
-            )
-        console.print(f"[bold green]Output written to:[/bold green] '{output}'")
-    except ConnectionRefusedError:
-        error_msg = "Session not responding."
-        if pid_file.exists():
-            with pid_file.open() as f:
-                pid = int(f.read().strip())
-            try:
-                os.kill(pid, 0)
-                error_msg += " Process is running but not listening."
-            except OSError:
-                error_msg += " Process is not running. Cleaning up."
-                pid_file.unlink()
-                port_file.unlink(missing_ok=True)
-                session_file.unlink(missing_ok=True)
-        if log_file.exists():
-            log_content = log_file.read_text()
-            error_msg += f"\nDaemon log:\n{log_content}"
-        else:
-            error_msg += " No daemon log found."
-        raise GrkException(error_msg)
-    finally:
-        client.close()
+    if "error" in data:
+        console.print(f"[bold red]Error:[/bold red] {data['error']}")
+        return
+    if data.get("warning"):
+        console.print(f"[yellow]Warning: {data['warning']}[/yellow]")
+    if data.get("message"):
+        console.print(f"[bold green]Message from Grok:[/bold green] {data['message']}")
+    if "race" in data:
+        print_race_report(console, data["race"])
+    console.print("[bold green]Summary:[/bold green]")
+    console.print(data["summary"])
+    if "first_token_time" in data:
+        console.print(
+            f"[bold green]Time to first token:[/bold green] {data['first_token_time']:.2f} seconds"
+        )
+    if "thinking_time" in data:
+        console.print(
+            f"[bold green]Thinking time:[/bold green] {data['thinking_time']:.2f} seconds"
+        )
+    print_retries(console, data.get("retries", 0))
+    print_usage(console, data.get("usage", {}))
+    console.print(f"[bold green]Output written to:[/bold green] '{output}'")
+    if "applied" in data:
+        print_apply_report(console, data["applied"])
+    elif apply:
+        console.print("[yellow]Warning: Response has no cfold files, nothing to apply.[/yellow]")
 
 
-def session_down_func():
-    """Tear down the background session process."""
-    pid_file = Path(".grk_session.pid")
-    port_file = Path(".grk_session.port")
-    session_file = Path(".grk_session.json")
-    log_file = Path(".grk_daemon.log")
-    if not pid_file.exists():
-        raise GrkException("No session running")
-    if not port_file.exists():
-        raise GrkException("Port file missing; session may have failed to start")
-    port = int(port_file.read_text().strip())
-    with pid_file.open() as f:
-        pid = int(f.read().strip())
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client.connect(("127.0.0.1", port))
-        request = {"cmd": "down"}
-        send_request(client, request)
-        resp = recv_response(client)
-        try:
-            data = json.loads(resp)
-            if "error" in data:
-                logger.error(f"Error shutting down: {data['error']}")
-            else:
-                logger.info(resp)
-        except json.JSONDecodeError:
-            logger.info(resp)
-        client.close()
-    except ConnectionRefusedError:
-        logger.info("Session not responding, removing PID file")
-    finally:
-        if pid_file.exists():
-            pid_file.unlink()
-        if port_file.exists():
-            port_file.unlink()
-        if session_file.exists():
-            session_file.unlink()
-        if log_file.exists():
-            log_file.unlink()
-        try:
-            os.kill(pid, 9)
-        except OSError:
-            pass
-
-
-def session_list_func():
-    """List file names and instruction synopses of the session."""
-    console = Console()
-    pid_file = Path(".grk_session.pid")
-    port_file = Path(".grk_session.port")
-    session_file = Path(".grk_session.json")
-    log_file = Path(".grk_daemon.log")
-    if not pid_file.exists():
-        raise GrkException("No session running")
-    if not port_file.exists():
-        raise GrkException("Port file missing; session may have failed to start")
-    port = int(port_file.read_text().strip())
-    if session_file.exists():
-        session_data = json.loads(session_file.read_text())
-        profile = session_data.get("profile", "unknown")
-        initial_file = session_data.get("initial_file", "unknown")
+def session_down_func(name: str = "default"):
+    """Tear down a background session; the daemon exits with its last session unless warm."""
+    resp = daemon_request({"cmd": "down", "session": session_id(name, ".")})
+    if isinstance(resp, dict) and "error" in resp:
+        logger.error(f"Error shutting down: {resp['error']}")
     else:
-        profile = "unknown"
-        initial_file = "unknown"
+        logger.info(resp)
 
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client.connect(("127.0.0.1", port))
-        request = {"cmd": "list"}
-        send_request(client, request)
 
-        response = recv_response(client)
+def session_warm_func(idle: float = 600.0):
+    """Keep a warm session daemon running for idle seconds after its last session."""
+    with daemon_lock():
+        if not daemon_alive():
+            if idle <= 0:
+                logger.info("No session daemon running")
+                return
+            start_daemon()
+    request = {"cmd": "warm", "idle": idle, "api_key": os.environ.get("XAI_API_KEY")}
+    data = daemon_request(request)
+    if isinstance(data, dict) and "error" in data:
+        raise GrkException(data["error"])
+    if idle > 0:
+        pid = daemon_files().pid.read_text().strip()
+        logger.info(
+            f"Session daemon with PID {pid} stays warm for {idle:g} seconds without sessions"
+        )
+    else:
+        logger.info("Session daemon exits with its last session")
+
 
-        data = json.loads(response)
+def session_list_func(name: str = "default", all_sessions: bool = False):
+    """List file names and instruction synopses of a session, or all hosted sessions."""
+    console = Console()
+    if all_sessions:
+        data = daemon_request({"cmd": "sessions"})
         if "error" in data:
             console.print(f"[bold red]Error from session:[/bold red] {data['error']}")
             return
-        console.print("[bold green]Session Details:[/bold green]")
-        console.print(f" Profile: [cyan]{profile}[/cyan]")
-        console.print(f" Initial file: [cyan]{initial_file}[/cyan]")
-        console.print("[bold green]Current Files:[/bold green]")
-        for f in data.get("files", []):
-            console.print(f" - {f}")
-        instructions = data.get("instructions", [])
-        print_instruction_tree(console, instructions, title="Instruction Stack:")
-    except ConnectionRefusedError:
-        error_msg = "Session not responding."
-        if pid_file.exists():
-            with pid_file.open() as f:
-                pid = int(f.read().strip())
-            try:
-                os.kill(pid, 0)
-                error_msg += " Process is running but not listening."
-            except OSError:
-                error_msg += " Process is not running. Cleaning up."
-                pid_file.unlink()
-                port_file.unlink(missing_ok=True)
-                session_file.unlink(missing_ok=True)
-        if log_file.exists():
-            log_content = log_file.read_text()
-            error_msg += f"\nDaemon log:\n{log_content}"
-        else:
-            error_msg += " No daemon log found."
-        raise GrkException(error_msg)
-    finally:
-        client.close()
+        console.print("[bold green]Sessions:[/bold green]")
+        if data.get("warm_idle"):
+            console.print(
+                f" Daemon stays warm for {data['warm_idle']:g} seconds without sessions"
+            )
+        for s in data.get("sessions", []):
+            state = "[yellow]busy[/yellow]" if s.get("busy") else "idle"
+            console.print(
+                f" - [cyan]{s['name']}[/cyan] {s['project']} "
+                f"({s['profile']}, {s['model']}, {s['files']} files, {state})"
+            )
+        return
+
+    data = daemon_request({"cmd": "list", "session": session_id(name, ".")})
+    if "error" in data:
+        console.print(f"[bold red]Error from session:[/bold red] {data['error']}")
+        return
+    console.print("[bold green]Session Details:[/bold green]")
+    console.print(f" Session: [cyan]{name}[/cyan]")
+    console.print(f" Profile: [cyan]{data.get('profile', 'unknown')}[/cyan]")
+    console.print(f" Initial file: [cyan]{data.get('initial_file', 'unknown')}[/cyan]")
+    if data.get("encoding_tokens"):
+        print_encoding_report(console, data["encoding_tokens"], data.get("context_format"))
+    if data.get("busy"):
+        console.print(" Status: [yellow]busy (query in progress)[/yellow]")
+    console.print("[bold green]Current Files:[/bold green]")
+    for f in data.get("files", []):
+        console.print(f" - {f}")
+    instructions = data.get("instructions", [])
+    print_instruction_tree(
+        console,
+        instructions,
+        title="Instruction Stack:",
+        files=data.get("file_tokens"),
+    )
 
 
-def session_new_func(file: str):
+def session_new_func(
+    file: str,
+    name: str = "default",
+    full: bool = False,
+    include: str = None,
+    exclude: str = None,
+):
     """Renew the instruction stack with a new file, preparing for the next message."""
-    if not Path(file).exists() or Path(file).is_dir():
+    if not Path(file).exists():
         raise GrkException(f"Invalid file: {file}")
     console = Console()
-    pid_file = Path(".grk_session.pid")
-    port_file = Path(".grk_session.port")
-    session_file = Path(".grk_session.json")
-    log_file = Path(".grk_daemon.log")
-    if not pid_file.exists():
-        raise GrkException("No session running")
-    if not port_file.exists():
-        raise GrkException("Port file missing; session may have failed to start")
-    port = int(port_file.read_text().strip())
-
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client.connect(("127.0.0.1", port))
-        request = {"cmd": "new", "file": file}
-        send_request(client, request)
-
-        response = recv_response(client)
-
-        data = json.loads(response)
-        if "error" in data:
-            console.print(f"[bold red]Error:[/bold red] {data['error']}")
-            return
-        console.print(
-            f"[bold green]Success:[/bold green] {data.get('message', 'Instruction stack and files renewed.')}"
-        )
-    except ConnectionRefusedError:
-        error_msg = "Session not responding."
-        if pid_file.exists():
-            with pid_file.open() as f:
-                pid = int(f.read().strip())
-            try:
-                os.kill(pid, 0)
-                error_msg += " Process is running but not listening."
-            except OSError:
-                error_msg += " Process is not running. Cleaning up."
-                pid_file.unlink()
-                port_file.unlink(missing_ok=True)
-                session_file.unlink(missing_ok=True)
-        if log_file.exists():
-            log_content = log_file.read_text()
-            error_msg += f"\nDaemon log:\n{log_content}"
-        else:
-            error_msg += " No daemon log found."
-        raise GrkException(error_msg)
-    finally:
-        client.close()
-
-
-def send_request(client: socket.socket, request: dict):
-    """Send request with length prefix."""
-    request_json = json.dumps(request)
-    length = len(request_json)
-    length_bytes = length.to_bytes(4, "big")
-    client.send(length_bytes + request_json.encode())
+    request = {
+        "cmd": "new",
+        "session": session_id(name, "."),
+        "file": str(Path(file).resolve()),
+        "full": full,
+        "include": split_globs(include),
+        "exclude": split_globs(exclude),
+    }
+    data = daemon_request(request)
+    if "error" in data:
+        console.print(f"[bold red]Error:[/bold red] {data['error']}")
+        return
+    if data.get("fold"):
+        console.print(f"[bold green]{data['fold']}[/bold green]")
+    console.print(
+        f"[bold green]Success:[/bold green] {data.get('message', 'Instruction stack and files renewed.')}"
+    )
 
 
-def recv_response(client: socket.socket, model_used: str = None) -> str:
-    """Receive response with length prefix, with spinner."""
+def wait_for_frame(conn: SessionConnection, rid: int, model_used: str = None) -> dict:
+    """Wait for the next frame of request rid, with spinner."""
     console = Console()
     wait_text = (
         f"[bold yellow] Waiting for {model_used} response...[/bold yellow]"
         if model_used
         else "[bold yellow] Waiting for response...[/bold yellow]"
     )
+    if not console.is_terminal:
+        return conn.next_frame(rid)
+    from concurrent.futures import ThreadPoolExecutor
+    from rich.live import Live
+    from rich.spinner import Spinner
+
     with ThreadPoolExecutor(max_workers=1) as executor:
-        # First, receive length
-        future_length = executor.submit(recv_full, client, 4)
+        future = executor.submit(conn.next_frame, rid)
         spinner = Spinner("dots", wait_text)
-        if console.is_terminal:
-            with Live(spinner, console=console, refresh_per_second=15, transient=True):
-                while not future_length.done():
-                    time.sleep(0.1)
-        else:
-            while not future_length.done():
-                time.sleep(0.1)
-        length_bytes = future_length.result()
-        length = int.from_bytes(length_bytes, "big")
-
-        # Then, receive data
-        future_data = executor.submit(recv_full, client, length)
-        if console.is_terminal:
-            with Live(spinner, console=console, refresh_per_second=15, transient=True):
-                while not future_data.done():
-                    time.sleep(0.1)
-        else:
-            while not future_data.done():
+        with Live(spinner, console=console, refresh_per_second=15, transient=True):
+            while not future.done():
                 time.sleep(0.1)
-        data_bytes = future_data.result()
-        return data_bytes.decode("utf-8")
+        return future.result()
+
+
+def print_stream(
+    conn: SessionConnection, rid: int, frame: dict, console: Console
+) -> dict:
+    """Print chunk frames of request rid as they arrive and return its result frame."""
+    while frame["type"] == "chunk":
+        console.print(
+            frame["data"], end="", markup=False, highlight=False, soft_wrap=True
+        )
+        frame = conn.next_frame(rid)
+    console.print()
+    return frame
 
 
 app = cli(
@@ -508,10 +737,62 @@ run_cmd = command(
             default="default",
             sort_key=0,
         ),
+        option(
+            flags=["--stream", "-s"],
+            help="Stream tokens as they are generated",
+            flag=True,
+            sort_key=1,
+        ),
+        option(
+            flags=["--include", "-I"],
+            help="Comma-separated globs of files to fold when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=2,
+        ),
+        option(
+            flags=["--exclude", "-X"],
+            help="Comma-separated globs of files to leave out when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=3,
+        ),
+        option(
+            flags=["--apply", "-a"],
+            help="Write the changed files of a cfold answer to disk",
+            flag=True,
+            sort_key=4,
+        ),
+        option(
+            flags=["--race", "-r"],
+            help="Comma-separated profiles to race; the first usable answer wins",
+            arg_type=str,
+            default=None,
+            sort_key=5,
+        ),
     ],
 )
 single_grp.commands.append(run_cmd)
 
+batch_cmd = command(
+    name="batch",
+    help="Run many prompt jobs from a JSONL/YAML manifest concurrently.",
+    callback=batch_func,
+    arguments=[
+        argument(name="manifest", arg_type=str, sort_key=0),
+    ],
+    options=[
+        option(
+            flags=["--concurrency", "-c"],
+            help="Maximum number of jobs in flight",
+            arg_type=int,
+            default=4,
+            sort_key=0,
+        ),
+    ],
+)
+single_grp.commands.append(batch_cmd)
+
 session_grp = group(
     name="session",
     help="Interactive Session Mode, manage background sessions for stateful, multi-query interactions with Grok.",
@@ -520,7 +801,7 @@ app.subgroups.append(session_grp)
 
 up_cmd = command(
     name="up",
-    help="Start a background session process with initial codebase.",
+    help="Start a session from a cfold file or a directory in the background session daemon.",
     callback=session_up_func,
     sort_key=-10,
     arguments=[
@@ -534,13 +815,34 @@ up_cmd = command(
             default="default",
             sort_key=0,
         ),
+        option(
+            flags=["--name", "-n"],
+            help="The session name",
+            arg_type=str,
+            default="default",
+            sort_key=1,
+        ),
+        option(
+            flags=["--include", "-I"],
+            help="Comma-separated globs of files to fold when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=2,
+        ),
+        option(
+            flags=["--exclude", "-X"],
+            help="Comma-separated globs of files to leave out when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=3,
+        ),
     ],
 )
 session_grp.commands.append(up_cmd)
 
 msg_cmd = command(
     name="msg",
-    help="Send a message to the background session.",
+    help="Send a message to a background session.",
     callback=session_msg_func,
     sort_key=-5,
     arguments=[
@@ -561,21 +863,88 @@ msg_cmd = command(
             default=None,
             sort_key=1,
         ),
+        option(
+            flags=["--stream", "-s"],
+            help="Stream tokens as they are generated",
+            flag=True,
+            sort_key=2,
+        ),
+        option(
+            flags=["--name", "-n"],
+            help="The session name",
+            arg_type=str,
+            default="default",
+            sort_key=3,
+        ),
+        option(
+            flags=["--apply", "-a"],
+            help="Write the changed files of a cfold answer to disk",
+            flag=True,
+            sort_key=4,
+        ),
+        option(
+            flags=["--race", "-r"],
+            help="Comma-separated profiles to race; the first usable answer wins",
+            arg_type=str,
+            default=None,
+            sort_key=5,
+        ),
     ],
 )
 session_grp.commands.append(msg_cmd)
 
 down_cmd = command(
     name="down",
-    help="Tear down the background session process.",
+    help="Tear down a background session; the daemon exits with its last session unless warm.",
     callback=session_down_func,
+    options=[
+        option(
+            flags=["--name", "-n"],
+            help="The session name",
+            arg_type=str,
+            default="default",
+            sort_key=0,
+        ),
+    ],
 )
 session_grp.commands.append(down_cmd)
 
+warm_cmd = command(
+    name="warm",
+    help="Start the session daemon ahead of time and keep it warm between sessions.",
+    callback=session_warm_func,
+    options=[
+        option(
+            flags=["--idle", "-i"],
+            help="Seconds the daemon stays up without sessions; 0 exits with the last one",
+            arg_type=float,
+            default=600.0,
+            sort_key=0,
+        ),
+    ],
+)
+session_grp.commands.append(warm_cmd)
+
 list_session_cmd = command(
     name="list",
-    help="List file names and instruction synopses of the session.",
+    help="List file names and instruction synopses of a session, or all hosted sessions.",
     callback=session_list_func,
+    options=[
+        option(
+            flags=["--name", "-n"],
+            help="The session name",
+            arg_type=str,
+            default="default",
+            sort_key=0,
+        ),
+        option(
+            flags=["--all", "-a"],
+            dest="all_sessions",
+            help="List all sessions hosted by the daemon",
+            flag=True,
+            sort_key=1,
+        ),
+    ],
 )
 session_grp.commands.append(list_session_cmd)
 
@@ -586,14 +955,89 @@ new_cmd = command(
     arguments=[
         argument(name="file", arg_type=str, sort_key=0),
     ],
+    options=[
+        option(
+            flags=["--name", "-n"],
+            help="The session name",
+            arg_type=str,
+            default="default",
+            sort_key=0,
+        ),
+        option(
+            flags=["--full", "-f"],
+            help="Restart the chat even if only a few files changed",
+            flag=True,
+            sort_key=1,
+        ),
+        option(
+            flags=["--include", "-I"],
+            help="Comma-separated globs of files to fold when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=2,
+        ),
+        option(
+            flags=["--exclude", "-X"],
+            help="Comma-separated globs of files to leave out when given a directory",
+            arg_type=str,
+            default=None,
+            sort_key=3,
+        ),
+    ],
 )
 session_grp.commands.append(new_cmd)
 
 
+stats_grp = group(
+    name="stats",
+    help="Summarize the local ledger of requests sent to the API.",
+)
+app.subgroups.append(stats_grp)
+
+stats_summary_cmd = command(
+    name="summary",
+    help="Aggregate the usage ledger per model, profile, day or mode.",
+    callback=stats_summary_func,
+    options=[
+        option(
+            flags=["--by", "-b"],
+            help="Group by model, profile, day or mode",
+            arg_type=str,
+            default="model",
+            sort_key=0,
+        ),
+        option(
+            flags=["--days", "-d"],
+            help="Only include requests from the last number of days",
+            arg_type=float,
+            default=None,
+            sort_key=1,
+        ),
+    ],
+)
+stats_grp.commands.append(stats_summary_cmd)
+
+stats_recent_cmd = command(
+    name="recent",
+    help="Show the most recent requests in the usage ledger.",
+    callback=stats_recent_func,
+    options=[
+        option(
+            flags=["--limit", "-l"],
+            help="Number of requests to show",
+            arg_type=int,
+            default=20,
+            sort_key=0,
+        ),
+    ],
+)
+stats_grp.commands.append(stats_recent_cmd)
+
+
 def main():
     try:
         app.run()
-    except GrkException as e:
+    except (GrkException, FrameError) as e:
         console = Console()
         console.print(f"[bold red]Error:[/bold red] {str(e)}")
         sys.exit(1)
@@ -1,13 +1,41 @@
-"""Load and manage configuration using Pydantic for validation."""
+"""Load and manage configuration using Pydantic for validation.
 
+Each .grkrc is parsed and validated once per (path, mtime, size) and kept in
+memory, so repeated loads within a process, such as every turn of the session
+daemon, cost a stat call. The validated settings are also written to a
+precompiled JSON snapshot in the per-user cache directory, which later
+processes load instead of parsing the YAML again; set GRK_CONFIG_SNAPSHOT=off
+to disable it.
+"""
+
+import hashlib
+import json
+import os
+import threading
 from pathlib import Path
-from ruamel.yaml import YAML
-from .models import FullConfig, ProfileConfig, Brief  # Import Pydantic models
-from typing import Optional
+from .models import (
+    FullConfig,
+    ProfileConfig,
+    Brief,
+    CacheConfig,
+    JournalConfig,
+    SessionConfig,
+    FoldConfig,
+)  # Import Pydantic models
+from typing import Dict, Optional, Tuple, Union
 from ..utils.logging import setup_logging
 
 logger = setup_logging()
 
+SNAPSHOT_ENV = "GRK_CONFIG_SNAPSHOT"
+
+FileKey = Tuple[int, int]  # (mtime in ns, size)
+
+# Parsed .grkrc files and brief contents by path, with the file key they were read at
+_configs: Dict[Path, Tuple[FileKey, Union[FullConfig, Exception]]] = {}
+_briefs: Dict[Path, Tuple[FileKey, str]] = {}
+_cache_lock = threading.Lock()
+
 DEFAULT_PROFILES = {
     "default": {
         "model": "grok-code-fast-1",
@@ -51,20 +79,135 @@ DEFAULT_BRIEF = {"file": "design_brief.typ", "role": "assistant"}
 DEFAULT_BRIEF_CONTENT = '#set page(margin: 1in)\n#set text(font: "New Computer Modern", size: 12pt)\n\n= Design Brief\n\nThis is a template for your project design brief. Edit as needed.\n'
 
 
+def file_key(path: Path) -> Optional[FileKey]:
+    """Return the modification time and size of path, or None if it does not exist."""
+    try:
+        stat = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def snapshot_path(config_file: Path) -> Path:
+    """Return the precompiled snapshot file of a .grkrc."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    name = hashlib.sha256(str(config_file).encode()).hexdigest()[:32]
+    return Path(base) / "grk" / "config" / f"{name}.json"
+
+
+def snapshots_enabled() -> bool:
+    return os.environ.get(SNAPSHOT_ENV, "").lower() not in ("0", "off", "false", "no")
+
+
+def read_snapshot(config_file: Path, key: FileKey) -> Optional[FullConfig]:
+    """Return the snapshot of config_file if it was taken at key."""
+    try:
+        data = json.loads(snapshot_path(config_file).read_text())
+        if data["path"] != str(config_file) or tuple(data["key"]) != key:
+            return None
+        return FullConfig.model_validate(data["config"])
+    except Exception:
+        return None
+
+
+def write_snapshot(config_file: Path, key: FileKey, config: FullConfig):
+    """Persist the validated settings of config_file, taken at key."""
+    path = snapshot_path(config_file)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "path": str(config_file),
+                    "key": list(key),
+                    # Only what the file sets, so later defaults still apply
+                    "config": config.model_dump(mode="json", exclude_unset=True),
+                }
+            )
+        )
+        tmp.replace(path)
+    except OSError as e:
+        logger.debug(f"Failed to write config snapshot: {str(e)}")
+
+
+def parse_config(config_file: Path) -> FullConfig:
+    """Parse and validate a .grkrc file."""
+    from ruamel.yaml import YAML  # Only needed when no snapshot is current
+
+    yaml = YAML()
+    with config_file.open("r") as f:
+        data = yaml.load(f) or {}
+    return FullConfig(**data)
+
+
+def load_full_config(root: str = ".") -> Optional[FullConfig]:
+    """Return the validated .grkrc in root, or None when there is none.
+
+    Raises the parse or validation error of an invalid file.
+    """
+    config_file = (Path(root) / ".grkrc").absolute()
+    key = file_key(config_file)
+    if key is None:
+        return None
+    with _cache_lock:
+        cached = _configs.get(config_file)
+    if cached is not None and cached[0] == key:
+        result = cached[1]
+    else:
+        use_snapshot = snapshots_enabled()
+        result = read_snapshot(config_file, key) if use_snapshot else None
+        if result is None:
+            try:
+                result = parse_config(config_file)
+                if use_snapshot:
+                    write_snapshot(config_file, key, result)
+            except Exception as e:
+                result = e
+        with _cache_lock:
+            _configs[config_file] = (key, result)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def load_brief_content(brief: Brief, root: str = ".") -> str:
+    """Return the text of the brief file, read once per modification.
+
+    Raises FileNotFoundError when the brief file does not exist.
+    """
+    path = (Path(root) / brief.file).absolute()
+    key = file_key(path)
+    if key is None:
+        raise FileNotFoundError(f"No such file: '{brief.file}'")
+    with _cache_lock:
+        cached = _briefs.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    content = path.read_text()
+    with _cache_lock:
+        _briefs[path] = (key, content)
+    return content
+
+
+def clear_config_cache():
+    """Forget all parsed config files and brief contents."""
+    with _cache_lock:
+        _configs.clear()
+        _briefs.clear()
+
+
 def load_config(profile: str = "default") -> ProfileConfig:
     """Load specified profile from .grkrc YAML config file and validate with Pydantic, falling back to defaults if not present."""
-    config_file = Path(".grkrc")
-    if not config_file.exists():
-        profile_data = DEFAULT_PROFILES.get(profile, {})
-        return ProfileConfig(**profile_data)
     try:
-        yaml = YAML()
-        with config_file.open("r") as f:
-            data = yaml.load(f) or {}
-        full_config = FullConfig(**data)  # Parse into FullConfig for validation
+        full_config = load_full_config()
+        if full_config is None:
+            profile_data = DEFAULT_PROFILES.get(profile, {})
+            return ProfileConfig(**profile_data)
         profile_data = full_config.profiles.get(profile)
         if profile_data:
-            return profile_data  # Return the existing ProfileConfig object
+            # A copy, since the parsed config is shared by later loads
+            return profile_data.model_copy()
         # Fallback to default if profile not found
         default_data = DEFAULT_PROFILES.get(profile, {})
         return ProfileConfig(**default_data)
@@ -75,24 +218,72 @@ def load_config(profile: str = "default") -> ProfileConfig:
         return ProfileConfig(**default_data)
 
 
-def load_brief() -> Optional[Brief]:
-    """Load the top-level brief from .grkrc, falling back to default if file not present."""
-    config_file = Path(".grkrc")
-    if not config_file.exists():
-        return Brief(**DEFAULT_BRIEF)
+def load_brief(root: str = ".") -> Optional[Brief]:
+    """Load the top-level brief from the .grkrc in root, falling back to default if file not present."""
     try:
-        yaml = YAML()
-        with config_file.open("r") as f:
-            data = yaml.load(f) or {}
-        full_config = FullConfig(**data)
+        full_config = load_full_config(root)
+        if full_config is None:
+            return Brief(**DEFAULT_BRIEF)
         return full_config.brief
     except Exception as e:
         logger.warning(f"Failed to load brief from .grkrc: {str(e)}")
         return None
 
 
+def load_cache_config(root: str = ".") -> Optional[CacheConfig]:
+    """Load the response cache settings from the .grkrc in root, returning None when caching is not enabled."""
+    try:
+        full_config = load_full_config(root)
+        if full_config is None:
+            return None
+        if full_config.cache and full_config.cache.enabled:
+            return full_config.cache
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load cache settings from .grkrc: {str(e)}")
+        return None
+
+
+def load_journal_config(root: str = ".") -> JournalConfig:
+    """Load the codebase journal settings from the .grkrc in root, falling back to defaults."""
+    try:
+        full_config = load_full_config(root)
+        if full_config is None:
+            return JournalConfig()
+        return full_config.journal or JournalConfig()
+    except Exception as e:
+        logger.warning(f"Failed to load journal settings from .grkrc: {str(e)}")
+        return JournalConfig()
+
+
+def load_session_config(root: str = ".") -> SessionConfig:
+    """Load the interactive session settings from the .grkrc in root, falling back to defaults."""
+    try:
+        full_config = load_full_config(root)
+        if full_config is None:
+            return SessionConfig()
+        return full_config.session or SessionConfig()
+    except Exception as e:
+        logger.warning(f"Failed to load session settings from .grkrc: {str(e)}")
+        return SessionConfig()
+
+
+def load_fold_config(root: str = ".") -> FoldConfig:
+    """Load the directory folding settings from the .grkrc in root, falling back to defaults."""
+    try:
+        full_config = load_full_config(root)
+        if full_config is None:
+            return FoldConfig()
+        return full_config.fold or FoldConfig()
+    except Exception as e:
+        logger.warning(f"Failed to load fold settings from .grkrc: {str(e)}")
+        return FoldConfig()
+
+
 def create_default_config():
     """Create default .grkrc file with profiles, preserving old profiles with _old suffix if different."""
+    from ruamel.yaml import YAML
+
     config_file = Path(".grkrc")
     old_profiles = {}
     old_brief = None
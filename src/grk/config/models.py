@@ -1,6 +1,6 @@
 """Pydantic models for configuration handling."""
 
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -11,6 +11,57 @@ class Brief(BaseModel):
     role: str = "assistant"
 
 
+class CacheConfig(BaseModel):
+    """Configuration for the on-disk response cache."""
+
+    enabled: bool = True
+    dir: str = ".grk_responses"
+    max_bytes: int = 100 * 1024 * 1024
+    ttl: Optional[float] = None
+
+
+class JournalConfig(BaseModel):
+    """Configuration for the session codebase cache journal."""
+
+    compress: bool = False
+    compact_every: int = 64
+
+
+class SessionConfig(BaseModel):
+    """Configuration for interactive sessions."""
+
+    delta_threshold: float = 0.5
+
+
+class FoldConfig(BaseModel):
+    """Configuration for folding a directory into a codebase in-process."""
+
+    include: List[str] = []  # Globs of files to fold; empty folds every file
+    exclude: List[str] = [".grk_cache.*json*", ".grk_cache.*journal*", ".grk_responses/"]
+    gitignore: bool = True
+    max_file_size: int = 1024 * 1024
+    workers: Optional[int] = None  # Threads reading files; None uses the pool default
+
+
+class ResilienceConfig(BaseModel):
+    """Configuration for retrying, hedging and circuit breaking API calls."""
+
+    retries: int = 2  # Retries of a transient failure; 0 fails at once
+    backoff: float = 0.5  # Delay before the first retry in seconds, doubled for each further one
+    max_backoff: float = 8.0
+    jitter: bool = True  # Draw each delay uniformly between zero and its backoff
+    retry_codes: List[str] = [
+        "UNAVAILABLE",
+        "DEADLINE_EXCEEDED",
+        "RESOURCE_EXHAUSTED",
+        "ABORTED",
+    ]
+    hedge_after: Optional[float] = None  # Seconds before a duplicate request is sent
+    hedge_percentile: Optional[float] = None  # Or this latency percentile of the model
+    breaker_threshold: int = 5  # Consecutive transient failures that open the breaker; 0 disables it
+    breaker_cooldown: float = 30.0  # Seconds an open breaker fails fast before a trial call
+
+
 class ProfileConfig(BaseModel):
     """Configuration for a single profile."""
 
@@ -19,6 +70,11 @@ class ProfileConfig(BaseModel):
     output: Optional[str] = None
     prompt_prepend: Optional[str] = None
     temperature: Optional[float] = None
+    token_budget: Optional[int] = None
+    budget_action: Optional[str] = None  # "warn" (default) or "refuse"
+    stable_prefix: Optional[bool] = None
+    context_format: Optional[Literal["json", "compact", "blocks"]] = None
+    resilience: Optional[ResilienceConfig] = None
 
 
 class FullConfig(BaseModel):
@@ -26,3 +82,7 @@ class FullConfig(BaseModel):
 
     profiles: dict[str, ProfileConfig] = {}
     brief: Optional[Brief] = None
+    cache: Optional[CacheConfig] = None
+    journal: Optional[JournalConfig] = None
+    session: Optional[SessionConfig] = None
+    fold: Optional[FoldConfig] = None
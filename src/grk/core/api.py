@@ -1,10 +1,72 @@
 """API interaction with Grok LLM."""
 
-from typing import List, Union
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from xai_sdk import Client
-from xai_sdk.chat import assistant, system, user
+from xai_sdk.chat import Response, assistant, system, user
+from ..config.models import ResilienceConfig
+from ..utils.logging import setup_logging
 from ..utils.utils import GrkException
+from .retry import Retry, hedge_delay
+
+logger = setup_logging()
+
+DEFAULT_API_HOST = "api.x.ai"
+
+# Keep pooled channels warm between calls so repeated requests skip the TLS handshake
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+_clients: Dict[Tuple[str, str, Optional[float]], Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    api_key: str, api_host: str = DEFAULT_API_HOST, timeout: Optional[float] = None
+) -> Client:
+    """Return a shared client for the given key and endpoint, creating it on first use."""
+    key = (api_key, api_host, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Client(
+                api_key=api_key,
+                api_host=api_host,
+                timeout=timeout,
+                channel_options=KEEPALIVE_OPTIONS,
+            )
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """Close and forget all pooled clients."""
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
+
+
+def usage_summary(usage) -> Dict[str, int]:
+    """Extract the token counts of a response's usage, including prompt cache hits."""
+
+    def count(field: str) -> int:
+        value = getattr(usage, field, 0)
+        return value if isinstance(value, int) else 0
+
+    return {
+        "prompt_tokens": count("prompt_tokens"),
+        "cached_prompt_tokens": count("cached_prompt_text_tokens"),
+        "completion_tokens": count("completion_tokens"),
+    }
 
 
 def call_grok(
@@ -12,19 +74,109 @@ def call_grok(
     model: str,
     api_key: str,
     temperature: float = 0,
+    on_usage: Optional[Callable[[Dict[str, int]], None]] = None,
+    resilience: Optional[ResilienceConfig] = None,
+    on_retry: Optional[Callable[[int], None]] = None,
 ) -> str:
-    """Call Grok API with a list of messages using recommended SDK pattern."""
+    """Call Grok API with a list of messages using recommended SDK pattern.
+
+    on_usage, if given, receives the token counts of the response. Transient
+    failures are retried and slow calls hedged as resilience configures;
+    on_retry, if given, receives the number of retries so far before each one.
+    """
+    retry = Retry(model, resilience, on_retry)
     try:
-        client = Client(api_key=api_key)
+        client = get_client(api_key)
         chat = client.chat.create(
             model=model,
             temperature=temperature,
         )
         for msg in messages:
             chat.append(msg)
-        response = chat.sample()
+        response = retry.call(chat.sample, hedge_delay(retry.policy, model))
         if not isinstance(response.content, str):
             raise ValueError("API response is not a string")
+        if on_usage:
+            on_usage(usage_summary(response.usage))
         return response.content
     except Exception as e:
-        raise GrkException(f"API request failed: {str(e)}")
+        raise GrkException(f"API request failed: {retry.describe(e)}")
+
+
+# Whether an SDK chat without the private stub _CallTracker wraps was reported
+_untracked_reported = False
+
+class _CallTracker:
+    """Proxy for a chat's gRPC stub that hands every streaming call to on_call."""
+
+    def __init__(self, stub, on_call: Callable[[object], None]):
+        self._stub = stub
+        self._on_call = on_call
+
+    def __getattr__(self, name):
+        return getattr(self._stub, name)
+
+    def GetCompletionChunk(self, *args, **kwargs):
+        call = self._stub.GetCompletionChunk(*args, **kwargs)
+        self._on_call(call)
+        return call
+
+
+def track_calls(chat, on_call: Callable[[object], None]):
+    """Hand the gRPC calls of chat to on_call, so they can be cancelled.
+
+    The SDK keeps the call inside its generator, so it is caught on the way out
+    of the chat's private stub. Where an SDK release has no such stub, calls are
+    not tracked and cancelling only stops reading the stream; this is logged once.
+    """
+    global _untracked_reported
+    if hasattr(chat, "_stub"):
+        chat._stub = _CallTracker(chat._stub, on_call)
+    elif not _untracked_reported:
+        _untracked_reported = True
+        logger.warning(
+            "This xai-sdk release has no chat stub to track calls on; "
+            "cancelled requests will finish generating on the server"
+        )
+
+def stream_grok(
+    messages: List[Union[system, user, assistant]],
+    model: str,
+    api_key: str,
+    temperature: float = 0,
+    on_call: Optional[Callable[[object], None]] = None,
+    resilience: Optional[ResilienceConfig] = None,
+    on_retry: Optional[Callable[[int], None]] = None,
+) -> Iterator[Tuple[Response, str]]:
+    """Stream a Grok completion, yielding the accumulating response and each new text chunk.
+
+    on_call, if given, receives the gRPC call of each attempt, whose cancel()
+    aborts the request from any thread. A transient failure is retried as
+    resilience configures, but only before the first chunk has been yielded.
+    """
+    retry = Retry(model, resilience, on_retry)
+    try:
+        client = get_client(api_key)
+        chat = client.chat.create(
+            model=model,
+            temperature=temperature,
+        )
+        for msg in messages:
+            chat.append(msg)
+        if on_call:
+            track_calls(chat, on_call)
+        while True:
+            retry.before()
+            started = False
+            try:
+                for response, chunk in chat.stream():
+                    started = True
+                    yield response, chunk.content
+            except Exception as e:
+                if not started and retry.failed(e):
+                    continue
+                raise
+            retry.succeeded()
+            return
+    except Exception as e:
+        raise GrkException(f"API request failed: {retry.describe(e)}")
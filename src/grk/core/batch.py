@@ -0,0 +1,200 @@
+"""Concurrent execution of many single-shot prompt jobs from a manifest."""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from rich.console import Console
+from ruamel.yaml import YAML
+
+from .api import call_grok
+from .cache import ResponseCache, cache_key, open_response_cache
+from .ledger import LedgerEntry, payload_bytes, percentile, record_request
+from .runner import build_messages, write_output
+from ..config.config import ProfileConfig, load_config
+from ..utils.utils import GrkException
+from ..utils.logging import setup_logging
+
+logger = setup_logging()
+
+
+class BatchJob(BaseModel):
+    """A single prompt job in a batch manifest."""
+
+    file: str
+    message: str
+    profile: str = "default"
+    output: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    """Outcome of a single batch job."""
+
+    index: int
+    job: BatchJob
+    output: str
+    latency: float = 0.0
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def load_manifest(manifest: str) -> List[BatchJob]:
+    """Load batch jobs from a JSONL, JSON or YAML manifest file."""
+    path = Path(manifest)
+    try:
+        text = path.read_text()
+    except Exception as e:
+        raise GrkException(f"Failed to read manifest: {str(e)}")
+    try:
+        if path.suffix in (".yaml", ".yml"):
+            data = YAML(typ="safe").load(text) or []
+        elif path.suffix == ".json":
+            data = json.loads(text)
+        else:
+            data = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if isinstance(data, dict):
+            data = data.get("jobs", [])
+        jobs = [BatchJob(**entry) for entry in data]
+    except Exception as e:
+        raise GrkException(f"Invalid manifest '{manifest}': {str(e)}")
+    if not jobs:
+        raise GrkException(f"Manifest '{manifest}' contains no jobs")
+    return jobs
+
+
+def resolve_outputs(jobs: List[BatchJob], configs: Dict[str, ProfileConfig]) -> List[str]:
+    """Resolve the output file per job, rejecting jobs that would overwrite each other."""
+    outputs = []
+    seen = {}
+    for idx, job in enumerate(jobs):
+        output = job.output or configs[job.profile].output or "output.json"
+        if output in seen:
+            raise GrkException(
+                f"Jobs {seen[output]} and {idx} both write to '{output}'; set a distinct output per job"
+            )
+        seen[output] = idx
+        outputs.append(output)
+    return outputs
+
+
+def run_job(
+    index: int,
+    job: BatchJob,
+    output: str,
+    config: ProfileConfig,
+    api_key: str,
+    cache: Optional[ResponseCache] = None,
+) -> BatchResult:
+    """Run one batch job, writing its output file and capturing errors instead of raising."""
+    result = BatchResult(index=index, job=job, output=output)
+    model_used = config.model or "grok-4-fast"
+    entry = LedgerEntry(mode="batch", profile=job.profile, model=model_used)
+    try:
+        try:
+            file_content = Path(job.file).read_text()
+        except Exception as e:
+            raise GrkException(f"Failed to read file: {str(e)}")
+        messages, is_cfold, input_data = build_messages(
+            file_content, job.message, config
+        )
+        entry.request_bytes = payload_bytes(messages)
+        temperature = config.temperature or 0
+        key = cache_key(messages, model_used, temperature) if cache else None
+        start_time = time.time()
+        response = cache.get(key) if cache else None
+        if response is not None:
+            result.cached = True
+            entry.outcome = "cached"
+        else:
+            try:
+                response = call_grok(
+                    messages,
+                    model_used,
+                    api_key,
+                    temperature,
+                    on_usage=entry.add_usage,
+                    resilience=config.resilience,
+                    on_retry=entry.count_retry,
+                )
+            except Exception as e:
+                entry.latency = time.time() - start_time
+                entry.outcome = "error"
+                entry.error = str(e)
+                record_request(entry)
+                raise
+            if cache:
+                cache.put(key, response)
+        result.latency = entry.latency = time.time() - start_time
+        entry.response_bytes = len(response.encode())
+        record_request(entry)
+        write_output(response, output, is_cfold, input_data, Console(quiet=True))
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+
+def run_batch(
+    manifest: str, api_key: str, concurrency: int = 4, console: Console = None
+) -> List[BatchResult]:
+    """Execute all jobs in a manifest with bounded concurrency and print a throughput report."""
+    if console is None:
+        console = Console()
+    if concurrency < 1:
+        raise GrkException("Concurrency must be at least 1")
+    jobs = load_manifest(manifest)
+    configs = {profile: load_config(profile) for profile in {j.profile for j in jobs}}
+    outputs = resolve_outputs(jobs, configs)
+    cache = open_response_cache()
+
+    console.print(
+        f"[bold green]Running batch[/bold green] of {len(jobs)} jobs "
+        f"with concurrency [cyan]{concurrency}[/cyan]"
+    )
+    start_time = time.time()
+    results: List[BatchResult] = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                run_job, idx, job, outputs[idx], configs[job.profile], api_key, cache
+            )
+            for idx, job in enumerate(jobs)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result.error:
+                console.print(
+                    f"[red]✗[/red] [{result.index}] {result.job.file}: {result.error}"
+                )
+            else:
+                console.print(
+                    f"[green]✓[/green] [{result.index}] {result.job.file} -> "
+                    f"'{result.output}' ({result.latency:.2f}s"
+                    f"{', cached' if result.cached else ''})"
+                )
+    wall_time = time.time() - start_time
+
+    results.sort(key=lambda r: r.index)
+    print_batch_report(console, results, wall_time)
+    return results
+
+
+def print_batch_report(console: Console, results: List[BatchResult], wall_time: float):
+    """Print aggregate throughput and latency figures for a finished batch."""
+    latencies = [r.latency for r in results if not r.error]
+    failed = [r for r in results if r.error]
+    throughput = len(results) / wall_time * 60 if wall_time > 0 else 0.0
+    console.print("[bold green]Batch Summary:[/bold green]")
+    cached = sum(1 for r in results if r.cached)
+    console.print(f" Jobs: {len(results)} ({len(latencies)} succeeded, {len(failed)} failed)")
+    if cached:
+        console.print(f" Cache hits: {cached}")
+    console.print(f" Wall time: {wall_time:.2f} seconds ({throughput:.1f} jobs/min)")
+    if latencies:
+        console.print(
+            f" Latency: p50 {percentile(latencies, 50):.2f}s, "
+            f"p90 {percentile(latencies, 90):.2f}s, max {max(latencies):.2f}s"
+        )
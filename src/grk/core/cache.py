@@ -0,0 +1,94 @@
+"""Content-addressed on-disk cache of Grok responses."""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from ..config.config import load_cache_config
+from ..utils.logging import setup_logging
+
+logger = setup_logging()
+
+
+def cache_key(messages: List, model: str, temperature: float) -> str:
+    """Hash the fully assembled message list together with the model parameters."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"model": model, "temperature": temperature}).encode())
+    for msg in messages:
+        data = msg.SerializeToString(deterministic=True)
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Directory of cached responses with size-bounded LRU eviction and optional TTL."""
+
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None):
+        self.dir = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss or expired entry."""
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning(f"Cache entry '{path}' is corrupted, discarding.")
+            path.unlink(missing_ok=True)
+            return None
+        if self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return entry.get("response")
+
+    def put(self, key: str, response: str):
+        """Store a response and evict least recently used entries beyond max_bytes."""
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"created": time.time(), "response": response}))
+            tmp.replace(path)
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Failed to write response cache: {str(e)}")
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for path in self.dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def open_response_cache() -> Optional[ResponseCache]:
+    """Return the configured response cache, or None when caching is disabled."""
+    config = load_cache_config()
+    if config is None:
+        return None
+    return ResponseCache(config.dir, config.max_bytes, config.ttl)
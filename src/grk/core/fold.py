@@ -0,0 +1,249 @@
+"""In-process folding of a project directory into a cfold codebase.
+
+Replaces the external `cfold fold` step: the tree is walked once, pruning
+excluded and git-ignored directories, and the remaining files are read in
+parallel on a thread pool straight into a Codebase, skipping binary files and
+files above the size cap.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ..config.config import load_cache_config, load_fold_config
+from ..config.models import CacheConfig, FoldConfig
+from ..utils.codebase import Codebase
+from .journal import CACHE_PREFIX
+
+ALWAYS_SKIPPED = {".git"}
+BINARY_SNIFF_BYTES = 8192
+
+
+def glob_regex(pattern: str) -> str:
+    """Translate a gitignore-style glob into a regex over '/'-separated paths."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            out.append(f"[{chars}]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class Rule(NamedTuple):
+    """A compiled gitignore-style pattern."""
+
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+
+
+def compile_rule(line: str, base: str = "") -> Optional[Rule]:
+    """Compile one gitignore-style line, relative to base, or None for blanks and comments."""
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to its base directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = re.escape(f"{base}/") if base else ""
+    if not anchored:
+        prefix += "(?:.*/)?"
+    return Rule(re.compile(f"^{prefix}{glob_regex(line)}$"), negate, dir_only)
+
+
+class PathMatcher:
+    """Ordered gitignore-style rules; the last rule matching a path decides."""
+
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        self.rules = list(rules or [])
+
+    @classmethod
+    def from_patterns(cls, patterns: List[str], base: str = "") -> "PathMatcher":
+        return cls([r for r in (compile_rule(p, base) for p in patterns) if r])
+
+    def extend(self, patterns: List[str], base: str = "") -> "PathMatcher":
+        """Return a matcher with patterns, relative to base, added after these rules."""
+        return PathMatcher(self.rules + PathMatcher.from_patterns(patterns, base).rules)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def match(self, path: str, is_dir: bool = False) -> bool:
+        matched = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.match(path):
+                matched = not rule.negate
+        return matched
+
+
+class FoldResult(NamedTuple):
+    """A folded codebase with the files left out and what the fold took."""
+
+    codebase: Codebase
+    skipped: List[Tuple[str, str]]  # (path, reason)
+    bytes: int
+    seconds: float
+
+    def summary(self) -> str:
+        reasons: Dict[str, int] = {}
+        for _, reason in self.skipped:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        text = (
+            f"Folded {len(self.codebase)} files ({self.bytes / 1024:.1f} KiB) "
+            f"in {self.seconds:.2f} seconds"
+        )
+        if reasons:
+            text += "; skipped " + ", ".join(
+                f"{count} {reason}" for reason, count in sorted(reasons.items())
+            )
+        return text
+
+
+def walk(
+    root: Path, include: PathMatcher, exclude: PathMatcher, gitignore: bool
+) -> List[str]:
+    """Return the '/'-separated paths of the files under root to fold, in sorted order."""
+    paths = []
+    ignores: Dict[str, PathMatcher] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root).as_posix()
+        rel_dir = "" if rel_dir == "." else rel_dir
+        ignored = ignores.get(rel_dir, exclude)
+        if gitignore and ".gitignore" in filenames:
+            try:
+                lines = (Path(dirpath) / ".gitignore").read_text().splitlines()
+                ignored = ignored.extend(lines, rel_dir)
+            except (OSError, UnicodeDecodeError):
+                pass
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        kept = []
+        for name in sorted(dirnames):
+            if name in ALWAYS_SKIPPED or ignored.match(prefix + name, is_dir=True):
+                continue
+            ignores[prefix + name] = ignored
+            kept.append(name)
+        dirnames[:] = kept  # Prune in place so os.walk does not descend
+        for name in sorted(filenames):
+            path = prefix + name
+            if ignored.match(path):
+                continue
+            if include and not include.match(path):
+                continue
+            paths.append(path)
+    return sorted(paths)
+
+
+def read_file(root: Path, path: str, max_file_size: int) -> Tuple[Optional[str], str, int]:
+    """Read a file as text.
+
+    Returns its content, or None with the reason it was skipped, and its size.
+    """
+    try:
+        with (root / path).open("rb") as f:
+            data = f.read(max_file_size + 1)
+    except OSError:
+        return None, "unreadable", 0
+    if len(data) > max_file_size:
+        return None, "too large", len(data)
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None, "binary", len(data)
+    try:
+        return data.decode("utf-8"), "", len(data)
+    except UnicodeDecodeError:
+        return None, "binary", len(data)
+
+
+def output_excludes(
+    root: str, outputs: Iterable[str] = (), project: str = "."
+) -> List[str]:
+    """Return globs that keep grk's own files out of a fold of root.
+
+    These are the output files, relative to project, the project's response
+    cache directory and its session codebase caches, wherever they lie under
+    root. They are excluded even when the fold settings replace the defaults.
+    """
+    cache = load_cache_config(project)
+    project_path = Path(project)
+    paths = [project_path / output for output in outputs]
+    paths.append(project_path / (cache.dir if cache else CacheConfig().dir))
+    paths.append(project_path / f"{CACHE_PREFIX}.*")
+    excludes = []
+    for path in paths:
+        try:
+            relative = path.parent.resolve().relative_to(Path(root).resolve()) / path.name
+        except ValueError:
+            continue
+        excludes.append(f"/{relative.as_posix()}")
+    return excludes
+
+
+def fold_directory(
+    root: str,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    config: Optional[FoldConfig] = None,
+) -> FoldResult:
+    """Fold the text files under root into a codebase.
+
+    include and exclude add to the globs of config, which defaults to the fold
+    settings in the .grkrc of the current directory.
+    """
+    start_time = time.time()
+    config = config or load_fold_config()
+    root_path = Path(root)
+    paths = walk(
+        root_path,
+        PathMatcher.from_patterns([*config.include, *(include or [])]),
+        PathMatcher.from_patterns([*config.exclude, *(exclude or [])]),
+        config.gitignore,
+    )
+    with ThreadPoolExecutor(max_workers=config.workers) as executor:
+        contents = list(
+            executor.map(
+                lambda path: read_file(root_path, path, config.max_file_size), paths
+            )
+        )
+    codebase = Codebase()
+    skipped = []
+    size = 0
+    for path, (content, reason, file_size) in zip(paths, contents):
+        if content is None:
+            skipped.append((path, reason))
+            continue
+        codebase.upsert({"path": path, "content": content})
+        size += file_size
+    return FoldResult(codebase, skipped, size, time.time() - start_time)
@@ -0,0 +1,95 @@
+"""Length-prefixed JSON framing shared by the session daemon and its clients.
+
+A frame is a 4-byte big-endian byte count followed by that many bytes of UTF-8
+JSON (or a bare string). Frames are received into a single preallocated buffer
+and sent as separate header and body buffers, so a payload is copied once on
+each side no matter how large it is.
+"""
+
+import json
+import socket
+import struct
+from typing import List, Tuple, Union
+
+HEADER = struct.Struct(">I")
+
+# Largest frame either side accepts unless a smaller size is negotiated
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+
+class FrameError(ValueError):
+    """A frame was truncated or exceeds the negotiated maximum size."""
+
+
+def encode_payload(payload: Union[str, dict]) -> bytes:
+    """Encode a payload as frame body bytes."""
+    if isinstance(payload, str):
+        return payload.encode()
+    return json.dumps(payload).encode()
+
+
+def frame_parts(
+    payload: Union[str, dict], max_frame: int = MAX_FRAME_SIZE
+) -> Tuple[bytes, bytes]:
+    """Return the header and body buffers of a frame."""
+    body = encode_payload(payload)
+    if len(body) > max_frame:
+        raise FrameError(
+            f"Frame of {len(body)} bytes exceeds the maximum of {max_frame} bytes"
+        )
+    return HEADER.pack(len(body)), body
+
+
+def encode_frame(payload: Union[str, dict], max_frame: int = MAX_FRAME_SIZE) -> bytes:
+    """Encode a payload as one contiguous length-prefixed frame."""
+    return b"".join(frame_parts(payload, max_frame))
+
+
+def decode_length(header: bytes, max_frame: int = MAX_FRAME_SIZE) -> int:
+    """Decode a frame header, rejecting frames larger than max_frame."""
+    (length,) = HEADER.unpack(header)
+    if length > max_frame:
+        raise FrameError(
+            f"Frame of {length} bytes exceeds the maximum of {max_frame} bytes"
+        )
+    return length
+
+
+def recv_full(conn: socket.socket, size: int) -> bytearray:
+    """Receive exactly size bytes from the socket into a single buffer."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = conn.recv_into(view[received:], size - received)
+        if not n:
+            raise FrameError("Incomplete data received")
+        received += n
+    return buf
+
+
+def recv_frame(conn: socket.socket, max_frame: int = MAX_FRAME_SIZE) -> bytearray:
+    """Receive one frame body."""
+    return recv_full(conn, decode_length(recv_full(conn, HEADER.size), max_frame))
+
+
+def sendmsg_all(conn: socket.socket, buffers: List[bytes]):
+    """Send all buffers, with scatter-gather writes where the platform has them."""
+    if not hasattr(conn, "sendmsg"):
+        conn.sendall(b"".join(buffers))
+        return
+    views = [memoryview(b) for b in buffers if b]
+    while views:
+        sent = conn.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def send_frame(
+    conn: socket.socket, payload: Union[str, dict], max_frame: int = MAX_FRAME_SIZE
+):
+    """Send one frame, retrying partial writes until all of it is sent."""
+    sendmsg_all(conn, list(frame_parts(payload, max_frame)))
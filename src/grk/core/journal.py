@@ -0,0 +1,183 @@
+"""Append-only change journal backing the session codebase cache.
+
+The cached codebase of a session is a snapshot (.grk_cache.json) plus a journal
+(.grk_cache.journal) of per-file upserts and deletes applied since the snapshot
+was written. Sessions other than the default one keep theirs in
+.grk_cache.<name>.json and .grk_cache.<name>.journal, so named sessions of one
+project do not overwrite each other's codebase. Sessions hand their changes to a background writer thread, which
+appends them to the journal and folds the journal into a fresh snapshot every
+compact_every entries. With compression enabled both files are gzipped; each
+append is then a separate gzip member, which gzip readers concatenate.
+"""
+
+import gzip
+import json
+import queue
+import re
+import threading
+from pathlib import Path
+from typing import IO, Iterator, List, Tuple
+
+from ..utils.codebase import Codebase, is_safe_path
+from ..utils.logging import setup_logging
+
+logger = setup_logging()
+
+CACHE_PREFIX = ".grk_cache"
+DEFAULT_SESSION = "default"
+
+_UNSAFE_NAME = re.compile(r"[^\w.-]")
+
+
+def cache_files(
+    root: str = ".", compress: bool = False, name: str = DEFAULT_SESSION
+) -> Tuple[Path, Path]:
+    """Return the snapshot and journal files of the named session's codebase cache in root."""
+    prefix = CACHE_PREFIX
+    if name != DEFAULT_SESSION:
+        prefix += "." + _UNSAFE_NAME.sub("_", name)
+    suffix = ".gz" if compress else ""
+    return Path(root) / f"{prefix}.json{suffix}", Path(root) / f"{prefix}.journal{suffix}"
+
+
+def _open(path: Path, mode: str, compress: bool) -> IO[bytes]:
+    if compress:
+        return gzip.open(path, mode)
+    return path.open(mode)
+
+
+def journal_entries(changes: List[dict]) -> Iterator[dict]:
+    """Translate cfold changes into journal entries, skipping unsafe paths."""
+    for change in changes:
+        path = change.get("path")
+        if not is_safe_path(path):
+            continue
+        if change.get("delete", False):
+            yield {"op": "delete", "path": path}
+        else:
+            yield {"op": "upsert", "file": change}
+
+
+def write_snapshot(
+    codebase: List[dict],
+    root: str = ".",
+    compress: bool = False,
+    name: str = DEFAULT_SESSION,
+):
+    """Atomically replace the snapshot with codebase and discard the journal."""
+    snapshot, journal = cache_files(root, compress, name)
+    tmp = snapshot.with_name(snapshot.name + ".tmp")
+    with _open(tmp, "wb", compress) as f:
+        f.write(json.dumps(codebase).encode())
+    tmp.replace(snapshot)
+    # Journal entries are part of the new snapshot now, as is anything cached in
+    # the other format before compression was switched
+    for path in (journal, *cache_files(root, not compress, name)):
+        path.unlink(missing_ok=True)
+
+
+def replay(codebase: List[dict], journal: Path, compress: bool = False) -> List[dict]:
+    """Apply the entries of journal to codebase, stopping at a torn final write."""
+    files = Codebase(codebase)
+    try:
+        with _open(journal, "rb", compress) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["op"] == "upsert":
+                    files.upsert(entry["file"])
+                elif entry["op"] == "delete":
+                    files.delete(entry["path"])
+    except (ValueError, KeyError, EOFError, OSError):
+        logger.warning(f"Journal '{journal}' ends in an incomplete entry, ignoring it.")
+    return files.to_files()
+
+
+def read_codebase(root: str = ".", name: str = DEFAULT_SESSION) -> List[dict]:
+    """Load the named session's cached codebase in root by replaying its journal over its snapshot."""
+    for compress in (True, False):
+        snapshot, journal = cache_files(root, compress, name)
+        if snapshot.exists() or journal.exists():
+            break
+    else:
+        return []
+    codebase = []
+    if snapshot.exists():
+        try:
+            with _open(snapshot, "rb", compress) as f:
+                codebase = json.loads(f.read())
+        except (ValueError, EOFError, OSError):
+            logger.warning("Cache file is corrupted. Starting with empty cache.")
+    if journal.exists():
+        codebase = replay(codebase, journal, compress)
+    return codebase
+
+
+class CodebaseJournal:
+    """Persists a session's codebase from a background thread, off the request path."""
+
+    def __init__(
+        self,
+        root: str = ".",
+        compress: bool = False,
+        compact_every: int = 64,
+        name: str = DEFAULT_SESSION,
+    ):
+        self.root = Path(root)
+        self.name = name
+        self.compress = compress
+        self.compact_every = compact_every
+        self.entries = 0  # Journal entries written since the last snapshot
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(
+            target=self._run, name=f"grk-journal-{self.root}-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def reset(self, codebase: List[dict]):
+        """Replace the cached codebase wholesale."""
+        self.queue.put(("snapshot", None, list(codebase)))
+
+    def record(self, changes: List[dict], codebase: List[dict]):
+        """Journal cfold changes; codebase is the state after applying them."""
+        self.queue.put(("append", changes, list(codebase)))
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        self.queue.join()
+
+    def close(self):
+        """Write out pending changes and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                kind, changes, codebase = item
+                if kind == "snapshot":
+                    self._snapshot(codebase)
+                else:
+                    self._append(changes, codebase)
+            except Exception as e:
+                logger.warning(f"Failed to save cache: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def _snapshot(self, codebase: List[dict]):
+        write_snapshot(codebase, self.root, self.compress, self.name)
+        self.entries = 0
+
+    def _append(self, changes: List[dict], codebase: List[dict]):
+        lines = [json.dumps(entry) for entry in journal_entries(changes)]
+        if not lines:
+            return
+        if self.entries + len(lines) >= self.compact_every:
+            self._snapshot(codebase)
+            return
+        _, journal = cache_files(self.root, self.compress, self.name)
+        with _open(journal, "ab", self.compress) as f:
+            f.write(("\n".join(lines) + "\n").encode())
+        self.entries += len(lines)
@@ -0,0 +1,274 @@
+"""Local SQLite ledger of every request sent to the API, and its aggregation.
+
+Each single run, batch job and session query appends one row with its profile,
+model, token counts, time to first token, latency, payload sizes, retries and
+outcome.
+The ledger lives in the per-user data directory; set GRK_LEDGER to another path,
+or to "off" to stop recording.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from ..utils.logging import setup_logging
+
+logger = setup_logging()
+
+LEDGER_ENV = "GRK_LEDGER"
+GROUPS = ("model", "profile", "day", "mode")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    mode TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    cached_prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    first_token_time REAL,
+    latency REAL NOT NULL,
+    request_bytes INTEGER NOT NULL,
+    response_bytes INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    error TEXT,
+    retries INTEGER NOT NULL DEFAULT 0
+)
+"""
+# Columns added after the first release, created on ledgers that predate them
+_MIGRATIONS = {"retries": "ALTER TABLE requests ADD COLUMN retries INTEGER NOT NULL DEFAULT 0"}
+_COLUMNS = (
+    "timestamp",
+    "mode",
+    "profile",
+    "model",
+    "prompt_tokens",
+    "cached_prompt_tokens",
+    "completion_tokens",
+    "first_token_time",
+    "latency",
+    "request_bytes",
+    "response_bytes",
+    "outcome",
+    "error",
+    "retries",
+)
+
+# Paths whose schema has been created by this process
+_ready: set = set()
+_ready_lock = threading.Lock()
+
+
+class LedgerEntry(BaseModel):
+    """One request as recorded in the ledger."""
+
+    mode: str  # single, batch or session
+    profile: str = "default"
+    model: str = ""
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    first_token_time: Optional[float] = None
+    latency: float = 0.0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    outcome: str = "ok"  # ok, cached or error; raced legs also invalid or cancelled
+    error: Optional[str] = None
+    retries: int = 0  # Transient failures retried before the outcome
+    timestamp: float = Field(default_factory=time.time)
+
+    def add_usage(self, usage: Dict[str, int]):
+        """Copy the token counts of a usage summary."""
+        self.prompt_tokens = usage.get("prompt_tokens", 0)
+        self.cached_prompt_tokens = usage.get("cached_prompt_tokens", 0)
+        self.completion_tokens = usage.get("completion_tokens", 0)
+
+    def count_retry(self, retries: int):
+        """Note the number of retries made so far."""
+        self.retries = retries
+
+
+class LedgerStats(BaseModel):
+    """Aggregate figures of the ledger rows sharing a group key."""
+
+    key: str
+    requests: int = 0
+    errors: int = 0
+    cached: int = 0
+    retries: int = 0
+    latency_p50: float = 0.0
+    latency_p90: float = 0.0
+    latency_p99: float = 0.0
+    ttft_p50: Optional[float] = None
+    ttft_p90: Optional[float] = None
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values using nearest-rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def ledger_path() -> Optional[Path]:
+    """Return the ledger database file, or None when recording is switched off."""
+    override = os.environ.get(LEDGER_ENV)
+    if override is not None:
+        if override.lower() in ("", "0", "off", "false", "no"):
+            return None
+        return Path(override).expanduser()
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "grk" / "ledger.db"
+
+
+def payload_bytes(messages) -> int:
+    """Return the encoded size of a list of SDK messages."""
+    return sum(msg.ByteSize() for msg in messages)
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10)
+    with _ready_lock:
+        if path not in _ready:
+            # WAL lets batch workers, the session daemon and stats readers share the file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(requests)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in existing:
+                    conn.execute(statement)
+            conn.commit()
+            _ready.add(path)
+    return conn
+
+
+def record_request(entry: LedgerEntry, path: Optional[Path] = None):
+    """Append an entry to the ledger; failures are logged, never raised."""
+    path = path or ledger_path()
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        values = entry.model_dump()
+        with closing(_connect(path)) as conn, conn:
+            conn.execute(
+                f"INSERT INTO requests ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                [values[column] for column in _COLUMNS],
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Failed to record request in ledger: {str(e)}")
+
+
+def load_entries(
+    days: Optional[float] = None,
+    limit: Optional[int] = None,
+    path: Optional[Path] = None,
+) -> List[LedgerEntry]:
+    """Return ledger entries, newest first, optionally only those of the last days."""
+    path = path or ledger_path()
+    if path is None or not path.exists():
+        return []
+    query = f"SELECT {', '.join(_COLUMNS)} FROM requests"
+    params: list = []
+    if days is not None:
+        query += " WHERE timestamp >= ?"
+        params.append(time.time() - days * 86400)
+    query += " ORDER BY timestamp DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [LedgerEntry(**dict(zip(_COLUMNS, row))) for row in rows]
+
+
+def latency_percentile(
+    model: str,
+    pct: float,
+    min_samples: int = 20,
+    window: int = 200,
+    path: Optional[Path] = None,
+) -> Optional[float]:
+    """Return the pct-th percentile latency of the model's recent answered requests.
+
+    None is returned while fewer than min_samples answers are recorded.
+    """
+    path = path or ledger_path()
+    if path is None or not path.exists():
+        return None
+    try:
+        with closing(_connect(path)) as conn:
+            rows = conn.execute(
+                "SELECT latency FROM requests WHERE model = ? AND outcome = 'ok' "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (model, window),
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to read latencies from ledger: {str(e)}")
+        return None
+    if len(rows) < min_samples:
+        return None
+    return percentile([row[0] for row in rows], pct)
+
+
+def group_key(entry: LedgerEntry, by: str) -> str:
+    """Return the value of entry that rows are grouped by."""
+    if by == "day":
+        return time.strftime("%Y-%m-%d", time.localtime(entry.timestamp))
+    return getattr(entry, by)
+
+
+def aggregate(entries: List[LedgerEntry], by: str = "model") -> List[LedgerStats]:
+    """Aggregate entries per model, profile, day or mode.
+
+    Latency and time-to-first-token percentiles cover answered requests only, so
+    errors and response cache hits do not skew them.
+    """
+    if by not in GROUPS:
+        raise ValueError(f"Cannot group by '{by}', expected one of {', '.join(GROUPS)}")
+    groups: Dict[str, List[LedgerEntry]] = {}
+    for entry in entries:
+        groups.setdefault(group_key(entry, by), []).append(entry)
+    stats = []
+    for key in sorted(groups):
+        rows = groups[key]
+        answered = [e for e in rows if e.outcome == "ok"]
+        latencies = [e.latency for e in answered]
+        ttfts = [e.first_token_time for e in answered if e.first_token_time is not None]
+        stats.append(
+            LedgerStats(
+                key=key,
+                requests=len(rows),
+                errors=sum(1 for e in rows if e.outcome == "error"),
+                cached=sum(1 for e in rows if e.outcome == "cached"),
+                retries=sum(e.retries for e in rows),
+                latency_p50=percentile(latencies, 50),
+                latency_p90=percentile(latencies, 90),
+                latency_p99=percentile(latencies, 99),
+                ttft_p50=percentile(ttfts, 50) if ttfts else None,
+                ttft_p90=percentile(ttfts, 90) if ttfts else None,
+                prompt_tokens=sum(e.prompt_tokens for e in rows),
+                cached_prompt_tokens=sum(e.cached_prompt_tokens for e in rows),
+                completion_tokens=sum(e.completion_tokens for e in rows),
+                request_bytes=sum(e.request_bytes for e in rows),
+                response_bytes=sum(e.response_bytes for e in rows),
+            )
+        )
+    return stats
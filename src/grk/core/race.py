@@ -0,0 +1,213 @@
+"""Racing one prompt across several profiles, keeping the first usable answer.
+
+Every leg streams the same assembled messages to its own model on a daemon
+thread. The first answer that passes validation wins and the gRPC calls of the
+other legs are cancelled right away, so they stop generating and are never
+waited for.
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+from ..config.models import ResilienceConfig
+from .api import stream_grok, usage_summary
+from .ledger import LedgerEntry, record_request
+from ..utils.codebase import postprocess_response
+
+# Seconds a race may take before the legs still running are cancelled
+RACE_TIMEOUT = 600.0
+
+
+class RaceLeg(NamedTuple):
+    """A profile taking part in a race, with the model, temperature and resilience it runs."""
+
+    profile: str
+    model: str
+    temperature: float = 0
+    resilience: Optional[ResilienceConfig] = None
+
+    @classmethod
+    def from_dict(cls, leg: dict) -> "RaceLeg":
+        """Build a leg from its JSON form, as the CLI resolves and sends it."""
+        resilience = leg.get("resilience")
+        return cls(
+            leg["profile"],
+            leg["model"],
+            leg.get("temperature", 0),
+            ResilienceConfig(**resilience) if resilience is not None else None,
+        )
+
+
+class RaceTiming(BaseModel):
+    """How one leg of a race ended and how long it took."""
+
+    profile: str
+    model: str
+    outcome: str  # won, invalid, error or cancelled
+    latency: float = 0.0
+    first_token_time: Optional[float] = None
+    usage: Dict[str, int] = {}
+    response_bytes: int = 0
+    error: Optional[str] = None
+
+
+class RaceResult(NamedTuple):
+    """The winning answer of a race, if any, and the timings of all its legs."""
+
+    response: Optional[str]
+    winner: Optional[RaceTiming]
+    timings: List[RaceTiming]
+
+    def summary(self) -> str:
+        parts = []
+        for t in self.timings:
+            text = f"{t.profile} ({t.model}) {t.outcome} after {t.latency:.2f}s"
+            if t.error:
+                text += f": {t.error}"
+            parts.append(text)
+        return "; ".join(parts)
+
+
+def usable_answer(response: str, is_cfold: bool) -> bool:
+    """Return whether a response can be accepted: cfold files for cfold input, else any text."""
+    if not is_cfold:
+        return bool(response.strip())
+    cleaned, _ = postprocess_response(response)
+    if not cleaned:
+        return False
+    files = json.loads(cleaned).get("files")
+    return isinstance(files, list) and all(
+        isinstance(f, dict) and "path" in f for f in files
+    )
+
+
+def race_profiles(
+    messages: list,
+    legs: List[RaceLeg],
+    api_key: str,
+    accept: Callable[[str], bool],
+    timeout: float = RACE_TIMEOUT,
+) -> RaceResult:
+    """Send messages to every leg concurrently and return the first accepted answer.
+
+    Once a leg wins, or timeout seconds pass, the requests of the other legs are
+    cancelled. The result has no winner when no leg produced an accepted answer.
+    """
+    start_time = time.time()
+    cancel = threading.Event()
+    done: "queue.Queue[int]" = queue.Queue()
+    lock = threading.Lock()
+    timings = [
+        RaceTiming(profile=leg.profile, model=leg.model, outcome="running") for leg in legs
+    ]
+    calls: Dict[int, object] = {}
+    responses: Dict[int, str] = {}
+    winner: List[int] = []
+
+    def track(index: int, call):
+        with lock:
+            calls[index] = call
+            stopped = cancel.is_set()
+        if stopped:
+            call.cancel()
+
+    def run(index: int, leg: RaceLeg):
+        timing = timings[index]
+        chunks = []
+        last = None
+        try:
+            stream = stream_grok(
+                messages,
+                leg.model,
+                api_key,
+                leg.temperature,
+                on_call=lambda call: track(index, call),
+                resilience=leg.resilience,
+            )
+            for last, text in stream:
+                if cancel.is_set():
+                    break
+                if text:
+                    if timing.first_token_time is None:
+                        timing.first_token_time = time.time() - start_time
+                    chunks.append(text)
+            response = "".join(chunks)
+            with lock:
+                timing.latency = time.time() - start_time
+                timing.response_bytes = len(response.encode())
+                if last is not None:
+                    timing.usage = usage_summary(last.usage)
+                if cancel.is_set():
+                    timing.outcome = "cancelled"
+                elif not accept(response):
+                    timing.outcome = "invalid"
+                else:
+                    timing.outcome = "won"
+                    winner.append(index)
+                    responses[index] = response
+                    cancel.set()
+        except Exception as e:
+            with lock:
+                timing.latency = time.time() - start_time
+                if cancel.is_set():
+                    timing.outcome = "cancelled"  # Aborted by the winner or the timeout
+                else:
+                    timing.outcome = "error"
+                    timing.error = str(e)
+        finally:
+            done.put(index)
+
+    for index, leg in enumerate(legs):
+        threading.Thread(target=run, args=(index, leg), daemon=True).start()
+
+    pending = len(legs)
+    deadline = start_time + timeout
+    while pending and not cancel.is_set():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            done.get(timeout=remaining)
+        except queue.Empty:
+            break
+        pending -= 1
+    with lock:
+        cancel.set()
+        stop_time = time.time()
+        for index, timing in enumerate(timings):
+            if timing.outcome != "running":
+                continue
+            # Abort the request now instead of waiting for its next chunk
+            if index in calls:
+                calls[index].cancel()
+            timing.outcome = "cancelled"
+            timing.latency = stop_time - start_time
+            if not winner:
+                timing.error = f"timed out after {timeout:g} seconds"
+        timings = [t.model_copy() for t in timings]
+    if not winner:
+        return RaceResult(None, None, timings)
+    return RaceResult(responses[winner[0]], timings[winner[0]], timings)
+
+
+def record_race(result: RaceResult, mode: str, request_bytes: int):
+    """Record every leg of a race in the usage ledger."""
+    for timing in result.timings:
+        entry = LedgerEntry(
+            mode=mode,
+            profile=timing.profile,
+            model=timing.model,
+            first_token_time=timing.first_token_time,
+            latency=timing.latency,
+            request_bytes=request_bytes,
+            response_bytes=timing.response_bytes,
+            outcome="ok" if timing.outcome == "won" else timing.outcome,
+            error=timing.error,
+        )
+        entry.add_usage(timing.usage)
+        record_request(entry)
@@ -0,0 +1,223 @@
+"""Retries with backoff, hedged requests and circuit breaking around API calls.
+
+A failed call is retried only when its gRPC status code is listed as transient
+in the profile's resilience settings, after an exponentially growing delay with
+full jitter. A call slower than the hedge threshold gets a duplicate request and
+the first answer wins. Consecutive transient failures of a model open its
+circuit breaker, which fails calls at once until its cooldown has passed and
+then lets a single trial call through.
+"""
+
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from ..config.models import ResilienceConfig
+from ..utils.logging import setup_logging
+from ..utils.utils import GrkException
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+# Transport errors that mean the endpoint could not be reached
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+
+def status_name(error: BaseException) -> Optional[str]:
+    """Return the name of the gRPC status code of error, if it carries one."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return None
+    return getattr(code, "name", None)
+
+
+def is_retryable(error: BaseException, policy: ResilienceConfig) -> bool:
+    """Return whether error is a transient failure worth retrying under policy."""
+    name = status_name(error)
+    if name is not None:
+        return name in policy.retry_codes
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def backoff_delay(
+    retry: int, policy: ResilienceConfig, rand: Callable[[], float] = random.random
+) -> float:
+    """Return the delay before the retry-th retry (counting from 1)."""
+    delay = min(policy.max_backoff, policy.backoff * 2 ** (retry - 1))
+    return delay * rand() if policy.jitter else delay
+
+
+class CircuitBreaker:
+    """Consecutive failure counter that fails calls fast while it is open."""
+
+    def __init__(self, threshold: int, cooldown: float, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def check(self, name: str):
+        """Raise if the breaker is open; after the cooldown, admit one trial call."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - self.clock()
+            if remaining <= 0 and not self.trial:
+                self.trial = True
+                return
+        raise GrkException(
+            f"Circuit open for {name} after {self.failures} consecutive failures, "
+            f"failing fast for {max(remaining, 0):.0f} more seconds"
+        )
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.threshold and self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name: str, policy: ResilienceConfig) -> CircuitBreaker:
+    """Return the process-wide breaker of name, with the thresholds of policy."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                policy.breaker_threshold, policy.breaker_cooldown
+            )
+        breaker.threshold = policy.breaker_threshold
+        breaker.cooldown = policy.breaker_cooldown
+        return breaker
+
+
+def reset_breakers():
+    """Forget the state of every circuit breaker."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def hedge_delay(policy: ResilienceConfig, model: str) -> Optional[float]:
+    """Return the seconds after which a call to model is hedged, or None to never hedge."""
+    if policy.hedge_after is not None:
+        return policy.hedge_after
+    if policy.hedge_percentile is None:
+        return None
+    from .ledger import latency_percentile
+
+    return latency_percentile(model, policy.hedge_percentile)
+
+
+class Retry:
+    """Retry bookkeeping of one request: breaker checks, failure triage and backoff."""
+
+    def __init__(
+        self,
+        name: str,
+        policy: Optional[ResilienceConfig] = None,
+        on_retry: Optional[Callable[[int], None]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.policy = policy or ResilienceConfig()
+        self.breaker = breaker_for(name, self.policy)
+        self.on_retry = on_retry
+        self.sleep = sleep
+        self.retries = 0
+
+    def before(self):
+        """Fail fast if the breaker is open."""
+        self.breaker.check(self.name)
+
+    def succeeded(self):
+        self.breaker.success()
+
+    def failed(self, error: BaseException) -> bool:
+        """Record a failed attempt and wait before retrying it.
+
+        Returns False when error is not transient or the retries are used up.
+        """
+        if not is_retryable(error, self.policy):
+            self.breaker.success()  # The endpoint answered, just not usefully
+            return False
+        self.breaker.failure()
+        if self.retries >= self.policy.retries:
+            return False
+        self.retries += 1
+        delay = backoff_delay(self.retries, self.policy)
+        logger.warning(
+            f"{self.name}: retry {self.retries} of {self.policy.retries} "
+            f"in {delay:.2f} seconds after: {str(error)}"
+        )
+        if self.on_retry:
+            self.on_retry(self.retries)
+        self.sleep(delay)
+        return True
+
+    def describe(self, error: BaseException) -> str:
+        """Return error with the number of retries that preceded it."""
+        if self.retries:
+            return f"{str(error)} (after {self.retries} retries)"
+        return str(error)
+
+    def call(self, fn: Callable[[], T], hedge_after: Optional[float] = None) -> T:
+        """Call fn until it succeeds or fails for good, hedging slow attempts."""
+        while True:
+            self.before()
+            try:
+                result = hedged(fn, hedge_after, self.name)
+            except Exception as e:
+                if self.failed(e):
+                    continue
+                raise
+            self.succeeded()
+            return result
+
+
+def hedged(fn: Callable[[], T], delay: Optional[float], name: str = "request") -> T:
+    """Call fn, sending a duplicate call if it has not returned after delay seconds.
+
+    The first successful call wins and the other is left to finish in the
+    background; an error is raised only once every call has failed.
+    """
+    if delay is None:
+        return fn()
+    results: "queue.Queue" = queue.Queue()
+
+    def run():
+        try:
+            results.put((True, fn()))
+        except Exception as e:
+            results.put((False, e))
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        ok, value = results.get(timeout=delay)
+    except queue.Empty:
+        logger.info(f"{name}: no answer after {delay:.2f} seconds, sending a hedged request")
+        threading.Thread(target=run, daemon=True).start()
+        ok, value = results.get()
+        if not ok:
+            ok, value = results.get()
+    if not ok:
+        raise value
+    return value
@@ -1,46 +1,56 @@
 """Core logic for running Grok LLM interactions."""
 
 import json
-from typing import List, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from pathlib import Path
-from .api import call_grok
+from .api import call_grok, stream_grok, usage_summary
+from .cache import cache_key, open_response_cache
+from .fold import fold_directory, output_excludes
+from .ledger import LedgerEntry, payload_bytes, record_request
+from .race import RaceLeg, race_profiles, record_race, usable_answer
+from .unfold import apply_changes
 import time
 from rich.console import Console
 from concurrent.futures import ThreadPoolExecutor
 from rich.live import Live
 from rich.spinner import Spinner
-from ..config.config import ProfileConfig, load_brief
+from ..config.config import ProfileConfig, load_brief, load_brief_content
+from ..config.models import ResilienceConfig
 from ..utils.utils import (
     analyze_changes,
     filter_protected_files,
     build_instructions_from_messages,
     print_instruction_tree,
+    enforce_token_budget,
+    print_apply_report,
+    print_encoding_report,
+    print_race_report,
+    print_retries,
+    print_usage,
     GrkException,
 )
+from ..utils.codebase import (
+    Codebase,
+    codebase_message,
+    parse_file_blocks,
+    postprocess_response,
+)
+from ..utils.tokens import encoding_tokens, file_tokens
 from ..utils.logging import setup_logging
 from xai_sdk.chat import assistant, system, user
 
 logger = setup_logging()
 
 
-def run_grok(
-    file: str,
-    message: str,
-    config: ProfileConfig,
-    api_key: str,
-    profile: str = "default",
-):
-    """Execute the Grok LLM run logic with given inputs and config."""
-    model_used = config.model or "grok-4-fast"
+def build_messages(
+    file_content: Union[str, dict], message: str, config: ProfileConfig
+) -> Tuple[List[Union[system, user, assistant]], bool, Optional[dict]]:
+    """Assemble the message list for a prompt, returning it with the cfold flag and parsed input.
+
+    file_content is the text of the input file, or already parsed cfold data.
+    """
     role_from_config = config.role or "you are an expert engineer and developer"
-    output_file = config.output or "output.json"
     prompt_prepend = config.prompt_prepend or ""
-    temperature = config.temperature or 0
-
-    try:
-        file_content = Path(file).read_text()
-    except Exception as e:
-        raise GrkException(f"Failed to read file: {str(e)}")
 
     messages: List[Union[system, user, assistant]] = []
     full_prompt = prompt_prepend + message
@@ -51,7 +61,7 @@ def run_grok(
     brief = load_brief()
     if brief:
         try:
-            brief_content = Path(brief.file).read_text()
+            brief_content = load_brief_content(brief)
             brief_role = brief.role.lower()
             if brief_role == "system":
                 messages.append(system(brief_content))
@@ -67,7 +77,9 @@ def run_grok(
             raise GrkException(f"Failed to load brief: {str(e)}")
 
     try:
-        input_data = json.loads(file_content)
+        input_data = (
+            json.loads(file_content) if isinstance(file_content, str) else file_content
+        )
         if isinstance(input_data, list):
             input_data = {"instructions": [], "files": input_data}
         elif isinstance(input_data, dict):
@@ -81,6 +93,7 @@ def run_grok(
         )
 
         if is_cfold:
+            instructions = []
             for instr in input_data["instructions"]:
                 role = instr["type"]
                 content = instr["content"]
@@ -94,27 +107,80 @@ def run_grok(
                     raise ValueError(f"Unknown message type: {role}")
                 if role == "user" and instr.get("name"):
                     msg.name = instr["name"]
-                messages.append(msg)
-            files_json = json.dumps(input_data["files"], indent=2)
-            messages.append(
-                user(f"Current codebase files:\n```json\n{files_json}\n```")
+                instructions.append(msg)
+            codebase = user(
+                codebase_message(
+                    input_data["files"], config.context_format, config.stable_prefix
+                )
             )
+            if config.stable_prefix:
+                # Most to least stable content, so repeated runs share the longest prefix
+                messages += [codebase, *instructions]
+            else:
+                messages += [*instructions, codebase]
             messages.append(user(full_prompt))
         else:
             messages.append(user(file_content))
             messages.append(user(full_prompt))
-        is_cfold = False
-        input_data = None
+            is_cfold = False
+            input_data = None
     except json.JSONDecodeError:
         messages.append(user(file_content))
         messages.append(user(full_prompt))
         is_cfold = False
         input_data = None
 
+    return messages, is_cfold, input_data
+
+
+def run_grok(
+    file: str,
+    message: str,
+    config: ProfileConfig,
+    api_key: str,
+    profile: str = "default",
+    stream: bool = False,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    apply: bool = False,
+    race: Optional[List[RaceLeg]] = None,
+):
+    """Execute the Grok LLM run logic with given inputs and config.
+
+    When file is a directory it is folded in-process, with the include and
+    exclude globs added to the fold settings. With apply, the files of a cfold
+    answer are written to the folded directory, or the current one. With race,
+    the prompt goes to every leg at once and the first usable answer is kept.
+    """
+    if race and stream:
+        raise GrkException("Racing profiles cannot be combined with streaming")
+    model_used = config.model or "grok-4-fast"
+    role_from_config = config.role or "you are an expert engineer and developer"
+    output_file = config.output or "output.json"
+    temperature = config.temperature or 0
+
     console = Console()
+    root = file if Path(file).is_dir() else "."
+    if Path(file).is_dir():
+        # Never fold the output of a previous run back in
+        excluded = [*(exclude or []), *output_excludes(file, [output_file])]
+        fold = fold_directory(file, include, excluded)
+        file_content = {"instructions": [], "files": fold.codebase.to_files()}
+        console.print(f"[bold green]{fold.summary()}[/bold green]")
+    else:
+        try:
+            file_content = Path(file).read_text()
+        except Exception as e:
+            raise GrkException(f"Failed to read file: {str(e)}")
+
+    messages, is_cfold, input_data = build_messages(file_content, message, config)
+
     console.print("[bold green]Running grk[/bold green] with the following settings:")
     console.print(f" Profile: [cyan]{profile}[/cyan]")
     console.print(f" Model: [yellow]{model_used}[/yellow]")
+    if race:
+        legs = ", ".join(f"{leg.profile} ({leg.model})" for leg in race)
+        console.print(f" Race: [yellow]{legs}[/yellow]")
     console.print(f" Role: [cyan]{role_from_config}[/cyan]")
     console.print(f" File: [cyan]{file}[/cyan]")
     console.print(f" Temperature: [red]{temperature}[/red]")
@@ -122,39 +188,288 @@ def run_grok(
 
     # Print instruction summary
     instruction_list = build_instructions_from_messages(messages)
-    print_instruction_tree(console, instruction_list)
+    codebase = Codebase.from_json(input_data) if is_cfold else None
+    files = file_tokens(codebase) if is_cfold else None
+    print_instruction_tree(console, instruction_list, files=files)
+    if is_cfold:
+        print_encoding_report(console, encoding_tokens(codebase), config.context_format)
+    total_tokens = sum(instr["tokens"] for instr in instruction_list)
+    warning = enforce_token_budget(
+        total_tokens, config.token_budget, config.budget_action
+    )
+    if warning:
+        console.print(f"[yellow]Warning: {warning}[/yellow]")
+
+    entry = LedgerEntry(
+        mode="single",
+        profile=profile,
+        model=model_used,
+        request_bytes=payload_bytes(messages),
+    )
+    cache = open_response_cache()
+    # A race is answered by any of its legs, so it is cached under all of them
+    cache_model = (
+        "race:" + ",".join(f"{leg.model}@{leg.temperature:g}" for leg in race)
+        if race
+        else model_used
+    )
+    key = cache_key(messages, cache_model, temperature) if cache else None
+    response = cache.get(key) if cache else None
+    if response is not None:
+        console.print(f"[bold green]Cache hit:[/bold green] {key[:12]}, skipping API call")
+        entry.outcome = "cached"
+        entry.response_bytes = len(response.encode())
+        record_request(entry)
+        if race:
+            response = race_answer(response, is_cfold, console)
+        files = write_output(response, output_file, is_cfold, input_data, console)
+        if apply:
+            apply_output(files, root, console)
+        return
+
+    if race:
+        response = run_race(messages, race, api_key, is_cfold, console)
+        if cache:
+            cache.put(key, response)
+        response = race_answer(response, is_cfold, console)
+        files = write_output(response, output_file, is_cfold, input_data, console)
+        if apply:
+            apply_output(files, root, console)
+        return
 
     console.print("[bold green]Calling Grok API...[/bold green]")
     start_time = time.time()
 
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(
-            call_grok,
+    usage = {}
+    try:
+        response = request_response(
             messages,
             model_used,
             api_key,
             temperature,
+            output_file,
+            console,
+            stream,
+            usage,
+            config.resilience,
+            entry.count_retry,
         )
+    except Exception as e:
+        entry.latency = time.time() - start_time
+        entry.outcome = "error"
+        entry.error = str(e)
+        record_request(entry)
+        raise
+
+    end_time = time.time()
+    wait_time = end_time - start_time
+    logger.info(f"API call completed in {wait_time:.2f} seconds.")
+    print_retries(console, entry.retries)
+    if not stream:
+        print_usage(console, usage)
+    entry.latency = wait_time
+    entry.first_token_time = usage.pop("first_token_time", None)
+    entry.add_usage(usage)
+    entry.response_bytes = len(response.encode())
+    record_request(entry)
+
+    if cache:
+        cache.put(key, response)
+    files = write_output(response, output_file, is_cfold, input_data, console)
+    if apply:
+        apply_output(files, root, console)
+
+
+def apply_output(files: Optional[List[dict]], root: str, console: Console):
+    """Write the changed files of a cfold answer under root and report what was touched."""
+    if files is None:
+        console.print("[yellow]Warning: Response has no cfold files, nothing to apply.[/yellow]")
+        return
+    brief = load_brief()
+    result = apply_changes(files, root, {brief.file} if brief else None)
+    print_apply_report(console, result.to_json())
+
+
+def run_race(
+    messages: List[Union[system, user, assistant]],
+    legs: List[RaceLeg],
+    api_key: str,
+    is_cfold: bool,
+    console: Console,
+) -> str:
+    """Race the legs behind a spinner, report and record them, and return the winning answer."""
+    console.print("[bold green]Racing Grok API...[/bold green]")
+    result = wait_with_spinner(
+        console,
+        f"Racing {', '.join(leg.model for leg in legs)}...",
+        race_profiles,
+        messages,
+        legs,
+        api_key,
+        lambda response: usable_answer(response, is_cfold),
+    )
+    record_race(result, "single", payload_bytes(messages))
+    print_race_report(console, [t.model_dump() for t in result.timings])
+    if result.winner is None:
+        raise GrkException(f"No raced profile returned a usable answer: {result.summary()}")
+    print_usage(console, result.winner.usage)
+    return result.response
+
+
+def race_answer(response: str, is_cfold: bool, console: Console) -> str:
+    """Return the cfold JSON of a raced cfold answer, printing the message around it."""
+    if not is_cfold:
+        return response
+    cleaned, message = postprocess_response(response)
+    if message:
+        console.print(f"[bold green]Message from Grok:[/bold green] {message}")
+    return cleaned
+
+
+def wait_with_spinner(console: Console, text: str, fn, *args, **kwargs):
+    """Run fn on a worker thread, showing a spinner with text on terminals, and return its result."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fn, *args, **kwargs)
         if console.is_terminal:
-            spinner = Spinner(
-                "dots",
-                f"[bold yellow] Waiting for {model_used} response...[/bold yellow]",
-            )
+            spinner = Spinner("dots", f"[bold yellow] {text}[/bold yellow]")
             with Live(spinner, console=console, refresh_per_second=15, transient=True):
                 while not future.done():
                     time.sleep(0.1)
         else:
             while not future.done():
                 time.sleep(0.1)
-        response = future.result()
+        return future.result()
+
 
+def request_response(
+    messages: List[Union[system, user, assistant]],
+    model: str,
+    api_key: str,
+    temperature: float,
+    output_file: str,
+    console: Console,
+    stream: bool,
+    usage: dict,
+    resilience: Optional[ResilienceConfig] = None,
+    on_retry: Optional[Callable[[int], None]] = None,
+) -> str:
+    """Call the API, streaming or behind a spinner, collecting token usage into usage."""
+    if stream:
+        response = stream_to_output(
+            messages,
+            model,
+            api_key,
+            temperature,
+            output_file,
+            console,
+            usage,
+            resilience,
+            on_retry,
+        )
+    else:
+        response = wait_with_spinner(
+            console,
+            f"Waiting for {model} response...",
+            call_grok,
+            messages,
+            model,
+            api_key,
+            temperature,
+            on_usage=usage.update,
+            resilience=resilience,
+            on_retry=on_retry,
+        )
+    return response
+
+
+def stream_to_output(
+    messages: List[Union[system, user, assistant]],
+    model: str,
+    api_key: str,
+    temperature: float,
+    output_file: str,
+    console: Console,
+    usage: Optional[Dict[str, float]] = None,
+    resilience: Optional[ResilienceConfig] = None,
+    on_retry: Optional[Callable[[int], None]] = None,
+) -> str:
+    """Stream a response to the console and output file, reporting time-to-first-token and throughput.
+
+    When given, usage is updated with the token counts and time to first token.
+    """
+    start_time = time.time()
+    first_token_time = None
+    chunks: List[str] = []
+    last_response = None
+    try:
+        out = Path(output_file).open("w")
+    except Exception as e:
+        raise GrkException(f"Failed to write output: {str(e)}")
+    with out:
+        for last_response, text in stream_grok(
+            messages,
+            model,
+            api_key,
+            temperature,
+            resilience=resilience,
+            on_retry=on_retry,
+        ):
+            if not text:
+                continue
+            if first_token_time is None:
+                first_token_time = time.time()
+            chunks.append(text)
+            out.write(text)
+            out.flush()
+            console.print(text, end="", markup=False, highlight=False, soft_wrap=True)
     end_time = time.time()
-    wait_time = end_time - start_time
-    logger.info(f"API call completed in {wait_time:.2f} seconds.")
+    console.print()
+
+    response = "".join(chunks)
+    completion_tokens = 0
+    if last_response is not None:
+        completion_tokens = getattr(last_response.usage, "completion_tokens", 0) or 0
+    if not completion_tokens:
+        completion_tokens = len(chunks)  # Fall back to one token per chunk
+    if first_token_time is not None:
+        ttft = first_token_time - start_time
+        generation_time = end_time - first_token_time
+        rate = completion_tokens / generation_time if generation_time > 0 else 0.0
+        console.print(
+            f"[bold green]Time to first token:[/bold green] {ttft:.2f} seconds"
+        )
+        console.print(
+            f"[bold green]Throughput:[/bold green] {completion_tokens} tokens "
+            f"in {generation_time:.2f} seconds ({rate:.1f} tokens/sec)"
+        )
+    else:
+        console.print("[yellow]Warning: Stream finished without any content.[/yellow]")
+    if last_response is not None:
+        summary = usage_summary(last_response.usage)
+        print_usage(console, summary)
+        if usage is not None:
+            usage.update(summary)
+    if usage is not None and first_token_time is not None:
+        usage["first_token_time"] = first_token_time - start_time
+    return response
+
+
+def write_output(
+    response: str,
+    output_file: str,
+    is_cfold: bool,
+    input_data: Optional[dict],
+    console: Console,
+) -> Optional[List[dict]]:
+    """Write the response to output_file, applying cfold postprocessing when applicable.
 
+    Returns the files of a cfold answer, or None when the response has none.
+    """
+    files = None
     try:
         # Always write the response, format if valid JSON for cfold
         if is_cfold:
+            codebase = Codebase.from_json(input_data or {})
             response_to_parse = response.strip()
             if response_to_parse.startswith("```json") and response_to_parse.endswith(
                 "```"
@@ -162,7 +477,14 @@ def run_grok(
                 inner = response_to_parse[7:-3].strip()
                 response_to_parse = inner
             try:
-                output_data = json.loads(response_to_parse)
+                try:
+                    output_data = json.loads(response_to_parse)
+                except json.JSONDecodeError:
+                    # Answers in the file block format map onto cfold files as well
+                    blocks, _ = parse_file_blocks(response)
+                    if not blocks:
+                        raise
+                    output_data = {"files": blocks}
                 if isinstance(output_data, list):
                     output_data = {"files": output_data}
                 # Filter protected files
@@ -173,17 +495,20 @@ def run_grok(
                     )
                 with Path(output_file).open("w") as f:
                     json.dump(output_data, f, indent=2)
+                if isinstance(output_data, dict):
+                    files = output_data.get("files")
                 # Analyze filtered output
-                analyze_changes(input_data, json.dumps(output_data), console)
+                analyze_changes(codebase, json.dumps(output_data), console)
             except json.JSONDecodeError:
                 console.print(
                     "[yellow]Warning: Response is not valid JSON, writing as text.[/yellow]"
                 )
                 Path(output_file).write_text(response)
                 if input_data:
-                    analyze_changes(input_data, response, console)
+                    analyze_changes(codebase, response, console)
         else:
             Path(output_file).write_text(response)
         console.print(f"[bold green]Output written to:[/bold green] '{output_file}'")
     except Exception as e:
         raise GrkException(f"Failed to write output: {str(e)}")
+    return files
@@ -0,0 +1,158 @@
+"""Where the session daemon lives: its runtime files, transport and session ids.
+
+Kept to the standard library so the session client commands can find and
+reach the daemon without importing the SDK or the configuration models.
+"""
+
+import getpass
+import json
+import os
+import select
+import socket
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+# Inherited pipe a starting daemon reports on once it listens, or fails
+READY_FD_ENV = "GRK_READY_FD"
+
+
+def runtime_dir() -> Path:
+    """Return the per-user directory holding the daemon's PID, port and log files."""
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        path = Path(base) / "grk"
+    else:
+        user_id = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+        path = Path(tempfile.gettempdir()) / f"grk-{user_id}"
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
+
+
+class DaemonFiles(NamedTuple):
+    """Locations of the session daemon's PID, socket, port and log files."""
+
+    pid: Path
+    sock: Path
+    port: Path
+    log: Path
+
+
+def daemon_files() -> DaemonFiles:
+    """Return the files of the per-user session daemon."""
+    run_dir = runtime_dir()
+    return DaemonFiles(
+        run_dir / "daemon.pid",
+        run_dir / "daemon.sock",
+        run_dir / "daemon.port",
+        run_dir / "daemon.log",
+    )
+
+
+@contextmanager
+def daemon_lock() -> Iterator[None]:
+    """Hold the per-user lock under which a daemon is looked for and started.
+
+    Concurrent `grk session up` commands would otherwise both find no daemon
+    and start one each. Where flock is unavailable the lock is a no-op.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        yield
+        return
+    with open(runtime_dir() / "daemon.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def release_daemon_files(files: DaemonFiles, pid: int):
+    """Remove the PID, socket and port files if they belong to the daemon pid.
+
+    A daemon started in its place has overwritten the PID file, and its files
+    are left alone.
+    """
+    try:
+        owner = files.pid.read_text().strip()
+    except OSError:
+        owner = None
+    if owner is not None and owner != str(pid):
+        return
+    for path in (files.sock, files.port, files.pid):
+        path.unlink(missing_ok=True)
+
+
+def use_unix_socket() -> bool:
+    """Return whether the session protocol should run over a Unix domain socket.
+
+    Unix sockets are the default where available; set GRK_TRANSPORT=tcp to use
+    loopback TCP instead.
+    """
+    if not hasattr(socket, "AF_UNIX") or sys.platform.startswith("win"):
+        return False
+    return os.environ.get("GRK_TRANSPORT", "unix").lower() != "tcp"
+
+
+def session_id(name: str, project: str) -> str:
+    """Return the id under which the daemon hosts session name of project."""
+    return f"{name}@{Path(project).resolve()}"
+
+
+class ReadyChannel:
+    """Write end of the pipe on which a starting daemon reports readiness or failure.
+
+    Only the first message is sent; the pipe is closed after it, so the
+    launcher also sees end of file if the daemon dies without reporting.
+    """
+
+    def __init__(self, fd: Optional[int] = None):
+        self.fd = fd
+
+    @classmethod
+    def from_env(cls) -> "ReadyChannel":
+        """Return the channel inherited from the launcher, if any."""
+        fd = os.environ.pop(READY_FD_ENV, None)
+        return cls(int(fd) if fd else None)
+
+    def send(self, **message):
+        if self.fd is None:
+            return
+        fd, self.fd = self.fd, None
+        try:
+            os.write(fd, json.dumps(message).encode() + b"\n")
+        except OSError:
+            pass  # The launcher gave up waiting
+        finally:
+            os.close(fd)
+
+
+def wait_ready(fd: int, timeout: float) -> Optional[dict]:
+    """Wait for the message of a ReadyChannel on the read end fd of its pipe.
+
+    Returns None if the pipe is closed without a message and raises
+    TimeoutError if nothing arrives within timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    data = b""
+    while b"\n" not in data:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No readiness message within {timeout} seconds")
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            continue
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    line = data.split(b"\n", 1)[0].strip()
+    try:
+        return json.loads(line) if line else None
+    except ValueError:
+        return None
@@ -1,344 +1,782 @@
 """Core logic for managing daemon sessions and caching."""
 
+import asyncio
 import json
-import re
-from typing import List, Union, Tuple
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Union, Tuple
 from pathlib import Path
-import socket
+import threading
 import time
 from ..config.config import ProfileConfig
-from ..config.config import load_brief
+from ..config.config import (
+    load_brief,
+    load_brief_content,
+    load_fold_config,
+    load_journal_config,
+    load_session_config,
+)
 from ..utils.utils import (
     get_change_summary,
     filter_protected_files,
     build_instructions_from_messages,
+    enforce_token_budget,
     GrkException,
 )
+from ..utils.codebase import Codebase, codebase_message, postprocess_response
 from ..utils.logging import setup_logging
+from ..utils.tokens import encoding_tokens, file_tokens
+from .api import close_clients, get_client, usage_summary
+from .fold import fold_directory, output_excludes
+from .journal import CodebaseJournal
+from .ledger import LedgerEntry, payload_bytes, record_request
+from .race import RaceLeg, race_profiles, record_race, usable_answer
+from .retry import Retry, hedge_delay
+from .unfold import apply_changes
+from .runtime import (
+    DaemonFiles,
+    ReadyChannel,
+    daemon_files,
+    release_daemon_files,
+    use_unix_socket,
+)
+from .framing import (
+    HEADER,
+    MAX_FRAME_SIZE,
+    FrameError,
+    decode_length,
+    frame_parts,
+)
 from xai_sdk.chat import assistant, system, user
-from xai_sdk import Client
 import traceback
 
 logger = setup_logging()
 
 
-def recv_full(conn: socket.socket, size: int) -> bytes:
-    """Receive exactly size bytes from the socket."""
-    data = b""
-    while len(data) < size:
-        chunk = conn.recv(min(4096, size - len(data)))
-        if not chunk:
-            raise ValueError("Incomplete data received")
-        data += chunk
-    return data
-
-
-def daemon_process(initial_file: str, config: ProfileConfig, api_key: str):
-    """Run the background daemon process for session management."""
-    port_file = Path(".grk_session.port")
-    server = None
-    try:
-        # Load initial codebase from file
-        initial_data = json.loads(Path(initial_file).read_text())
-        cached_codebase = initial_data.get("files", [])
-        save_cached_codebase(cached_codebase)
-
-        client = Client(api_key=api_key)
-
-        role_from_config = config.role or "you are an expert engineer and developer"
-        model_used = config.model or "grok-4-fast"
-        temperature = config.temperature or 0
-        prompt_prepend = config.prompt_prepend or ""
-
-        messages: List[Union[system, user, assistant]] = []
-        chat = None
-
-        def init_chat(instructions, codebase):
-            nonlocal chat, messages
-            chat = client.chat.create(model=model_used, temperature=temperature)
-            messages.clear()
-
-            if role_from_config:
-                msg = system(role_from_config)
-                messages.append(msg)
-                chat.append(msg)
-
-            # Add brief if configured
-            brief = load_brief()
-            if brief:
-                try:
-                    brief_content = Path(brief.file).read_text()
-                    brief_role = brief.role.lower()
-                    if brief_role == "system":
-                        msg = system(brief_content)
-                    elif brief_role == "user":
-                        msg = user(brief_content)
-                    elif brief_role == "assistant":
-                        msg = assistant(brief_content)
-                    else:
-                        raise ValueError(f"Invalid role for brief: {brief_role}")
-                    messages.append(msg)
-                    chat.append(msg)
-                except FileNotFoundError:
-                    logger.warning(f"Brief file '{brief.file}' not found, skipping.")
-                except Exception as e:
-                    raise GrkException(f"Failed to load brief: {str(e)}")
-
-            # Add instructions
-            for instr in instructions:
-                role = instr["type"]
-                content = instr["content"]
-                if role == "system":
-                    msg = system(content)
-                elif role == "user":
-                    msg = user(content)
-                elif role == "assistant":
-                    msg = assistant(content)
-                else:
-                    raise ValueError(f"Unknown message type: {role}")
-                if role == "user" and instr.get("name"):
-                    msg.name = instr["name"]
-                messages.append(msg)
-                chat.append(msg)
-
-            files_json = json.dumps(codebase, indent=2)
-            msg = user(f"Current codebase files:\n```json\n{files_json}\n```")
-            messages.append(msg)
-            chat.append(msg)
-
-        # Initial setup
-        initial_instructions = initial_data.get("instructions", [])
-        init_chat(initial_instructions, cached_codebase)
-
-        # Set up server with dynamic port
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind(("127.0.0.1", 0))
-        port = server.getsockname()[1]
-        port_file.write_text(str(port))
-        server.listen(1)
-
-        while True:
-            conn, addr = server.accept()
+SERVER_BACKLOG = 128
+DEFAULT_OUTPUT = "__temp.json"
+
+
+class Session:
+    """A stateful chat session: the SDK chat, its message log and the cached codebase."""
+
+    def __init__(
+        self,
+        config: ProfileConfig,
+        api_key: str,
+        initial_data: dict,
+        project: str = ".",
+        name: str = "default",
+        profile: str = "default",
+        initial_file: str = "unknown",
+        root: Optional[str] = None,
+    ):
+        self.api_key = api_key
+        self.client = get_client(api_key)
+        self.project = Path(project)
+        # Where codebase paths are relative to: the folded directory, or the project
+        self.root = Path(root) if root else self.project
+        self.name = name
+        self.profile = profile
+        self.initial_file = initial_file
+        self.role = config.role or "you are an expert engineer and developer"
+        self.model = config.model or "grok-4-fast"
+        self.temperature = config.temperature or 0
+        self.prompt_prepend = config.prompt_prepend or ""
+        self.token_budget = config.token_budget
+        self.budget_action = config.budget_action
+        self.stable_prefix = bool(config.stable_prefix)
+        self.context_format = config.context_format or "json"
+        self.resilience = config.resilience
+        self.messages: List[Union[system, user, assistant]] = []
+        self.chat = None
+        self.codebase = Codebase.from_json(initial_data)
+        # Held while the codebase changes, so listings read a consistent snapshot
+        self.codebase_lock = threading.Lock()
+        # Answers written under the project, never folded back in by a renewal
+        self.outputs = {DEFAULT_OUTPUT}
+        journal_config = load_journal_config(self.project)
+        self.journal = CodebaseJournal(
+            self.project, journal_config.compress, journal_config.compact_every, name
+        )
+        self.journal.reset(self.codebase.to_files())
+        try:
+            self.init_chat(initial_data.get("instructions", []), self.codebase)
+        except Exception:
+            self.journal.close()
+            raise
+
+    def _append(self, msg):
+        self.messages.append(msg)
+        self.chat.append(msg)
+
+    def init_chat(self, instructions: List[dict], codebase: Codebase):
+        """Start a fresh chat from role, brief, instructions and codebase."""
+        self.chat = self.client.chat.create(
+            model=self.model, temperature=self.temperature
+        )
+        self.messages = []
+        self.instructions = instructions
+
+        if self.role:
+            self._append(system(self.role))
+
+        # Add brief if configured
+        brief = load_brief(self.project)
+        if brief:
             try:
-                # Receive length prefix (4 bytes)
-                length_bytes = recv_full(conn, 4)
-                length = int.from_bytes(length_bytes, "big")
-                # Receive the exact data
-                data_bytes = recv_full(conn, length)
-                data = data_bytes.decode("utf-8")
-                if not data:
-                    conn.close()
-                    continue
-                request = json.loads(data)
-                cmd = request.get("cmd")
-                if cmd == "down":
-                    send_response(conn, "Shutting down")
-                    conn.close()
-                    break
-                elif cmd == "list":
-                    files = [f["path"] for f in cached_codebase]
-                    instructions = build_instructions_from_messages(messages)
-                    response_data = {"files": files, "instructions": instructions}
-                    send_response(conn, response_data)
-                    conn.close()
-                elif cmd == "new":
-                    new_file = request["file"]
-                    new_data = json.loads(Path(new_file).read_text())
-                    new_instructions = new_data.get("instructions", [])
-                    cached_codebase = new_data.get("files", [])
-                    save_cached_codebase(cached_codebase)
-                    init_chat(new_instructions, cached_codebase)
-                    send_response(
-                        conn, {"message": "Instruction stack and files renewed."}
-                    )
-                    conn.close()
-                elif cmd == "query":
-                    prompt = request["prompt"]
-                    output = request.get("output", "__temp.json")
-                    input_content = request.get("input_content")
-                    if input_content:
-                        msg = user(f"Additional input:\n```txt\n{input_content}\n```")
-                        messages.append(msg)
-                        chat.append(msg)
-                    full_prompt = prompt_prepend + prompt
-                    msg = user(full_prompt)
-                    messages.append(msg)
-                    chat.append(msg)
-                    start_time = time.time()
-                    response = chat.sample()
-                    end_time = time.time()
-                    thinking_time = end_time - start_time
-                    chat.append(response)
-                    messages.append(assistant(response.content))
-
-                    # Postprocess response
-                    cleaned_response, extracted_message = postprocess_response(
-                        response.content
-                    )
-
-                    # Prepare for analysis (use cleaned_response for summary and caching)
-                    input_for_analysis = {"files": [dict(**f) for f in cached_codebase]}
-
-                    # Write output
-                    try:
-                        output_data = json.loads(cleaned_response)
-                        if isinstance(output_data, list):
-                            output_data = {"files": output_data}
-                        # Filter protected files
-                        brief = load_brief()
-                        if brief and "files" in output_data:
-                            output_data["files"] = filter_protected_files(
-                                output_data["files"], {brief.file}
-                            )
-                        with Path(output).open("w") as f:
-                            json.dump(output_data, f, indent=2)
-                        # Get summary from filtered output
-                        summary = get_change_summary(
-                            input_for_analysis, json.dumps(output_data)
-                        )
-                        if "files" in output_data:
-                            cached_codebase = apply_cfold_changes(
-                                cached_codebase, output_data["files"]
-                            )
-                            save_cached_codebase(cached_codebase)
-                    except json.JSONDecodeError:
-                        Path(output).write_text(
-                            response.content
-                        )  # Fallback to raw if still invalid
-                        summary = (
-                            "No valid JSON detected; raw response saved. "
-                            + get_change_summary(input_for_analysis, cleaned_response)
-                        )
-
-                    # Send summary, message, and thinking time
-                    send_response(
-                        conn,
-                        {
-                            "summary": summary,
-                            "message": extracted_message,
-                            "thinking_time": thinking_time,
-                        },
-                    )
-                    conn.close()
+                brief_content = load_brief_content(brief, self.project)
+                brief_role = brief.role.lower()
+                if brief_role == "system":
+                    msg = system(brief_content)
+                elif brief_role == "user":
+                    msg = user(brief_content)
+                elif brief_role == "assistant":
+                    msg = assistant(brief_content)
                 else:
-                    send_response(conn, {"error": "Unknown command"})
-                    conn.close()
+                    raise ValueError(f"Invalid role for brief: {brief_role}")
+                self._append(msg)
+            except FileNotFoundError:
+                logger.warning(f"Brief file '{brief.file}' not found, skipping.")
             except Exception as e:
-                logger.error(f"Error handling connection: {str(e)}")
-                traceback.print_exc()
-                try:
-                    send_response(conn, {"error": str(e)})
-                except Exception:
-                    pass
-                conn.close()
-    except Exception as e:
-        logger.error(f"Daemon error: {str(e)}")
-        traceback.print_exc()
-    finally:
-        if server:
-            server.close()
-        pid_file = Path(".grk_session.pid")
-        if pid_file.exists():
-            pid_file.unlink()
-        if port_file.exists():
-            port_file.unlink()
-
-
-def send_response(conn: socket.socket, resp: Union[str, dict]):
-    """Send response with length prefix."""
-    if isinstance(resp, str):
-        resp_json = resp
-    else:
-        resp_json = json.dumps(resp)
-    length = len(resp_json)
-    length_bytes = length.to_bytes(4, "big")
-    conn.send(length_bytes + resp_json.encode())
-
-
-def postprocess_response(response: str) -> Tuple[str, str]:
-    """Postprocess the response to extract/clean JSON and any message."""
-    original_response = response.strip()
-    extracted_message = ""
-
-    # Check for markdown code block
-    if original_response.startswith("```json") and original_response.endswith("```"):
-        response = original_response[7:-3].strip()
-    elif "```json" in original_response:
-        # Extract the block if embedded
-        match = re.search(r"```json\s*(.*?)\s*```", original_response, re.DOTALL)
-        if match:
-            extracted_message = original_response.replace(match.group(0), "").strip()
-            response = match.group(1).strip()
+                raise GrkException(f"Failed to load brief: {str(e)}")
+
+        # Add instructions
+        instruction_messages = []
+        for instr in instructions:
+            role = instr["type"]
+            content = instr["content"]
+            if role == "system":
+                msg = system(content)
+            elif role == "user":
+                msg = user(content)
+            elif role == "assistant":
+                msg = assistant(content)
+            else:
+                raise ValueError(f"Unknown message type: {role}")
+            if role == "user" and instr.get("name"):
+                msg.name = instr["name"]
+            instruction_messages.append(msg)
+
+        files = codebase.to_files()
+        codebase_msg = user(
+            codebase_message(files, self.context_format, self.stable_prefix)
+        )
+        if self.stable_prefix:
+            # Most to least stable content, so turns share the longest cached prefix
+            ordered = [codebase_msg, *instruction_messages]
         else:
-            response = original_response
-    else:
-        response = original_response
+            ordered = [*instruction_messages, codebase_msg]
+        for msg in ordered:
+            self._append(msg)
+
+    def snapshot(self) -> Codebase:
+        """Return a copy of the codebase that later changes leave alone."""
+        with self.codebase_lock:
+            return self.codebase.copy()
+
+    def list(self) -> dict:
+        """Return the file paths and instruction synopses of the session.
+
+        Token estimates hash and count every uncached file, so call this off the
+        event loop.
+        """
+        codebase = self.snapshot()
+        instructions = build_instructions_from_messages(list(self.messages))
+        return {
+            "files": codebase.paths(),
+            "instructions": instructions,
+            "profile": self.profile,
+            "model": self.model,
+            "initial_file": self.initial_file,
+            "file_tokens": file_tokens(codebase)[:10],
+            "context_format": self.context_format,
+            "encoding_tokens": encoding_tokens(codebase),
+        }
+
+    def status(self) -> dict:
+        """Return a short description of the session."""
+        return {
+            "name": self.name,
+            "project": str(self.project),
+            "profile": self.profile,
+            "model": self.model,
+            "files": len(self.codebase),
+            "messages": len(self.messages),
+        }
+
+    def close(self):
+        """Write out the cached codebase and stop its journal writer."""
+        self.journal.close()
+
+    def renew(
+        self,
+        file: str,
+        full: bool = False,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+    ) -> dict:
+        """Bring the session up to date with the instructions and codebase in file.
+
+        When the instructions are unchanged and the changed files stay within the
+        configured fraction of the codebase, only those changes are appended to the
+        chat; otherwise the chat is restarted from file. A directory is folded with
+        the include and exclude globs.
+        """
+        new_data, fold_summary = read_input(
+            self.project / file, include, exclude, self.project, self.outputs
+        )
+        if fold_summary:
+            self.root = self.project / file
+            return {**self._renew(new_data, full), "fold": fold_summary}
+        return self._renew(new_data, full)
+
+    def _renew(self, new_data: dict, full: bool) -> dict:
+        new_codebase = Codebase.from_json(new_data)
+        instructions = new_data.get("instructions", [])
+        if not full and instructions == self.instructions:
+            changes = self.codebase_delta(new_codebase)
+            if not changes:
+                return {"message": "Codebase unchanged; nothing to renew.", "mode": "delta"}
+            delta_bytes = sum(
+                new_codebase.info(f["path"]).size for f in changes if "content" in f
+            )
+            total_bytes = sum(new_codebase.info(path).size for path in new_codebase.paths())
+            threshold = load_session_config(self.project).delta_threshold
+            if delta_bytes <= threshold * total_bytes:
+                self._append(
+                    user(
+                        codebase_message(
+                            changes,
+                            self.context_format,
+                            self.stable_prefix,
+                            heading="Codebase files changed since the last turn "
+                            "(files not listed are unchanged)",
+                        )
+                    )
+                )
+                with self.codebase_lock:
+                    self.codebase.apply(changes)
+                self.journal.record(changes, self.codebase.to_files())
+                deleted = sum(1 for f in changes if f.get("delete", False))
+                return {
+                    "message": f"Sent changes to {len(changes) - deleted} files "
+                    f"and {deleted} deletions.",
+                    "mode": "delta",
+                }
+        with self.codebase_lock:
+            self.codebase = new_codebase
+        self.journal.reset(self.codebase.to_files())
+        self.init_chat(instructions, self.codebase)
+        return {"message": "Instruction stack and files renewed.", "mode": "full"}
+
+    def codebase_delta(self, new_codebase: Codebase) -> List[dict]:
+        """Return the cfold changes turning the session's codebase into new_codebase."""
+        changed, new, _ = self.codebase.classify(new_codebase.to_files())
+        changes = [new_codebase.get(path) for path in changed + new]
+        changes += [
+            {"path": path, "delete": True}
+            for path in self.codebase.paths()
+            if path not in new_codebase
+        ]
+        return changes
+
+    def query(self, request: dict, emit: Callable[[dict], None]) -> dict:
+        """Send a prompt to the chat, write the output file and summarize the changes.
+
+        When the request asks for streaming, each chunk is passed to emit as it arrives.
+        When it names race legs, the conversation is sent to all of them at once and
+        the first usable cfold answer continues the chat.
+        """
+        race = [RaceLeg.from_dict(leg) for leg in request.get("race") or []]
+        if race and request.get("stream"):
+            raise GrkException("Racing profiles cannot be combined with streaming")
+        prompt = request["prompt"]
+        self.outputs.add(request.get("output", DEFAULT_OUTPUT))
+        output = self.project / request.get("output", DEFAULT_OUTPUT)
+        input_content = request.get("input_content")
+        new_messages = []
+        if input_content:
+            new_messages.append(
+                user(f"Additional input:\n```txt\n{input_content}\n```")
+            )
+        new_messages.append(user(self.prompt_prepend + prompt))
+        # Checked before anything is appended so a refused prompt leaves the chat intact
+        total_tokens = sum(
+            instr["tokens"]
+            for instr in build_instructions_from_messages(self.messages + new_messages)
+        )
+        warning = enforce_token_budget(
+            total_tokens, self.token_budget, self.budget_action
+        )
+        for msg in new_messages:
+            self._append(msg)
+        entry = LedgerEntry(
+            mode="session",
+            profile=self.profile,
+            model=self.model,
+            request_bytes=payload_bytes(self.messages),
+        )
+        timings = None
+        if race:
+            result = race_profiles(
+                self.messages,
+                race,
+                self.api_key,
+                lambda response: usable_answer(response, True),
+            )
+            record_race(result, "session", entry.request_bytes)
+            if result.winner is None:
+                raise GrkException(
+                    f"No raced profile returned a usable answer: {result.summary()}"
+                )
+            content = result.response
+            thinking_time = result.winner.latency
+            first_token_time = result.winner.first_token_time
+            usage = result.winner.usage
+            timings = [t.model_dump() for t in result.timings]
+            self.chat.append(assistant(content))
+        else:
+            content, thinking_time, first_token_time, usage = self.sample(
+                request, emit, entry
+            )
+        self.messages.append(assistant(content))
 
-    # Try to parse as JSON
-    try:
-        json_data = json.loads(response)
-        if isinstance(json_data, list):
-            return json.dumps({"files": json_data}), extracted_message
-        elif isinstance(json_data, dict) and "files" in json_data:
-            return json.dumps(json_data), extracted_message
+        # Postprocess response
+        cleaned_response, extracted_message = postprocess_response(content)
+
+        # Prepare for analysis (use cleaned_response for summary and caching)
+
+        # Write output
+        applied = None
+        try:
+            output_data = json.loads(cleaned_response)
+            if isinstance(output_data, list):
+                output_data = {"files": output_data}
+            # Filter protected files
+            brief = load_brief(self.project)
+            if brief and "files" in output_data:
+                output_data["files"] = filter_protected_files(
+                    output_data["files"], {brief.file}
+                )
+            with output.open("w") as f:
+                json.dump(output_data, f, indent=2)
+            # Get summary from filtered output
+            summary = get_change_summary(self.codebase, json.dumps(output_data))
+            if "files" in output_data:
+                with self.codebase_lock:
+                    self.codebase.apply(output_data["files"])
+                self.journal.record(output_data["files"], self.codebase.to_files())
+                if request.get("apply"):
+                    applied = apply_changes(
+                        output_data["files"], self.root, {brief.file} if brief else None
+                    ).to_json()
+        except json.JSONDecodeError:
+            output.write_text(content)  # Fallback to raw if still invalid
+            summary = "No valid JSON detected; raw response saved. " + get_change_summary(
+                self.codebase, cleaned_response
+            )
+
+        # Send summary, message, and thinking time
+        final = {
+            "summary": summary,
+            "message": extracted_message,
+            "thinking_time": thinking_time,
+        }
+        if applied is not None:
+            final["applied"] = applied
+        if timings is not None:
+            final["race"] = timings
+        if first_token_time is not None:
+            final["first_token_time"] = first_token_time
+        if entry.retries:
+            final["retries"] = entry.retries
+        if warning:
+            final["warning"] = warning
+        final["usage"] = usage
+        return final
+
+    def sample(
+        self, request: dict, emit: Callable[[dict], None], entry: LedgerEntry
+    ) -> Tuple[str, float, Optional[float], Dict[str, int]]:
+        """Sample the chat's answer, streaming it to emit if requested, and record it.
+
+        Transient failures are retried as the profile's resilience settings say,
+        a stream only until its first chunk has been emitted.
+        Returns the answer, its latency, time to first token and token usage.
+        """
+        start_time = time.time()
+        first_token_time = None
+        retry = Retry(self.model, self.resilience, entry.count_retry)
+        try:
+            if request.get("stream"):
+                while True:
+                    retry.before()
+                    response = None
+                    try:
+                        for response, chunk in self.chat.stream():
+                            if not chunk.content:
+                                continue
+                            if first_token_time is None:
+                                first_token_time = time.time() - start_time
+                            emit({"chunk": chunk.content})
+                    except Exception as e:
+                        if first_token_time is None and retry.failed(e):
+                            continue
+                        raise
+                    retry.succeeded()
+                    break
+                if response is None:
+                    raise GrkException("Stream returned no response")
+            else:
+                response = retry.call(
+                    self.chat.sample, hedge_delay(retry.policy, self.model)
+                )
+        except Exception as e:
+            entry.latency = time.time() - start_time
+            entry.outcome = "error"
+            entry.error = retry.describe(e)
+            record_request(entry)
+            raise
+        thinking_time = time.time() - start_time
+        usage = usage_summary(response.usage)
+        entry.latency = thinking_time
+        entry.first_token_time = first_token_time
+        entry.add_usage(usage)
+        entry.response_bytes = len(response.content.encode())
+        record_request(entry)
+        self.chat.append(response)
+        return response.content, thinking_time, first_token_time, usage
+
+
+async def read_frame(
+    reader: asyncio.StreamReader, max_frame: int = MAX_FRAME_SIZE
+) -> Optional[dict]:
+    """Read one length-prefixed JSON request, returning None if the client sent nothing."""
+    length = decode_length(await reader.readexactly(HEADER.size), max_frame)
+    data = await reader.readexactly(length)
+    if not data:
+        return None
+    return json.loads(data)
+
+
+class Peer:
+    """A client connection of the daemon and the frame size negotiated with it."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.max_frame = MAX_FRAME_SIZE
+        self.drain_lock = asyncio.Lock()
+
+    def write(self, frame: Union[str, dict]):
+        """Queue a frame as separate header and body buffers."""
+        self.writer.writelines(frame_parts(frame, self.max_frame))
+
+    async def drain(self):
+        async with self.drain_lock:
+            await self.writer.drain()
+
+
+async def serve(
+    files: DaemonFiles, on_ready: Optional[Callable[[dict], None]] = None
+):
+    """Serve commands for all hosted sessions until the last session is taken down.
+
+    Queries and renewals run in worker threads, one at a time per session, so that
+    sessions proceed independently and control commands (sessions, list, status,
+    down) are answered while models are generating.
+
+    Clients may keep a connection open and send many requests over it. Requests
+    carrying an "id" are answered with frames {"id", "type", "data"}, where type is
+    "chunk" or "backlog" for intermediate frames and "result" for the final one;
+    requests without an id get the bare result frame. A "hello" request carrying
+    the client's "max_frame" lowers the largest frame accepted and sent on its
+    connection; the reply holds the negotiated size.
+
+    on_ready is called with the listening address once connections are accepted.
+
+    A "warm" request keeps the daemon, with the SDK imported and the client for
+    its API key created, running for "idle" seconds after its last session is
+    taken down, so the next `session up` skips the cold start.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    sessions: Dict[str, Session] = {}
+    locks: Dict[str, asyncio.Lock] = {}
+    # Sessions taken down while busy, closed once their running request finishes
+    closing: Dict[str, asyncio.Task] = {}
+    peers = set()
+    warm_idle = 0.0
+    idle_timer: Optional[asyncio.TimerHandle] = None
+
+    def keep_alive():
+        nonlocal idle_timer
+        if idle_timer is not None:
+            idle_timer.cancel()
+            idle_timer = None
+
+    def release():
+        """Exit, or stay warm for a while, once no session is hosted."""
+        nonlocal idle_timer
+        keep_alive()
+        if sessions or locks or closing:
+            return
+        if warm_idle > 0:
+            idle_timer = loop.call_later(warm_idle, stop.set)
         else:
-            # Not a recognized format; treat as message
-            return "", original_response
-    except json.JSONDecodeError:
-        # Fallback: find the largest valid JSON substring (e.g., embedded object)
-        match = re.search(r"(\{.*\}|\[.*\])", original_response, re.DOTALL)
-        if match:
+            stop.set()
+
+    def start_session(request: dict) -> Tuple[Session, Optional[str]]:
+        project = request.get("project", ".")
+        path = Path(project) / request["file"]
+        initial_data, fold_summary = read_input(
+            path, request.get("include"), request.get("exclude"), project
+        )
+        session = Session(
+            ProfileConfig(**request.get("config", {})),
+            request.get("api_key") or os.environ.get("XAI_API_KEY"),
+            initial_data,
+            project=request.get("project", "."),
+            name=request.get("name", "default"),
+            profile=request.get("profile", "default"),
+            initial_file=request["file"],
+            root=str(path) if fold_summary else None,
+        )
+        return session, fold_summary
+
+    async def close_when_idle(sid: str, session: Session, busy: asyncio.Lock):
+        try:
+            async with busy:
+                await loop.run_in_executor(None, session.close)
+        finally:
+            closing.pop(sid, None)
+            release()
+
+    async def dispatch(
+        request: dict, emit: Callable[[str, object], None], peer: Peer
+    ):
+        nonlocal warm_idle
+        cmd = request.get("cmd")
+        sid = request.get("session")
+        if cmd == "hello":
+            return {"max_frame": peer.max_frame}
+        if cmd == "shutdown":
+            stop.set()
+            return "Shutting down"
+        if cmd == "warm":
+            warm_idle = max(0.0, float(request.get("idle", 0)))
+            api_key = request.get("api_key")
+            if api_key:
+                await loop.run_in_executor(None, get_client, api_key)
+            release()
+            return {"message": "Daemon warm.", "idle": warm_idle}
+        if cmd == "sessions":
+            return {
+                "sessions": [
+                    {"id": key, **session.status(), "busy": locks[key].locked()}
+                    for key, session in sessions.items()
+                ],
+                "warm_idle": warm_idle,
+            }
+        if cmd == "up":
+            if sid in closing:
+                # Let the previous session write out its cache before it is read again
+                await asyncio.shield(closing[sid])
+            if sid in locks:
+                return {"error": f"Session '{sid}' is already running"}
+            locks[sid] = asyncio.Lock()
+            keep_alive()
             try:
-                json_data = json.loads(match.group(1))
-                extracted_message = original_response.replace(
-                    match.group(1), ""
-                ).strip()
-                if isinstance(json_data, list):
-                    return json.dumps({"files": json_data}), extracted_message
-                elif isinstance(json_data, dict) and "files" in json_data:
-                    return json.dumps(json_data), extracted_message
-            except json.JSONDecodeError:
-                pass
-        # If no valid JSON, whole response is message
-        return "", original_response
-
-
-def load_cached_codebase() -> List[dict]:
-    """Load the cached codebase from a local file."""
-    cache_file = Path(".grk_cache.json")
-    if cache_file.exists():
+                async with locks[sid]:
+                    sessions[sid], fold_summary = await loop.run_in_executor(
+                        None, start_session, request
+                    )
+            except Exception:
+                locks.pop(sid, None)
+                release()
+                raise
+            reply = {"message": f"Session '{sid}' started."}
+            if fold_summary:
+                reply["fold"] = fold_summary
+            return reply
+        session = sessions.get(sid)
+        if session is None:
+            return {"error": f"No session '{sid}'"}
+        busy = locks[sid]
+        if cmd == "down":
+            # Answered at once; a running query or renewal still finishes, replies
+            # and journals its changes before the session is closed
+            sessions.pop(sid)
+            locks.pop(sid)
+            closing[sid] = asyncio.create_task(close_when_idle(sid, session, busy))
+            return "Shutting down"
+        if cmd == "list":
+            listing = await loop.run_in_executor(None, session.list)
+            return {**listing, "busy": busy.locked()}
+        if cmd == "status":
+            return {**session.status(), "busy": busy.locked()}
+        if cmd == "new":
+            async with busy:
+                if sessions.get(sid) is not session:
+                    return {"error": f"Session '{sid}' was taken down"}
+                return await loop.run_in_executor(
+                    None,
+                    session.renew,
+                    request["file"],
+                    request.get("full", False),
+                    request.get("include"),
+                    request.get("exclude"),
+                )
+        if cmd == "query":
+            async with busy:
+                if sessions.get(sid) is not session:
+                    return {"error": f"Session '{sid}' was taken down"}
+                if request.get("backlog"):
+                    # The instruction backlog the prompt is submitted on top of
+                    emit("backlog", await loop.run_in_executor(None, session.list))
+                return await loop.run_in_executor(
+                    None,
+                    session.query,
+                    request,
+                    lambda frame: loop.call_soon_threadsafe(
+                        emit, "chunk", frame["chunk"]
+                    ),
+                )
+        return {"error": "Unknown command"}
+
+    async def respond(request: dict, peer: Peer):
+        """Run one request and write its frames, tagged with its id if it has one."""
+        rid = request.get("id")
+
+        def frame_of(kind: str, data):
+            if rid is not None:
+                return {"id": rid, "type": kind, "data": data}
+            return data if kind == "result" else {kind: data}
+
+        def emit(kind: str, data):
+            peer.write(frame_of(kind, data))
+
         try:
-            return json.loads(cache_file.read_text())
-        except json.JSONDecodeError:
-            logger.warning("Cache file is corrupted. Starting with empty cache.")
-    return []  # Return empty list if no cache
+            result = await dispatch(request, emit, peer)
+        except Exception as e:
+            logger.error(f"Error handling request: {str(e)}")
+            traceback.print_exc()
+            result = {"error": str(e)}
+        try:
+            emit("result", result)
+        except FrameError as e:
+            emit("result", {"error": str(e)})
+        await peer.drain()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # A connection carries any number of requests; each runs as its own task,
+        # so replies go out in completion order rather than request order.
+        peer = Peer(writer)
+        peers.add(peer)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    request = await read_frame(reader, peer.max_frame)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except FrameError as e:
+                    # The oversized body is still in the stream, so the connection is lost
+                    peer.write({"error": str(e)})
+                    break
+                if request is None:
+                    break
+                if request.get("cmd") == "hello":
+                    # Applied before the next frame is read so it bounds all later frames
+                    requested = request.get("max_frame") or MAX_FRAME_SIZE
+                    peer.max_frame = min(int(requested), MAX_FRAME_SIZE)
+                task = asyncio.create_task(respond(request, peer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"Error handling connection: {str(e)}")
+            traceback.print_exc()
+        finally:
+            peers.discard(peer)
+            writer.close()
 
+    server = None
+    address: Union[str, int]
+    if use_unix_socket():
+        try:
+            server = await asyncio.start_unix_server(
+                handle, path=str(files.sock), backlog=SERVER_BACKLOG
+            )
+            os.chmod(files.sock, 0o600)
+            address = str(files.sock)
+        except OSError as e:
+            logger.warning(f"Unix socket unavailable ({str(e)}), falling back to TCP")
+            server = None
+    if server is None:
+        server = await asyncio.start_server(
+            handle, "127.0.0.1", 0, backlog=SERVER_BACKLOG
+        )
+        port = server.sockets[0].getsockname()[1]
+        files.port.write_text(str(port))
+        address = port
+    async with server:
+        if on_ready:
+            on_ready({"ready": True, "pid": os.getpid(), "address": address})
+        await stop.wait()
+        for session in sessions.values():
+            session.close()
+        if closing:
+            await asyncio.gather(*closing.values(), return_exceptions=True)
+        # Persistent client connections would otherwise keep the server open
+        for peer in list(peers):
+            peer.writer.close()
+
+
+def daemon_process(ready: Optional[ReadyChannel] = None):
+    """Run the per-user background daemon hosting all sessions.
+
+    Readiness, or the error that stopped the daemon from listening, is reported
+    on ready, by default the channel inherited from `grk session up`.
+    """
+    files = daemon_files()
+    ready = ready or ReadyChannel.from_env()
+
+    def on_ready(message: dict):
+        files.pid.write_text(str(os.getpid()))
+        ready.send(**message)
 
-def save_cached_codebase(codebase: List[dict]):
-    """Save the codebase to a local cache file."""
-    cache_file = Path(".grk_cache.json")
     try:
-        cache_file.write_text(json.dumps(codebase, indent=2))
+        asyncio.run(serve(files, on_ready=on_ready))
     except Exception as e:
-        logger.warning(f"Failed to save cache: {str(e)}")
+        logger.error(f"Daemon error: {str(e)}")
+        traceback.print_exc()
+        ready.send(error=f"{type(e).__name__}: {str(e)}")
+    finally:
+        close_clients()
+        release_daemon_files(files, os.getpid())
+
+
+def read_input(
+    path: Path,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    project: str = ".",
+    outputs: Iterable[str] = (DEFAULT_OUTPUT,),
+) -> Tuple[dict, Optional[str]]:
+    """Read cfold data from a JSON file, or fold it from a directory.
+
+    A directory is folded with the settings of the project's .grkrc, leaving
+    out the session's output files. Returns the data with a summary of the
+    fold, or None for a file.
+    """
+    if path.is_dir():
+        excluded = [*(exclude or []), *output_excludes(path, outputs, project)]
+        fold = fold_directory(path, include, excluded, load_fold_config(project))
+        return {"instructions": [], "files": fold.codebase.to_files()}, fold.summary()
+    return json.loads(path.read_text()), None
 
 
 def apply_cfold_changes(existing: List[dict], changes: List[dict]) -> List[dict]:
     """Apply cfold changes to the existing codebase."""
-    updated = existing.copy()  # Start with existing
-    for change in changes:
-        path = change.get("path")
-        if not path or path.startswith(("/", "../")):  # Validate path
-            continue  # Skip invalid paths
-        for idx, item in enumerate(updated):
-            if item["path"] == path:
-                if change.get("delete", False):
-                    updated.pop(idx)  # Delete the file
-                else:
-                    updated[idx] = change  # Update with new content
-                break
-        else:
-            if not change.get("delete", False):
-                updated.append(change)  # Add new file
-    return updated
+    return Codebase(existing).apply(changes).to_files()
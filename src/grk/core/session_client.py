@@ -0,0 +1,90 @@
+"""Client side of the multiplexed session daemon protocol."""
+
+import json
+import socket
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from .framing import MAX_FRAME_SIZE, FrameError, recv_frame, send_frame
+
+
+class SessionConnection:
+    """A persistent connection to the session daemon carrying many tagged requests.
+
+    Every request is sent with a fresh id and every frame the daemon sends back
+    carries the id of the request it belongs to, so several requests can be in
+    flight at once and their replies may arrive in any order. Frames read while
+    waiting for one request are buffered until the caller asks for their request.
+    """
+
+    def __init__(self, sock: socket.socket, max_frame: int = MAX_FRAME_SIZE):
+        self.sock = sock
+        self.max_frame = max_frame
+        self.next_id = 1
+        self.hello_id: Optional[int] = None
+        self.pending: Dict[int, Deque[dict]] = defaultdict(deque)
+
+    def negotiate(self):
+        """Propose max_frame to the daemon without waiting for its answer.
+
+        The daemon applies the smaller of both limits to every later frame on the
+        connection; its reply lowers the local limit when it is picked up.
+        """
+        self.hello_id = self.send({"cmd": "hello", "max_frame": self.max_frame})
+
+    def send(self, request: dict) -> int:
+        """Send a request without waiting for its reply and return its id."""
+        rid = self.next_id
+        self.next_id += 1
+        send_frame(self.sock, {**request, "id": rid}, self.max_frame)
+        return rid
+
+    def read_frame(self) -> dict:
+        """Read the next frame from the daemon, whichever request it belongs to."""
+        while True:
+            frame = json.loads(recv_frame(self.sock, self.max_frame))
+            if not isinstance(frame, dict) or "id" not in frame:
+                # Untagged frames only report errors that end the connection
+                error = frame.get("error") if isinstance(frame, dict) else frame
+                raise FrameError(f"Daemon closed the connection: {error}")
+            if self.hello_id is None or frame.get("id") != self.hello_id:
+                return frame
+            self.hello_id = None
+            data = frame.get("data")
+            if isinstance(data, dict) and data.get("max_frame"):
+                self.max_frame = min(self.max_frame, int(data["max_frame"]))
+
+    def next_frame(self, rid: int) -> dict:
+        """Return the next frame of request rid, buffering frames of other requests."""
+        if self.pending[rid]:
+            return self.pending[rid].popleft()
+        while True:
+            frame = self.read_frame()
+            if frame.get("id") == rid:
+                return frame
+            self.pending[frame.get("id")].append(frame)
+
+    def frames(self, rid: int) -> Iterator[dict]:
+        """Yield the frames of request rid up to and including its result frame."""
+        while True:
+            frame = self.next_frame(rid)
+            yield frame
+            if frame.get("type") == "result":
+                self.pending.pop(rid, None)
+                return
+
+    def call(self, request: dict) -> Any:
+        """Send a request and return the data of its result frame."""
+        rid = self.send(request)
+        for frame in self.frames(rid):
+            if frame.get("type") == "result":
+                return frame.get("data")
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self) -> "SessionConnection":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
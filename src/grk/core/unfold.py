@@ -0,0 +1,141 @@
+"""Apply cfold output to the working tree, touching only files whose content changed.
+
+Replaces the external `cfold unfold` step. Each file is compared against the
+disk first (by size, then by content hash), so unchanged files keep their
+mtime and do not wake editors, file watchers or build systems. Changed files
+are written in parallel, each to a temporary file that is renamed over the
+original so readers never see a partial write.
+"""
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from ..utils.codebase import is_safe_path
+from ..utils.utils import filter_protected_files
+
+# Never written by an apply, whatever the model answers
+PROTECTED_DIRS = (".git",)
+
+
+class ApplyResult(NamedTuple):
+    """What applying cfold output changed on disk."""
+
+    written: List[str]
+    deleted: List[str]
+    unchanged: List[str]
+    skipped: List[Tuple[str, str]]  # (path, reason)
+    bytes: int
+
+    def summary(self) -> str:
+        text = (
+            f"Wrote {len(self.written)} files ({self.bytes / 1024:.1f} KiB), "
+            f"deleted {len(self.deleted)}, {len(self.unchanged)} unchanged"
+        )
+        if self.skipped:
+            text += f", skipped {len(self.skipped)}"
+        return text
+
+    def to_json(self) -> dict:
+        return {**self._asdict(), "summary": self.summary()}
+
+
+def resolve_target(root: Path, path: str) -> Optional[Path]:
+    """Return where path lives under root, or None if it would leave root or is protected."""
+    if not is_safe_path(path) or path.split("/", 1)[0] in PROTECTED_DIRS:
+        return None
+    target = (root / path).resolve()
+    if not target.is_relative_to(root):
+        return None
+    return target
+
+
+def unchanged_on_disk(target: Path, data: bytes) -> bool:
+    """Return whether target already holds data, hashing only when the sizes match."""
+    try:
+        if target.stat().st_size != len(data):
+            return False
+        disk = hashlib.sha256(target.read_bytes()).digest()
+    except OSError:
+        return False
+    return disk == hashlib.sha256(data).digest()
+
+
+def write_atomic(target: Path, data: bytes):
+    """Replace target with data via a temporary file in the same directory."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        mode = target.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)  # Keep executable bits and the like
+        os.replace(tmp, target)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def apply_file(root: Path, change: dict) -> Tuple[str, str, int]:
+    """Apply one cfold change, returning its path, what happened to it and bytes written."""
+    path = change.get("path", "")
+    target = resolve_target(root, path)
+    if target is None:
+        return path, "unsafe path", 0
+    if change.get("delete", False):
+        try:
+            target.unlink()
+        except FileNotFoundError:
+            return path, "unchanged", 0
+        except OSError as e:
+            return path, f"failed: {e.strerror or e}", 0
+        return path, "deleted", 0
+    if "content" not in change:
+        return path, "no content", 0
+    data = change["content"].encode()
+    if unchanged_on_disk(target, data):
+        return path, "unchanged", 0
+    try:
+        write_atomic(target, data)
+    except OSError as e:
+        return path, f"failed: {e.strerror or e}", 0
+    return path, "written", len(data)
+
+
+def apply_changes(
+    files: List[dict],
+    root: str = ".",
+    protected: Optional[Set[str]] = None,
+    workers: Optional[int] = None,
+) -> ApplyResult:
+    """Write the changed files of cfold output under root and delete the deleted ones."""
+    root_path = Path(root).resolve()
+    protected = protected or set()
+    kept = filter_protected_files(files, protected)
+    skipped = [(f["path"], "protected") for f in files if f["path"] in protected]
+    # Later entries for a path win, as they would when unfolding in order
+    latest: Dict[str, dict] = {f.get("path", ""): f for f in kept}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(
+            executor.map(lambda change: apply_file(root_path, change), latest.values())
+        )
+    written, deleted, unchanged = [], [], []
+    size = 0
+    for path, outcome, nbytes in outcomes:
+        if outcome == "written":
+            written.append(path)
+            size += nbytes
+        elif outcome == "deleted":
+            deleted.append(path)
+        elif outcome == "unchanged":
+            unchanged.append(path)
+        else:
+            skipped.append((path, outcome))
+    return ApplyResult(written, deleted, unchanged, skipped, size)
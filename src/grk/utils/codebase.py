@@ -0,0 +1,307 @@
+"""Path-indexed in-memory model of a cfold codebase."""
+
+import hashlib
+import json
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Ways of embedding a codebase in a prompt: pretty JSON, single-line JSON, or
+# plain-text file blocks that need no escaping
+CONTEXT_FORMATS = ("json", "compact", "blocks")
+
+_MARKER_RUN = re.compile(r"^=+", re.MULTILINE)
+_BLOCK_HEADER = re.compile(r"^(={5,}) (FILE|DELETE) (.+)$")
+
+
+def is_safe_path(path: str) -> bool:
+    """Return whether a cfold path stays inside the project."""
+    return bool(path) and not path.startswith(("/", "../"))
+
+
+def content_digest(content: str) -> str:
+    """Return the hash used to detect content changes."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def files_json(files: List[dict], stable: bool = False, compact: bool = False) -> str:
+    """Serialize cfold files for a prompt.
+
+    Stable output sorts files by path and keys by name, so the same codebase always
+    serializes to the same bytes regardless of how it was folded. Compact output
+    drops the indentation and the spaces after separators.
+    """
+    layout = {"separators": (",", ":")} if compact else {"indent": 2}
+    if stable:
+        return json.dumps(sorted(files, key=lambda f: f["path"]), sort_keys=True, **layout)
+    return json.dumps(files, **layout)
+
+
+def longest_marker_run(content: str) -> int:
+    """Return the length of the longest run of '=' that starts a line of content."""
+    return max((len(run) for run in _MARKER_RUN.findall(content)), default=0)
+
+
+def block_marker(files: List[dict], longest: Optional[int] = None) -> str:
+    """Return a run of '=' longer than any that starts a line of the files' contents.
+
+    longest, if given, is that run's length, already known from the contents.
+    """
+    if longest is None:
+        longest = max(
+            (longest_marker_run(f.get("content", "")) for f in files), default=0
+        )
+    return "=" * max(5, longest + 1)
+
+
+def files_blocks(
+    files: List[dict], stable: bool = False, marker: Optional[str] = None
+) -> str:
+    """Serialize cfold files as plain-text blocks, one per file.
+
+    Each file is a '<marker> FILE <path>' line, its content verbatim and a
+    '<marker> END' line; deletions are a single '<marker> DELETE <path>' line.
+    """
+    if stable:
+        files = sorted(files, key=lambda f: f["path"])
+    marker = marker or block_marker(files)
+    blocks = []
+    for f in files:
+        if f.get("delete", False):
+            blocks.append(f"{marker} DELETE {f['path']}")
+        else:
+            blocks.append(f"{marker} FILE {f['path']}\n{f.get('content', '')}\n{marker} END")
+    return "\n".join(blocks)
+
+
+def parse_file_blocks(text: str) -> Tuple[List[dict], str]:
+    """Parse the file blocks in text into cfold files, returning them with the other text.
+
+    A block missing its END line, as in a truncated response, is dropped.
+    """
+    files: List[dict] = []
+    rest: List[str] = []
+    lines = text.split("\n")
+    marker = None
+    i = 0
+    while i < len(lines):
+        match = _BLOCK_HEADER.match(lines[i])
+        if not match or (marker is not None and match.group(1) != marker):
+            rest.append(lines[i])
+            i += 1
+            continue
+        marker, kind, path = match.groups()
+        if kind == "DELETE":
+            files.append({"path": path, "delete": True})
+            i += 1
+            continue
+        end = f"{marker} END"
+        try:
+            stop = lines.index(end, i + 1)
+        except ValueError:
+            break
+        files.append({"path": path, "content": "\n".join(lines[i + 1 : stop])})
+        i = stop + 1
+    return files, "\n".join(rest).strip()
+
+
+def postprocess_response(response: str) -> Tuple[str, str]:
+    """Postprocess the response to extract/clean JSON and any message."""
+    original_response = response.strip()
+    extracted_message = ""
+
+    # Answers in the file block format map onto cfold files directly
+    blocks, rest = parse_file_blocks(original_response)
+    if blocks:
+        return json.dumps({"files": blocks}), rest
+
+    # Check for markdown code block
+    if original_response.startswith("```json") and original_response.endswith("```"):
+        response = original_response[7:-3].strip()
+    elif "```json" in original_response:
+        # Extract the block if embedded
+        match = re.search(r"```json\s*(.*?)\s*```", original_response, re.DOTALL)
+        if match:
+            extracted_message = original_response.replace(match.group(0), "").strip()
+            response = match.group(1).strip()
+        else:
+            response = original_response
+    else:
+        response = original_response
+
+    # Try to parse as JSON
+    try:
+        json_data = json.loads(response)
+        if isinstance(json_data, list):
+            return json.dumps({"files": json_data}), extracted_message
+        elif isinstance(json_data, dict) and "files" in json_data:
+            return json.dumps(json_data), extracted_message
+        else:
+            # Not a recognized format; treat as message
+            return "", original_response
+    except json.JSONDecodeError:
+        # Fallback: find the largest valid JSON substring (e.g., embedded object)
+        match = re.search(r"(\{.*\}|\[.*\])", original_response, re.DOTALL)
+        if match:
+            try:
+                json_data = json.loads(match.group(1))
+                extracted_message = original_response.replace(
+                    match.group(1), ""
+                ).strip()
+                if isinstance(json_data, list):
+                    return json.dumps({"files": json_data}), extracted_message
+                elif isinstance(json_data, dict) and "files" in json_data:
+                    return json.dumps(json_data), extracted_message
+            except json.JSONDecodeError:
+                pass
+        # If no valid JSON, whole response is message
+        return "", original_response
+
+
+def codebase_message(
+    files: List[dict],
+    fmt: Optional[str] = None,
+    stable: bool = False,
+    heading: str = "Current codebase files",
+    marker: Optional[str] = None,
+) -> str:
+    """Return the prompt text embedding files in the given context format.
+
+    The block marker is derived from the files unless given.
+    """
+    fmt = fmt or "json"
+    if fmt == "blocks":
+        marker = marker or block_marker(files)
+        deletes = (
+            f" A '{marker} DELETE <path>' line marks a deleted file."
+            if any(f.get("delete", False) for f in files)
+            else ""
+        )
+        return (
+            f"{heading}, one block per file. A block starts with a '{marker} FILE <path>' "
+            f"line and ends with a '{marker} END' line; everything in between is the "
+            f"file content, verbatim.{deletes}\n{files_blocks(files, stable, marker)}"
+        )
+    if fmt not in CONTEXT_FORMATS:
+        raise ValueError(f"Unknown context format: {fmt}")
+    body = files_json(files, stable, compact=fmt == "compact")
+    return f"{heading}:\n```json\n{body}\n```"
+
+
+class FileInfo(NamedTuple):
+    """Content hash and encoded size of a file."""
+
+    digest: str
+    size: int
+
+
+class ChangeSet(NamedTuple):
+    """Paths of a cfold change list, classified against a codebase."""
+
+    changed: List[str]
+    new: List[str]
+    deleted: List[str]
+
+
+class Codebase:
+    """Files of a cfold codebase keyed by path, in insertion order.
+
+    Entries are the cfold file dicts themselves, so serializing back to cfold is
+    lossless. Upserts and deletes are O(1); content hashes and sizes are computed
+    on first use and dropped when a file is replaced.
+    """
+
+    def __init__(self, files: Optional[List[dict]] = None):
+        self.files: Dict[str, dict] = {}
+        self._info: Dict[str, FileInfo] = {}
+        for f in files or []:
+            if not f.get("delete", False):
+                self.files[f["path"]] = f
+
+    @classmethod
+    def from_json(cls, data: Union[dict, list, "Codebase"]) -> "Codebase":
+        """Build a codebase from cfold JSON, either {"files": [...]} or a bare list."""
+        if isinstance(data, Codebase):
+            return data
+        if isinstance(data, dict):
+            data = data.get("files", [])
+        return cls(data)
+
+    def to_files(self) -> List[dict]:
+        """Return the cfold file list."""
+        return list(self.files.values())
+
+    def to_json(self) -> dict:
+        """Return cfold JSON for the codebase."""
+        return {"files": self.to_files()}
+
+    def copy(self) -> "Codebase":
+        """Return a codebase with the same files and known hashes, changed independently."""
+        clone = Codebase()
+        clone.files = dict(self.files)
+        clone._info = dict(self._info)
+        return clone
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.files
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.files.values())
+
+    def paths(self) -> List[str]:
+        return list(self.files)
+
+    def get(self, path: str) -> Optional[dict]:
+        return self.files.get(path)
+
+    def content(self, path: str) -> Optional[str]:
+        f = self.files.get(path)
+        return f.get("content") if f else None
+
+    def info(self, path: str) -> FileInfo:
+        """Return the content hash and size of path."""
+        info = self._info.get(path)
+        if info is None:
+            content = self.files[path].get("content", "")
+            info = FileInfo(content_digest(content), len(content.encode()))
+            self._info[path] = info
+        return info
+
+    def upsert(self, f: dict):
+        """Add a file or replace the file at its path, keeping its position."""
+        self.files[f["path"]] = f
+        self._info.pop(f["path"], None)
+
+    def delete(self, path: str):
+        self.files.pop(path, None)
+        self._info.pop(path, None)
+
+    def apply(self, changes: List[dict]) -> "Codebase":
+        """Apply cfold changes in place, skipping paths outside the project."""
+        for change in changes:
+            path = change.get("path")
+            if not is_safe_path(path):
+                continue
+            if change.get("delete", False):
+                self.delete(path)
+            else:
+                self.upsert(change)
+        return self
+
+    def classify(self, changes: List[dict]) -> ChangeSet:
+        """Sort the paths of cfold changes into changed, new and deleted files."""
+        contents = {
+            f["path"]: f["content"]
+            for f in changes
+            if not f.get("delete", False) and "content" in f
+        }
+        changed, new = [], []
+        for path, content in contents.items():
+            if self.content(path) is None:
+                new.append(path)
+            elif content_digest(content) != self.info(path).digest:
+                changed.append(path)
+        deleted = [f["path"] for f in changes if f.get("delete", False)]
+        return ChangeSet(changed, new, deleted)
@@ -0,0 +1,120 @@
+"""Offline estimates of prompt size in tokens."""
+
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from .codebase import (
+    CONTEXT_FORMATS,
+    Codebase,
+    block_marker,
+    codebase_message,
+    content_digest,
+    files_json,
+    longest_marker_run,
+)
+
+# Words, numbers and single punctuation marks; long pieces count a token per 4 chars
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_CACHE_LIMIT = 100_000
+
+_estimates: Dict[str, int] = {}
+# Per content hash: tokens of the content as a JSON string and its longest '=' run
+_encodings: Dict[str, Tuple[int, int]] = {}
+_estimates_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in text, uncached."""
+    return sum((len(piece) + 3) // 4 for piece in _PIECE.findall(text))
+
+
+def estimate_tokens(text: str, digest: Optional[str] = None) -> int:
+    """Estimate the number of tokens in text, cached by its content hash."""
+    key = digest or content_digest(text)
+    with _estimates_lock:
+        tokens = _estimates.get(key)
+    if tokens is None:
+        tokens = count_tokens(text)
+        with _estimates_lock:
+            if len(_estimates) >= _CACHE_LIMIT:
+                _estimates.clear()
+            _estimates[key] = tokens
+    return tokens
+
+
+def json_string_tokens(content: str, raw_tokens: int) -> int:
+    """Approximate the tokens of content as a JSON string from its raw estimate.
+
+    Each escaped newline, tab or carriage return adds a backslash and a letter,
+    each escaped quote or backslash adds a backslash, and each non-ASCII
+    character becomes a \\uXXXX escape; the string's quotes add two more.
+    """
+    breaks = content.count("\n") + content.count("\t") + content.count("\r")
+    escaped = content.count('"') + content.count("\\")
+    non_ascii = 0
+    if not content.isascii():
+        non_ascii = len(content) - len(content.encode("ascii", "ignore"))
+    return raw_tokens + 2 + 2 * breaks + escaped + non_ascii
+
+
+def content_encoding(content: str, digest: str) -> Tuple[int, int]:
+    """Return the JSON string tokens of content and its longest line-leading '=' run."""
+    with _estimates_lock:
+        encoding = _encodings.get(digest)
+    if encoding is None:
+        run = 0
+        if content.startswith("=") or "\n=" in content:
+            run = longest_marker_run(content)
+        encoding = (json_string_tokens(content, estimate_tokens(content, digest)), run)
+        with _estimates_lock:
+            if len(_encodings) >= _CACHE_LIMIT:
+                _encodings.clear()
+            _encodings[digest] = encoding
+    return encoding
+
+
+def file_tokens(codebase: Codebase) -> List[Tuple[str, int]]:
+    """Return the estimated tokens of each file, largest first."""
+    sizes = [
+        (path, estimate_tokens(codebase.content(path) or "", codebase.info(path).digest))
+        for path in codebase.paths()
+    ]
+    return sorted(sizes, key=lambda item: item[1], reverse=True)
+
+
+# Keys and punctuation of one file in JSON, without its path and content strings
+_JSON_FILE_TOKENS = (
+    count_tokens(files_json([{"path": "", "content": ""}]))
+    - count_tokens("[]")
+    - 2 * count_tokens('""')
+)
+
+
+def encoding_tokens(codebase: Union[Codebase, List[dict]]) -> Dict[str, int]:
+    """Return the estimated tokens of the codebase message in each context format.
+
+    The estimate is summed from the per-file estimates cached by content hash,
+    so the codebase is never serialized; file order does not change it.
+    """
+    codebase = Codebase.from_json(codebase)
+    json_tokens = blocks_tokens = longest = 0
+    for path in codebase.paths():
+        content = codebase.content(path) or ""
+        digest = codebase.info(path).digest
+        escaped, run = content_encoding(content, digest)
+        longest = max(longest, run)
+        json_tokens += _JSON_FILE_TOKENS + count_tokens(json.dumps(path)) + escaped
+        # FILE <path>, the content, END; the two markers are added below
+        blocks_tokens += 2 + count_tokens(path) + estimate_tokens(content, digest)
+    files = len(codebase)
+    marker = block_marker([], longest)
+    totals = {"json": json_tokens, "compact": json_tokens}
+    totals["blocks"] = blocks_tokens + 2 * files * count_tokens(marker)
+    return {
+        fmt: totals[fmt]
+        + max(files - 1, 0) * (fmt != "blocks")  # Commas between JSON files
+        + count_tokens(codebase_message([], fmt, marker=marker))
+        for fmt in CONTEXT_FORMATS
+    }
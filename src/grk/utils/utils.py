@@ -4,8 +4,10 @@ import json
 import difflib
 from collections import defaultdict
 from rich.console import Console
-from typing import List, Set, Dict, Any
+from typing import List, Set, Dict, Any, Optional, Tuple, Union
 import re
+from .codebase import Codebase
+from .tokens import estimate_tokens
 
 
 class GrkException(Exception):
@@ -21,7 +23,14 @@ def get_synopsis(content: str) -> str:
     return top_line[:100] + ("..." if len(top_line) > 100 else "")
 
 
-def analyze_changes(input_data: dict, response: str, console: Console):
+def split_globs(globs: Optional[str]) -> List[str]:
+    """Split a comma-separated list of globs from the command line."""
+    return [g.strip() for g in (globs or "").split(",") if g.strip()]
+
+
+def analyze_changes(
+    input_data: Union[dict, Codebase], response: str, console: Console
+):
     """Analyze and print changes if response is cfold format."""
     try:
         response_to_parse = response.strip()
@@ -41,26 +50,9 @@ def analyze_changes(input_data: dict, response: str, console: Console):
             )
             return
 
-        output_files = {}
-        deleted_files = []
-        for f in output_files_list:
-            path = f["path"]
-            if f.get("delete", False):
-                deleted_files.append(path)
-            elif "content" in f:
-                output_files[path] = f["content"]
-
-        input_files = {}
-        for f in input_data.get("files", []):
-            if not f.get("delete", False) and "content" in f:
-                input_files[f["path"]] = f["content"]
-
-        changed_files = [
-            path
-            for path in output_files
-            if path in input_files and output_files[path] != input_files[path]
-        ]
-        new_files = [path for path in output_files if path not in input_files]
+        changed_files, new_files, deleted_files = Codebase.from_json(
+            input_data
+        ).classify(output_files_list)
 
         console.print("[bold green]Suggested changes:[/bold green]")
         if changed_files:
@@ -89,7 +81,7 @@ def analyze_changes(input_data: dict, response: str, console: Console):
         )
 
 
-def get_change_summary(input_data: dict, response: str) -> str:
+def get_change_summary(input_data: Union[dict, Codebase], response: str) -> str:
     """Get a detailed string summary of changes from response in cfold format, including file tree and diffs."""
     try:
         response_to_parse = response.strip()
@@ -104,23 +96,15 @@ def get_change_summary(input_data: dict, response: str) -> str:
             output_files_list = output_data["files"]
         else:
             return "= No file changes detected."
+        input_files = Codebase.from_json(input_data)
+        changed_files, new_files, deleted_files = input_files.classify(
+            output_files_list
+        )
         output_files = {
             f["path"]: f["content"]
             for f in output_files_list
             if not f.get("delete", False) and "content" in f
         }
-        deleted_files = [f["path"] for f in output_files_list if f.get("delete", False)]
-        input_files = {
-            f["path"]: f["content"]
-            for f in input_data.get("files", [])
-            if not f.get("delete", False) and "content" in f
-        }
-        changed_files = [
-            path
-            for path in output_files
-            if path in input_files and output_files[path] != input_files[path]
-        ]
-        new_files = [path for path in output_files if path not in input_files]
         all_affected = changed_files + new_files + deleted_files
         if not all_affected:
             return "= No changes detected."
@@ -164,7 +148,7 @@ def get_change_summary(input_data: dict, response: str) -> str:
         # Build diffs for changed files
         diff_strs = []
         for path in changed_files:
-            old_lines = input_files[path].splitlines()
+            old_lines = input_files.content(path).splitlines()
             new_lines = output_files[path].splitlines()
             diff = difflib.unified_diff(
                 old_lines, new_lines, fromfile=path + " (old)", tofile=path + " (new)"
@@ -199,6 +183,85 @@ def filter_protected_files(
     return filtered
 
 
+def print_usage(console: Console, usage: Dict[str, int]):
+    """Print the prompt and completion tokens of a call, with prompt cache hits."""
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    if not prompt_tokens:
+        return
+    cached = usage.get("cached_prompt_tokens", 0)
+    console.print(
+        f"[bold green]Prompt tokens:[/bold green] {prompt_tokens} "
+        f"({cached} cached, {cached / prompt_tokens:.0%})"
+    )
+    console.print(
+        f"[bold green]Completion tokens:[/bold green] {usage.get('completion_tokens', 0)}"
+    )
+
+
+def print_retries(console: Console, retries: int):
+    """Print how many transient failures a call retried, if any."""
+    if retries:
+        console.print(f"[bold yellow]Retries:[/bold yellow] {retries}")
+
+
+def print_apply_report(console: Console, applied: Dict[str, Any]):
+    """Print the files an apply wrote, deleted and skipped."""
+    console.print(f"[bold green]Applied:[/bold green] {applied['summary']}")
+    for path in applied.get("written", []):
+        console.print(f" [green]M[/green] {path}")
+    for path in applied.get("deleted", []):
+        console.print(f" [red]D[/red] {path}")
+    for path, reason in applied.get("skipped", []):
+        console.print(f" [yellow]![/yellow] {path} ({reason})")
+
+
+def print_race_report(console: Console, timings: List[Dict[str, Any]]):
+    """Print which raced profile won and how long every leg took."""
+    for t in timings:
+        if t["outcome"] == "won":
+            console.print(
+                f"[bold green]Race won by:[/bold green] {t['profile']} "
+                f"([yellow]{t['model']}[/yellow]) in {t['latency']:.2f} seconds"
+            )
+    for t in timings:
+        if t["outcome"] != "won":
+            reason = f": {t['error']}" if t.get("error") else ""
+            console.print(
+                f" - {t['profile']} ({t['model']}) {t['outcome']} "
+                f"after {t['latency']:.2f} seconds{reason}"
+            )
+
+
+def print_encoding_report(
+    console: Console, tokens: Dict[str, int], fmt: Optional[str] = None
+):
+    """Print the codebase tokens in the chosen context format against the others."""
+    fmt = fmt or "json"
+    chosen = tokens[fmt]
+    baseline = tokens["json"]
+    saved = f", {1 - chosen / baseline:.0%} less than json" if fmt != "json" and baseline else ""
+    others = ", ".join(f"{name} ~{count}" for name, count in tokens.items())
+    console.print(
+        f" Codebase encoding: [cyan]{fmt}[/cyan] ~{chosen} tokens{saved} ({others})"
+    )
+
+
+def enforce_token_budget(
+    total: int, budget: Optional[int], action: Optional[str] = None
+) -> Optional[str]:
+    """Check a prompt estimate against a token budget.
+
+    Raises when the budget is exceeded and action is "refuse"; otherwise returns a
+    warning to show when it is exceeded, or None when it fits.
+    """
+    if budget is None or total <= budget:
+        return None
+    message = f"Prompt of ~{total} tokens exceeds the token budget of {budget}"
+    if (action or "warn") == "refuse":
+        raise GrkException(message)
+    return message
+
+
 def build_instructions_from_messages(messages: List) -> List[Dict[str, Any]]:
     """Build list of instruction dicts from messages for summary, skipping empty content."""
     instructions = []
@@ -241,7 +304,14 @@ def build_instructions_from_messages(messages: List) -> List[Dict[str, Any]]:
         if not content_str.strip():
             continue  # Skip empty instructions
         synopsis = get_synopsis(content_str)
-        instructions.append({"role": role, "name": name, "synopsis": synopsis})
+        instructions.append(
+            {
+                "role": role,
+                "name": name,
+                "synopsis": synopsis,
+                "tokens": estimate_tokens(content_str),
+            }
+        )
     return instructions
 
 
@@ -250,8 +320,14 @@ def print_instruction_tree(
     instructions: List[Dict[str, Any]],
     adding: List[Dict[str, Any]] = None,
     title: str = "Instruction Summary:",
+    files: List[Tuple[str, int]] = None,
+    file_limit: int = 10,
 ):
-    """Print instruction summary in a tree-like format, skipping empty synopses."""
+    """Print instruction summary in a tree-like format, skipping empty synopses.
+
+    Instructions carrying token estimates get them appended along with a total,
+    and files (path and tokens, largest first) lists the biggest codebase files.
+    """
     if adding is None:
         adding = []
     all_instr = instructions + adding
@@ -272,5 +348,15 @@ def print_instruction_tree(
         name = instr.get("name", "Unnamed")
         synopsis = instr.get("synopsis", "")
         name_str = f" ({name})" if name != "Unnamed" else ""
-        lines.append(f"{prefix}[cyan]{role}[/cyan]{name_str}: {synopsis}")
+        tokens_str = f" [dim](~{instr['tokens']} tokens)[/dim]" if "tokens" in instr else ""
+        lines.append(f"{prefix}[cyan]{role}[/cyan]{name_str}: {synopsis}{tokens_str}")
     console.print("\n".join(lines))
+    if any("tokens" in instr for instr in filtered_instr):
+        total = sum(instr.get("tokens", 0) for instr in filtered_instr)
+        console.print(f" Total: [yellow]~{total} tokens[/yellow]")
+    if files:
+        console.print("[bold green]Largest files:[/bold green]")
+        for path, tokens in files[:file_limit]:
+            console.print(f" - {path}: ~{tokens} tokens")
+        if len(files) > file_limit:
+            console.print(f" ... and {len(files) - file_limit} more files")
@@ -0,0 +1,113 @@
+"""Shared pytest fixtures."""
+
+import threading
+from unittest.mock import Mock
+
+import grpc
+import pytest
+from grk.config import config
+from grk.core import api, retry
+
+
+@pytest.fixture(autouse=True)
+def reset_client_pool():
+    """Ensure each test starts with an empty client pool so Client patches apply."""
+    api._clients.clear()
+    yield
+    api._clients.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Start each test with every circuit breaker closed."""
+    retry.reset_breakers()
+    yield
+    retry.reset_breakers()
+
+
+@pytest.fixture(autouse=True)
+def isolated_runtime_dir(tmp_path, monkeypatch):
+    """Keep session daemon files for each test in its own runtime directory."""
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(run_dir))
+    return run_dir / "grk"
+
+
+@pytest.fixture(autouse=True)
+def isolated_ledger(tmp_path, monkeypatch):
+    """Record each test's requests in its own usage ledger."""
+    monkeypatch.delenv("GRK_LEDGER", raising=False)
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    return tmp_path / "data" / "grk" / "ledger.db"
+
+
+@pytest.fixture(autouse=True)
+def isolated_config_cache(tmp_path_factory, monkeypatch):
+    """Start each test without parsed configs and with its own config snapshots."""
+    cache_dir = tmp_path_factory.mktemp("cache")
+    monkeypatch.delenv("GRK_CONFIG_SNAPSHOT", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_dir))
+    config.clear_config_cache()
+    yield cache_dir / "grk" / "config"
+    config.clear_config_cache()
+
+
+class FakeCall:
+    """Stand-in for a streaming gRPC call that can be cancelled from another thread."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+@pytest.fixture
+def fake_stream():
+    """Return a factory of stream_grok stand-ins.
+
+    answers maps a model to (delay, chunk) pairs; each chunk is yielded after its
+    delay, or raised if it is an exception. A cancelled call raises at once.
+    The resilience each model was streamed with is kept in the stand-in's
+    policies.
+    """
+
+    def factory(answers):
+        def stream(messages, model, api_key, temperature=0, on_call=None, resilience=None):
+            stream.policies[model] = resilience
+            call = FakeCall()
+            if on_call:
+                on_call(call)
+            response = Mock()
+            response.usage.prompt_tokens = 10
+            response.usage.cached_prompt_text_tokens = 0
+            response.usage.completion_tokens = 2
+            for delay, chunk in answers[model]:
+                if call.cancelled.wait(delay):
+                    raise RuntimeError("Cancelled")
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield response, chunk
+
+        stream.policies = {}
+        return stream
+
+    return factory
+
+
+class FakeRpcError(grpc.RpcError):
+    """RpcError carrying a status code, as the gRPC channel raises it."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self._code = getattr(grpc.StatusCode, code)
+
+    def code(self):
+        return self._code
+
+
+@pytest.fixture
+def rpc_error():
+    """Return a factory of gRPC errors by status code name, e.g. rpc_error("UNAVAILABLE")."""
+    return FakeRpcError
@@ -1,5 +1,7 @@
 import pytest
-from grk.core.api import call_grok
+from grk.config.models import ResilienceConfig
+from grk.core import api
+from grk.core.api import call_grok, close_clients, get_client, stream_grok, track_calls
 from grk.utils.utils import GrkException
 
 
@@ -40,3 +42,116 @@ def test_call_grok_non_string_response(mocker, non_str):
     with pytest.raises(GrkException) as exc_info:
         call_grok(messages, "grok-3", "dummy_key")
     assert "API response is not a string" in str(exc_info.value)
+
+
+def test_stream_grok_yields_chunks(mocker):
+    """Test stream_grok yields the accumulating response and chunk text."""
+    mock_client = mocker.Mock()
+    mock_chat = mocker.Mock()
+    mock_response = mocker.Mock()
+    chunks = [mocker.Mock(content="Hel"), mocker.Mock(content="lo")]
+    mock_chat.stream.return_value = iter([(mock_response, c) for c in chunks])
+    mock_client.chat.create.return_value = mock_chat
+    mocker.patch("grk.core.api.Client", return_value=mock_client)
+
+    messages = [{"role": "user", "content": "hi"}]
+    result = list(stream_grok(messages, "grok-3", "dummy_key"))
+    assert [text for _, text in result] == ["Hel", "lo"]
+    assert result[-1][0] is mock_response
+
+
+def test_stream_grok_api_failure(mocker):
+    """Test stream_grok wraps API errors in GrkException."""
+    mock_client = mocker.Mock()
+    mock_client.chat.create.side_effect = Exception("API error")
+    mocker.patch("grk.core.api.Client", return_value=mock_client)
+
+    with pytest.raises(GrkException) as exc_info:
+        list(stream_grok([], "grok-3", "dummy_key"))
+    assert "API request failed" in str(exc_info.value)
+
+
+def test_get_client_reuses_pooled_client(mocker):
+    """Test get_client returns the same client for the same key and endpoint."""
+    mock_client_class = mocker.patch("grk.core.api.Client")
+    first = get_client("key-a")
+    assert get_client("key-a") is first
+    get_client("key-b")
+    assert mock_client_class.call_count == 2
+    kwargs = mock_client_class.call_args.kwargs
+    assert ("grpc.keepalive_permit_without_calls", 1) in kwargs["channel_options"]
+
+
+def test_close_clients(mocker):
+    """Test close_clients closes pooled clients and empties the pool."""
+    mock_client_class = mocker.patch("grk.core.api.Client")
+    get_client("key-a")
+    close_clients()
+    mock_client_class.return_value.close.assert_called_once()
+    get_client("key-a")
+    assert mock_client_class.call_count == 2
+
+
+def test_call_grok_retries_transient_failures(mocker, rpc_error):
+    """Test call_grok retries an unavailable endpoint and reports each retry."""
+    mock_client = mocker.Mock()
+    mock_chat = mocker.Mock()
+    mock_chat.sample.side_effect = [
+        rpc_error("UNAVAILABLE"),
+        mocker.Mock(content="ok"),
+    ]
+    mock_client.chat.create.return_value = mock_chat
+    mocker.patch("grk.core.api.Client", return_value=mock_client)
+
+    counts = []
+    policy = ResilienceConfig(backoff=0)
+    assert call_grok([], "grok-3", "key", resilience=policy, on_retry=counts.append) == "ok"
+    assert counts == [1]
+
+    mock_chat.sample.side_effect = rpc_error("UNAVAILABLE")
+    with pytest.raises(GrkException, match="UNAVAILABLE \\(after 2 retries\\)"):
+        call_grok([], "grok-3", "key", resilience=policy)
+
+
+def test_stream_grok_retries_only_before_first_chunk(mocker, rpc_error):
+    """Test stream_grok restarts a stream that failed before yielding anything."""
+    def failing(after):
+        yield from after
+        raise rpc_error("UNAVAILABLE")
+
+    response = mocker.Mock()
+    mock_client = mocker.Mock()
+    mock_chat = mocker.Mock()
+    mock_chat.stream.side_effect = [
+        failing([]),
+        iter([(response, mocker.Mock(content="Hi"))]),
+    ]
+    mock_client.chat.create.return_value = mock_chat
+    mocker.patch("grk.core.api.Client", return_value=mock_client)
+
+    counts = []
+    policy = ResilienceConfig(backoff=0)
+    chunks = stream_grok([], "grok-3", "key", resilience=policy, on_retry=counts.append)
+    assert [text for _, text in chunks] == ["Hi"]
+    assert counts == [1]
+
+    mock_chat.stream.side_effect = [failing([(response, mocker.Mock(content="Hi"))])]
+    with pytest.raises(GrkException, match="UNAVAILABLE"):
+        list(stream_grok([], "grok-3", "key", resilience=policy))
+    assert mock_chat.stream.call_count == 3
+
+
+def test_track_calls(mocker, caplog, monkeypatch):
+    """Test calls are tracked through the chat stub, and its absence is logged once."""
+    calls = []
+    chat = mocker.Mock()
+    stub = chat._stub
+    track_calls(chat, calls.append)
+    call = chat._stub.GetCompletionChunk("request")
+    assert calls == [call] and call is stub.GetCompletionChunk.return_value
+
+    monkeypatch.setattr(api, "_untracked_reported", False)
+    with caplog.at_level("WARNING"):
+        track_calls(object(), calls.append)
+        track_calls(object(), calls.append)
+    assert caplog.text.count("no chat stub to track calls on") == 1
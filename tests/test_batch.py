@@ -0,0 +1,90 @@
+"""Tests for batch module."""
+
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from rich.console import Console
+
+from grk.core.batch import load_manifest, percentile, run_batch
+from grk.utils.utils import GrkException
+
+
+def test_load_manifest_jsonl(tmp_path):
+    """Test loading a JSONL manifest."""
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text(
+        '{"file": "a.json", "message": "m1"}\n\n'
+        '{"file": "b.json", "message": "m2", "profile": "py", "output": "b.out"}\n'
+    )
+    jobs = load_manifest(str(manifest))
+    assert len(jobs) == 2
+    assert jobs[0].profile == "default"
+    assert jobs[1].output == "b.out"
+
+
+def test_load_manifest_yaml(tmp_path):
+    """Test loading a YAML manifest with a top-level jobs key."""
+    manifest = tmp_path / "jobs.yaml"
+    manifest.write_text("jobs:\n  - file: a.json\n    message: m1\n")
+    jobs = load_manifest(str(manifest))
+    assert jobs[0].file == "a.json"
+
+
+def test_load_manifest_invalid(tmp_path):
+    """Test loading a manifest with missing fields."""
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text('{"file": "a.json"}\n')
+    with pytest.raises(GrkException) as exc:
+        load_manifest(str(manifest))
+    assert "Invalid manifest" in str(exc.value)
+
+
+def test_percentile():
+    """Test nearest-rank percentile."""
+    assert percentile([], 50) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 90) == 4.0
+
+
+@patch("grk.core.batch.call_grok")
+def test_run_batch(mock_call, tmp_path, monkeypatch, capsys):
+    """Test run_batch writes each output and reports failures per job."""
+    monkeypatch.chdir(tmp_path)
+    Path("a.json").write_text('{"files": []}')
+    Path("b.txt").write_text("plain text")
+    Path("jobs.jsonl").write_text(
+        "\n".join(
+            json.dumps(j)
+            for j in [
+                {"file": "a.json", "message": "m1", "output": "a.out.json"},
+                {"file": "b.txt", "message": "m2", "output": "b.out.txt"},
+                {"file": "missing.txt", "message": "m3", "output": "c.out"},
+            ]
+        )
+    )
+    mock_call.side_effect = lambda messages, *args, **kwargs: (
+        '{"files": [{"path": "x.txt", "content": "x"}]}'
+        if "Current codebase files" in messages[-2].content[0].text
+        else "text reply"
+    )
+    results = run_batch("jobs.jsonl", "key", concurrency=2, console=Console())
+    assert [r.index for r in results] == [0, 1, 2]
+    assert json.loads(Path("a.out.json").read_text())["files"][0]["path"] == "x.txt"
+    assert Path("b.out.txt").read_text() == "text reply"
+    assert "Failed to read file" in results[2].error
+    captured = capsys.readouterr()
+    assert "3 jobs" in captured.out
+    assert "2 succeeded, 1 failed" in captured.out
+
+
+def test_run_batch_duplicate_outputs(tmp_path, monkeypatch):
+    """Test run_batch rejects jobs sharing an output file."""
+    monkeypatch.chdir(tmp_path)
+    Path("jobs.jsonl").write_text(
+        '{"file": "a.json", "message": "m1"}\n{"file": "b.json", "message": "m2"}\n'
+    )
+    with pytest.raises(GrkException) as exc:
+        run_batch("jobs.jsonl", "key")
+    assert "both write to" in str(exc.value)
@@ -0,0 +1,64 @@
+"""Tests for the response cache."""
+
+import os
+import time
+from pathlib import Path
+
+from xai_sdk.chat import system, user
+
+from grk.core.cache import ResponseCache, cache_key, open_response_cache
+
+
+def test_cache_key_depends_on_messages_and_params():
+    """Test cache keys change with message content and model parameters."""
+    messages = [system("role"), user("prompt")]
+    key = cache_key(messages, "grok-4", 0)
+    assert key == cache_key([system("role"), user("prompt")], "grok-4", 0)
+    assert key != cache_key([system("role"), user("other")], "grok-4", 0)
+    assert key != cache_key(messages, "grok-3", 0)
+    assert key != cache_key(messages, "grok-4", 0.5)
+
+
+def test_response_cache_roundtrip(tmp_path):
+    """Test storing and retrieving a cached response."""
+    cache = ResponseCache(str(tmp_path / "c"), max_bytes=1024 * 1024)
+    assert cache.get("abc") is None
+    cache.put("abc", "response text")
+    assert cache.get("abc") == "response text"
+
+
+def test_response_cache_ttl(tmp_path):
+    """Test expired entries are treated as misses and removed."""
+    cache = ResponseCache(str(tmp_path), max_bytes=1024 * 1024, ttl=10)
+    cache.put("abc", "old")
+    entry = tmp_path / "abc.json"
+    entry.write_text('{"created": %f, "response": "old"}' % (time.time() - 60))
+    assert cache.get("abc") is None
+    assert not entry.exists()
+
+
+def test_response_cache_lru_eviction(tmp_path):
+    """Test least recently used entries are evicted beyond max_bytes."""
+    cache = ResponseCache(str(tmp_path), max_bytes=200)
+    cache.put("a", "x" * 40)
+    cache.put("b", "y" * 40)
+    now = time.time()
+    os.utime(tmp_path / "a.json", (now - 100, now - 100))
+    os.utime(tmp_path / "b.json", (now - 50, now - 50))
+    cache.get("a")  # Refresh a, leaving b least recently used
+    cache.put("c", "z" * 40)
+    assert (tmp_path / "a.json").exists()
+    assert not (tmp_path / "b.json").exists()
+    assert (tmp_path / "c.json").exists()
+
+
+def test_open_response_cache(tmp_path, monkeypatch):
+    """Test the cache is only opened when enabled in .grkrc."""
+    monkeypatch.chdir(tmp_path)
+    assert open_response_cache() is None
+    Path(".grkrc").write_text("cache:\n  dir: .rc\n  ttl: 60\n")
+    cache = open_response_cache()
+    assert cache.dir == Path(".rc")
+    assert cache.ttl == 60
+    Path(".grkrc").write_text("cache:\n  enabled: false\n")
+    assert open_response_cache() is None
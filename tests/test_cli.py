@@ -2,11 +2,18 @@
 
 import pytest
 import json
+import re
 from pathlib import Path
-from io import StringIO
-from grk.cli.cli import main
+from io import BytesIO, StringIO
+from grk.cli.cli import daemon_request, main, start_daemon
+from grk.core.runtime import READY_FD_ENV, ReadyChannel, daemon_files
+from grk.utils.utils import GrkException
 import sys
 import os
+import socket
+import subprocess
+import threading
+import time
 
 
 @pytest.fixture
@@ -44,6 +51,55 @@ def capture_output():
     return _capture
 
 
+def fake_daemon(run_dir, pid="12345", port="12345"):
+    """Write the PID and port files of a running session daemon."""
+    run_dir.mkdir(parents=True, exist_ok=True)
+    (run_dir / "daemon.pid").write_text(pid)
+    (run_dir / "daemon.port").write_text(port)
+
+
+def frames(*payloads, rid=1):
+    """Encode payloads as the length-prefixed frames the daemon sends for request rid.
+
+    A payload is either a (type, data) pair or the data of a result frame.
+    """
+    chunks = []
+    for payload in payloads:
+        kind, body = payload if isinstance(payload, tuple) else ("result", payload)
+        data = json.dumps({"id": rid, "type": kind, "data": body}).encode()
+        chunks += [len(data).to_bytes(4, "big"), data]
+    return chunks
+
+
+def fake_socket(mocker, *payloads, rid=2):
+    """Mock a daemon connection that answers the frame size handshake and then
+    sends payloads for request rid."""
+    stream = BytesIO(b"".join(frames({"max_frame": 1024}, rid=1) + frames(*payloads, rid=rid)))
+    mock_socket = mocker.Mock()
+    mock_socket.sent = []
+
+    def recv_into(view, size):
+        data = stream.read(size)
+        view[: len(data)] = data
+        return len(data)
+
+    def sendmsg(buffers):
+        data = b"".join(bytes(b) for b in buffers)
+        mock_socket.sent.append(data)
+        return len(data)
+
+    mock_socket.recv_into.side_effect = recv_into
+    mock_socket.sendmsg.side_effect = sendmsg
+    return mock_socket
+
+
+def sent_requests(mock_socket):
+    """Decode the framed requests sent through a mocked socket, after the handshake."""
+    requests = [json.loads(data[4:]) for data in mock_socket.sent]
+    assert requests[0]["cmd"] == "hello"
+    return requests[1:]
+
+
 def test_main_help(capture_output):
     """Test main CLI help command."""
     result = capture_output(["--help"])
@@ -169,20 +225,31 @@ def test_run_command_with_profile(
     assert "API call completed in" in caplog.text
 
 
-def test_session_up_command(capture_output, tmp_path, monkeypatch, mocker, caplog):
-    """Test session up command (stubbed for process start)."""
+def test_session_up_command(
+    capture_output, tmp_path, monkeypatch, mocker, caplog, isolated_runtime_dir
+):
+    """Test session up starts the daemon and registers the session with it."""
     monkeypatch.chdir(tmp_path)
     Path("initial.json").write_text('{"files": []}')
-    mock_popen = mocker.patch("subprocess.Popen")
-    mock_popen.return_value.pid = 12345  # Mock pid
+    mock_start = mocker.patch(
+        "grk.cli.cli.start_daemon",
+        side_effect=lambda: fake_daemon(isolated_runtime_dir),
+    )
+    mock_socket = fake_socket(mocker, {"message": "started"})
+    mocker.patch("socket.socket", return_value=mock_socket)
     with caplog.at_level("INFO"):
         result = capture_output(
-            ["session", "up", "initial.json"], env={"XAI_API_KEY": "dummy_key"}
+            ["session", "up", "initial.json", "-n", "feature"],
+            env={"XAI_API_KEY": "dummy_key"},
         )
     assert result.exit_code == 0
-    assert "Session started with PID 12345" in caplog.text
-    assert Path(".grk_session.pid").exists()
-    assert Path(".grk_session.json").exists()
+    assert mock_start.called
+    assert "Session 'feature' started with PID 12345" in caplog.text
+    request = sent_requests(mock_socket)[0]
+    assert request["cmd"] == "up"
+    assert request["session"] == f"feature@{tmp_path.resolve()}"
+    assert request["file"] == str((tmp_path / "initial.json").resolve())
+    assert request["config"]["model"] == "grok-code-fast-1"
 
 
 def test_session_up_invalid_file(capture_output, tmp_path, monkeypatch):
@@ -195,59 +262,119 @@ def test_session_up_invalid_file(capture_output, tmp_path, monkeypatch):
     assert "Invalid file" in result.output
 
 
-def test_session_msg_postprocessing(capture_output, tmp_path, monkeypatch, mocker):
+def test_session_msg_postprocessing(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
     """Test session msg command with postprocessing of malformed responses."""
     monkeypatch.chdir(tmp_path)
-    Path("initial.json").write_text('{"files": []}')
-    Path(".grk_session.pid").write_text("12345")
-    Path(".grk_session.json").write_text(
-        json.dumps({"profile": "default", "initial_file": "initial.json", "pid": 12345})
-    )
-    Path(".grk_session.port").write_text("12345")
+    fake_daemon(isolated_runtime_dir)
 
     # Mock socket for testing postprocessing
-    mock_socket = mocker.Mock()
-    mock_socket.connect = mocker.Mock()
-    mock_socket.send = mocker.Mock()
-
-    # Mock response for 'list' command
-    list_resp = {"files": [], "instructions": []}
-    list_resp_json = json.dumps(list_resp)
-    list_length = len(list_resp_json)
-    list_length_bytes = list_length.to_bytes(4, "big")
-    list_data_bytes = list_resp_json.encode()
-
-    # Mock response for 'query' command
-    resp = {"summary": "= No changes detected.", "message": "Here's the update:"}
-    resp_json = json.dumps(resp)
-    length = len(resp_json)
-    length_bytes = length.to_bytes(4, "big")
-    data_bytes = resp_json.encode()
-
-    mock_socket.recv.side_effect = [
-        list_length_bytes,
-        list_data_bytes,
-        length_bytes,
-        data_bytes,
-    ]
-    mocker.patch("socket.socket", return_value=mock_socket)
+    mock_socket = fake_socket(mocker, 
+        ("backlog", {"files": [], "instructions": [], "profile": "default"}),
+        {"summary": "= No changes detected.", "message": "Here's the update:"},
+    )
+    mock_socket_class = mocker.patch("socket.socket", return_value=mock_socket)
 
     result = capture_output(["session", "msg", "Test prompt", "-o", "__temp.json"])
     assert result.exit_code == 0
     assert "Message from Grok: Here's the update:" in result.output
     assert "Summary:" in result.output
     assert "= No changes detected." in result.output
+    # One connection and one request fetch the backlog and run the query
+    assert mock_socket_class.call_count == 1
+    (query_request,) = sent_requests(mock_socket)
+    assert query_request["cmd"] == "query"
+    assert query_request["backlog"] is True
+    assert query_request["id"] == 2
+    assert query_request["session"] == f"default@{tmp_path.resolve()}"
+    assert query_request["output"] == str((tmp_path / "__temp.json").resolve())
+
+
+def test_session_msg_race(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test session msg --race sends each profile's model and prints the race report."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
+    timings = [
+        {"profile": "py", "model": "grok-code-fast-1", "outcome": "won", "latency": 1.5},
+        {"profile": "doc", "model": "grok-4-fast", "outcome": "cancelled", "latency": 1.5},
+    ]
+    mock_socket = fake_socket(
+        mocker,
+        ("backlog", {"files": [], "instructions": []}),
+        {"summary": "= No changes detected.", "message": "", "race": timings},
+    )
+    mocker.patch("socket.socket", return_value=mock_socket)
 
+    result = capture_output(["session", "msg", "Test prompt", "--race", "py,doc,py"])
+    assert result.exit_code == 0
+    assert "Race won by: py (grok-code-fast-1) in 1.50 seconds" in result.output
+    assert "doc (grok-4-fast) cancelled after 1.50 seconds" in result.output
+    (query_request,) = sent_requests(mock_socket)
+    assert query_request["race"] == [
+        {"profile": "py", "model": "grok-code-fast-1", "temperature": 0},
+        {"profile": "doc", "model": "grok-4-fast", "temperature": 0.7},
+    ]
 
-def test_session_msg_invalid_input_file(capture_output, tmp_path, monkeypatch):
-    """Test session msg command with invalid input file."""
+
+def test_session_msg_stream(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test session msg --stream prints chunk frames before the summary frame."""
     monkeypatch.chdir(tmp_path)
-    Path("initial.json").write_text('{"files": []}')
-    Path(".grk_session.pid").write_text("12345")
-    Path(".grk_session.json").write_text(
-        json.dumps({"profile": "default", "initial_file": "initial.json", "pid": 12345})
+    fake_daemon(isolated_runtime_dir)
+
+    mock_socket = fake_socket(mocker, 
+        ("backlog", {"files": [], "instructions": []}),
+        ("chunk", "streamed-"),
+        ("chunk", "tokens"),
+        {
+            "summary": "= No changes detected.",
+            "message": "",
+            "thinking_time": 1.5,
+            "first_token_time": 0.25,
+            "usage": {
+                "prompt_tokens": 2000,
+                "cached_prompt_tokens": 1800,
+                "completion_tokens": 40,
+            },
+        },
     )
-    Path(".grk_session.port").write_text("12345")
+    mocker.patch("socket.socket", return_value=mock_socket)
+
+    result = capture_output(["session", "msg", "Test prompt", "--stream"])
+    assert result.exit_code == 0
+    assert "streamed-tokens" in result.output
+    assert "Time to first token: 0.25 seconds" in result.output
+    assert "Prompt tokens: 2000 (1800 cached, 90%)" in result.output
+    assert "= No changes detected." in result.output
+    assert sent_requests(mock_socket)[-1]["stream"] is True
+
+
+def test_session_msg_unknown_session(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test session msg reports an error result sent in place of the backlog."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
+
+    mock_socket = fake_socket(mocker, {"error": "No session 'x'"})
+    mocker.patch("socket.socket", return_value=mock_socket)
+
+    result = capture_output(["session", "msg", "Test prompt", "-n", "x"])
+    assert result.exit_code == 0
+    assert "Error: No session 'x'" in result.output
+    assert "Querying grk session" not in result.output
+
+
+def test_session_msg_invalid_input_file(
+    capture_output, tmp_path, monkeypatch, isolated_runtime_dir
+):
+    """Test session msg command with invalid input file."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
     result = capture_output(["session", "msg", "Test prompt", "-i", "nonexistent.txt"])
     assert result.exit_code != 0
     assert "Invalid input file" in result.output
@@ -261,29 +388,23 @@ def test_session_msg_no_session(capture_output, tmp_path, monkeypatch):
     assert "No session running" in result.output
 
 
-def test_session_new_command(capture_output, tmp_path, monkeypatch, mocker):
+def test_session_new_command(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
     """Test session new command to renew instruction stack."""
     monkeypatch.chdir(tmp_path)
-    Path(".grk_session.pid").write_text("12345")
-    Path(".grk_session.port").write_text("12345")
+    fake_daemon(isolated_runtime_dir)
     Path("new.json").write_text('{"instructions": [], "files": []}')
 
-    mock_socket = mocker.Mock()
-    mock_socket.connect = mocker.Mock()
-    mock_socket.send = mocker.Mock()
-
-    resp = {"message": "Instruction stack renewed."}
-    resp_json = json.dumps(resp)
-    length = len(resp_json)
-    length_bytes = length.to_bytes(4, "big")
-    data_bytes = resp_json.encode()
-
-    mock_socket.recv.side_effect = [length_bytes, data_bytes]
+    mock_socket = fake_socket(mocker, {"message": "Instruction stack renewed."})
     mocker.patch("socket.socket", return_value=mock_socket)
 
-    result = capture_output(["session", "new", "new.json"])
+    result = capture_output(["session", "new", "new.json", "-n", "other"])
     assert result.exit_code == 0
     assert "Success: Instruction stack renewed." in result.output
+    request = sent_requests(mock_socket)[0]
+    assert request["session"] == f"other@{tmp_path.resolve()}"
+    assert request["full"] is False
 
 
 def test_session_new_no_session(capture_output, tmp_path, monkeypatch):
@@ -295,29 +416,21 @@ def test_session_new_no_session(capture_output, tmp_path, monkeypatch):
     assert "No session running" in result.output
 
 
-def test_session_down_command(capture_output, tmp_path, monkeypatch, mocker):
+def test_session_down_command(
+    capture_output, tmp_path, monkeypatch, mocker, caplog, isolated_runtime_dir
+):
     """Test session down command."""
     monkeypatch.chdir(tmp_path)
-    Path(".grk_session.pid").write_text("12345")
-    Path(".grk_session.port").write_text("12345")
-
-    mock_socket = mocker.Mock()
-    mock_socket.connect = mocker.Mock()
-    mock_socket.send = mocker.Mock()
-
-    resp = "Shutting down"
-    length = len(resp)
-    length_bytes = length.to_bytes(4, "big")
-    data_bytes = resp.encode()
+    fake_daemon(isolated_runtime_dir)
 
-    mock_socket.recv.side_effect = [length_bytes, data_bytes]
+    mock_socket = fake_socket(mocker, "Shutting down")
     mocker.patch("socket.socket", return_value=mock_socket)
-    mocker.patch("os.kill")
 
-    result = capture_output(["session", "down"])
+    with caplog.at_level("INFO"):
+        result = capture_output(["session", "down"])
     assert result.exit_code == 0
-    assert not Path(".grk_session.pid").exists()
-    assert not Path(".grk_session.port").exists()
+    assert "Shutting down" in caplog.text
+    assert sent_requests(mock_socket)[0]["cmd"] == "down"
 
 
 def test_session_down_no_session(capture_output, tmp_path, monkeypatch):
@@ -328,29 +441,21 @@ def test_session_down_no_session(capture_output, tmp_path, monkeypatch):
     assert "No session running" in result.output
 
 
-def test_session_list_command(capture_output, tmp_path, monkeypatch, mocker):
+def test_session_list_command(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
     """Test session list command."""
     monkeypatch.chdir(tmp_path)
-    Path(".grk_session.pid").write_text("12345")
-    Path(".grk_session.port").write_text("12345")
-    Path(".grk_session.json").write_text(
-        json.dumps({"profile": "default", "initial_file": "initial.json"})
+    fake_daemon(isolated_runtime_dir)
+
+    mock_socket = fake_socket(mocker, 
+        {
+            "files": ["file1.txt"],
+            "instructions": [{"role": "system", "synopsis": "test"}],
+            "profile": "default",
+            "initial_file": "initial.json",
+        }
     )
-
-    mock_socket = mocker.Mock()
-    mock_socket.connect = mocker.Mock()
-    mock_socket.send = mocker.Mock()
-
-    resp = {
-        "files": ["file1.txt"],
-        "instructions": [{"role": "system", "synopsis": "test"}],
-    }
-    resp_json = json.dumps(resp)
-    length = len(resp_json)
-    length_bytes = length.to_bytes(4, "big")
-    data_bytes = resp_json.encode()
-
-    mock_socket.recv.side_effect = [length_bytes, data_bytes]
     mocker.patch("socket.socket", return_value=mock_socket)
 
     result = capture_output(["session", "list"])
@@ -360,6 +465,38 @@ def test_session_list_command(capture_output, tmp_path, monkeypatch, mocker):
     assert "system: test" in result.output
 
 
+def test_session_list_all_command(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test session list --all shows every session hosted by the daemon."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
+
+    session = {
+        "profile": "default",
+        "model": "grok-4-fast",
+        "files": 3,
+        "busy": False,
+    }
+    mock_socket = fake_socket(
+        mocker,
+        {
+            "sessions": [
+                {**session, "name": "a", "project": "/p1"},
+                {**session, "name": "b", "project": "/p2", "busy": True},
+            ]
+        }
+    )
+    mocker.patch("socket.socket", return_value=mock_socket)
+
+    result = capture_output(["session", "list", "--all"])
+    assert result.exit_code == 0
+    assert "a /p1" in result.output
+    assert "b /p2" in result.output
+    assert "busy" in result.output
+    assert sent_requests(mock_socket)[0] == {"cmd": "sessions", "id": 2}
+
+
 def test_session_list_no_session(capture_output, tmp_path, monkeypatch):
     """Test session list command with no session running."""
     monkeypatch.chdir(tmp_path)
@@ -397,22 +534,103 @@ def test_postprocess_response(raw_response, expected_cleaned, expected_message):
 
 
 def test_session_up_cleanup_stale_pid(
-    capture_output, tmp_path, monkeypatch, mocker, caplog
+    capture_output, tmp_path, monkeypatch, mocker, caplog, isolated_runtime_dir
 ):
     """Test session up command with stale PID cleanup."""
     monkeypatch.chdir(tmp_path)
-    Path(".grk_session.pid").write_text("99999")  # Non-existing pid
+    fake_daemon(isolated_runtime_dir, pid="99999")  # Non-existing pid
     Path("initial.json").write_text('{"files": []}')
-    mock_popen = mocker.patch("subprocess.Popen")
-    mock_popen.return_value.pid = 12345
+    mocker.patch("os.kill", side_effect=OSError)
+    mock_start = mocker.patch(
+        "grk.cli.cli.start_daemon",
+        side_effect=lambda: fake_daemon(isolated_runtime_dir),
+    )
+    mock_socket = fake_socket(mocker, {"message": "started"})
+    mocker.patch("socket.socket", return_value=mock_socket)
     with caplog.at_level("INFO"):
         result = capture_output(
             ["session", "up", "initial.json"], env={"XAI_API_KEY": "dummy_key"}
         )
     assert "Cleaning up stale PID file" in caplog.text
+    assert mock_start.called
     assert result.exit_code == 0
 
 
+def test_concurrent_session_up_starts_one_daemon(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test concurrent session up commands start a single daemon."""
+    monkeypatch.chdir(tmp_path)
+    Path("initial.json").write_text('{"files": []}')
+    monkeypatch.setenv("XAI_API_KEY", "dummy_key")
+
+    def start():
+        time.sleep(0.1)
+        fake_daemon(isolated_runtime_dir, pid=str(os.getpid()))
+
+    mock_start = mocker.patch("grk.cli.cli.start_daemon", side_effect=start)
+    mocker.patch("grk.cli.cli.daemon_request", return_value="started")
+    from grk.cli.cli import session_up_func
+
+    threads = [
+        threading.Thread(target=session_up_func, args=("initial.json",))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert mock_start.call_count == 1
+
+
+def test_start_daemon_waits_for_readiness(
+    tmp_path, monkeypatch, caplog, isolated_runtime_dir
+):
+    """Test start_daemon returns once the launched daemon reports it is listening."""
+    monkeypatch.chdir(tmp_path)
+    with caplog.at_level("INFO"):
+        start_daemon()
+    assert "Session daemon started with PID" in caplog.text
+    files = daemon_files()
+    assert files.sock.exists() or files.port.exists()
+    assert daemon_request({"cmd": "shutdown"}) == "Shutting down"
+
+
+def test_start_daemon_reports_startup_error(
+    tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test a startup error sent on the ready channel is raised, without log scraping."""
+    monkeypatch.chdir(tmp_path)
+
+    def launch(*args, env, **kwargs):
+        ReadyChannel(os.dup(int(env[READY_FD_ENV]))).send(error="ImportError: no xai_sdk")
+        return mocker.Mock(pid=4242)
+
+    mocker.patch("subprocess.Popen", side_effect=launch)
+    with pytest.raises(GrkException, match="Daemon failed to start: ImportError: no xai_sdk"):
+        start_daemon()
+    assert not daemon_files().pid.exists()
+
+
+def test_session_warm(
+    capture_output, tmp_path, monkeypatch, mocker, caplog, isolated_runtime_dir
+):
+    """Test session warm asks a running daemon to stay up between sessions."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
+    mocker.patch("os.kill")
+    mock_socket = fake_socket(mocker, {"message": "Daemon warm.", "idle": 60})
+    mocker.patch("socket.socket", return_value=mock_socket)
+    with caplog.at_level("INFO"):
+        result = capture_output(
+            ["session", "warm", "--idle", "60"], env={"XAI_API_KEY": "dummy_key"}
+        )
+    assert result.exit_code == 0
+    assert "PID 12345 stays warm for 60 seconds" in caplog.text
+    request = sent_requests(mock_socket)[0]
+    assert request == {"cmd": "warm", "idle": 60.0, "api_key": "dummy_key", "id": 2}
+
+
 def test_init_command_with_existing_brief(
     capture_output, tmp_path, monkeypatch, caplog
 ):
@@ -423,3 +641,51 @@ def test_init_command_with_existing_brief(
         result = capture_output(["config", "init"])
     assert result.exit_code == 0
     assert "Brief differs from default, saved old as 'brief_old'." in caplog.text
+
+
+def test_session_connects_over_unix_socket(
+    capture_output, tmp_path, monkeypatch, mocker, isolated_runtime_dir
+):
+    """Test session commands prefer the daemon's Unix socket over TCP."""
+    monkeypatch.chdir(tmp_path)
+    fake_daemon(isolated_runtime_dir)
+    (isolated_runtime_dir / "daemon.sock").touch()
+
+    mock_socket = fake_socket(mocker, "Shutting down")
+    mock_socket_class = mocker.patch("socket.socket", return_value=mock_socket)
+
+    result = capture_output(["session", "down"])
+    assert result.exit_code == 0
+    assert mock_socket_class.call_args[0][0] == socket.AF_UNIX
+    mock_socket.connect.assert_called_once_with(
+        str(isolated_runtime_dir / "daemon.sock")
+    )
+
+
+# Milliseconds grk may add to `import grk.cli.cli` on top of treeparse, which
+# already brings in pydantic and rich. Importing the SDK alone costs several
+# hundred, so the budget catches heavy imports creeping back to module level.
+IMPORT_BUDGET_MS = 250
+LAZY_MODULES = ("xai_sdk", "grpc", "aiohttp", "ruamel.yaml", "rich.live", "sqlite3")
+
+
+def test_cli_cold_start_budget():
+    """Test importing the CLI stays within budget and leaves heavy modules unloaded."""
+    code = (
+        "import sys, treeparse, grk.cli.cli; "
+        f"print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+    # importtime lines read "import time: <self us> | <cumulative us> | <module>"
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", line)
+        if match:
+            cumulative[match.group(2)] = int(match.group(1))
+    assert cumulative["grk.cli.cli"] / 1000 < IMPORT_BUDGET_MS
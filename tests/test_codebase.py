@@ -0,0 +1,138 @@
+"""Tests for the path-indexed codebase model."""
+
+import json
+import pytest
+from grk.utils.codebase import (
+    Codebase,
+    codebase_message,
+    content_digest,
+    files_blocks,
+    files_json,
+    parse_file_blocks,
+)
+
+
+def _file(path, content="x"):
+    return {"path": path, "content": content}
+
+
+def test_codebase_roundtrip():
+    """Test cfold JSON survives loading and serializing, keeping extra keys."""
+    data = {"files": [_file("a.py"), {**_file("b.py"), "mode": "755"}]}
+    codebase = Codebase.from_json(data)
+    assert codebase.to_json() == data
+    assert Codebase.from_json(data["files"]).paths() == ["a.py", "b.py"]
+    assert Codebase.from_json(codebase) is codebase
+
+
+def test_codebase_apply_keeps_order():
+    """Test updates keep their position, new files append and deletes drop out."""
+    codebase = Codebase([_file("a.py"), _file("b.py"), _file("c.py")])
+    codebase.apply(
+        [
+            _file("b.py", "new"),
+            {"path": "a.py", "delete": True},
+            _file("d.py"),
+            _file("../escape.py"),
+            _file("/abs.py"),
+        ]
+    )
+    assert codebase.paths() == ["b.py", "c.py", "d.py"]
+    assert codebase.content("b.py") == "new"
+    assert "a.py" not in codebase
+    assert len(codebase) == 3
+
+
+def test_codebase_info_invalidated_on_upsert():
+    """Test content hashes and sizes are cached and refreshed on replacement."""
+    codebase = Codebase([_file("a.py", "héllo")])
+    assert codebase.info("a.py").size == 6
+    assert codebase.info("a.py").digest == content_digest("héllo")
+    codebase.upsert(_file("a.py", "bye"))
+    assert codebase.info("a.py") == (content_digest("bye"), 3)
+
+
+def test_codebase_classify():
+    """Test changes are sorted into changed, new and deleted paths."""
+    codebase = Codebase([_file("same.py"), _file("mod.py"), _file("gone.py")])
+    changes = codebase.classify(
+        [
+            _file("same.py"),
+            _file("mod.py", "y"),
+            _file("new.py"),
+            {"path": "gone.py", "delete": True},
+        ]
+    )
+    assert changes.changed == ["mod.py"]
+    assert changes.new == ["new.py"]
+    assert changes.deleted == ["gone.py"]
+
+
+def test_files_json_stable():
+    """Test stable serialization ignores file and key order."""
+    one = [{"path": "b.py", "content": "b"}, {"content": "a", "path": "a.py"}]
+    two = [{"path": "a.py", "content": "a"}, {"content": "b", "path": "b.py"}]
+    assert files_json(one, stable=True) == files_json(two, stable=True)
+    assert files_json(one) != files_json(two)
+    assert json.loads(files_json(one, stable=True))[0]["path"] == "a.py"
+
+
+def test_files_json_compact():
+    """Test compact JSON drops whitespace and still round-trips."""
+    files = [_file("a.py", 'print("hi")\n')]
+    compact = files_json(files, compact=True)
+    assert compact == '[{"path":"a.py","content":"print(\\"hi\\")\\n"}]'
+    assert json.loads(compact) == files
+
+
+def test_file_blocks_roundtrip():
+    """Test file blocks round-trip contents verbatim, whatever lines they contain."""
+    files = [
+        _file("a.py", 'x = "quoted"\n\tindented\n'),
+        _file("empty.txt", ""),
+        _file("rule.md", "Title\n=====\n====== FILE fake.py\nno newline"),
+        {"path": "gone.py", "delete": True},
+    ]
+    blocks = files_blocks(files)
+    assert blocks.startswith("======= FILE a.py\n")  # Longer than any '=' run inside
+    parsed, rest = parse_file_blocks(f"Here you go:\n{blocks}\nDone.")
+    assert parsed == files
+    assert rest == "Here you go:\nDone."
+    stable, _ = parse_file_blocks(files_blocks(files[::-1], stable=True))
+    assert [f["path"] for f in stable] == ["a.py", "empty.txt", "gone.py", "rule.md"]
+
+
+def test_parse_file_blocks_truncated():
+    """Test a block without its END line is dropped."""
+    files, rest = parse_file_blocks(
+        "===== FILE a.py\na\n===== END\n===== FILE b.py\nb"
+    )
+    assert files == [_file("a.py", "a")]
+    assert parse_file_blocks("no blocks here") == ([], "no blocks here")
+
+
+def test_codebase_message_formats():
+    """Test each context format embeds the files under the heading."""
+    files = [_file("a.py", "a\n")]
+    pretty = codebase_message(files)
+    assert pretty == f"Current codebase files:\n```json\n{files_json(files)}\n```"
+    assert '[{"path":"a.py"' in codebase_message(files, "compact")
+    blocks = codebase_message(files + [{"path": "b.py", "delete": True}], "blocks", heading="Changed")
+    assert blocks.startswith("Changed, one block per file.")
+    assert "'===== DELETE <path>' line marks a deleted file" in blocks
+    assert parse_file_blocks(blocks)[0][0] == files[0]
+    with pytest.raises(ValueError):
+        codebase_message(files, "xml")
+
+
+def test_codebase_copy():
+    """Test a copy keeps the files and hashes but not later changes."""
+    codebase = Codebase([{"path": "a.py", "content": "a"}, {"path": "b.py", "content": "b"}])
+    digest = codebase.info("a.py").digest
+    clone = codebase.copy()
+    codebase.delete("b.py")
+    codebase.upsert({"path": "a.py", "content": "changed"})
+    assert clone.paths() == ["a.py", "b.py"]
+    assert clone.content("a.py") == "a"
+    assert clone.info("a.py").digest == digest
+    assert codebase.content("a.py") == "changed"
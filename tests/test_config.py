@@ -1,8 +1,18 @@
 """Tests for configuration loading and management."""
 
+import os
 from pathlib import Path
+from unittest.mock import patch
+import pytest
 from ruamel.yaml import YAML
-from grk.config.config import load_config, create_default_config, load_brief
+from grk.config import config
+from grk.config.config import (
+    load_config,
+    create_default_config,
+    load_brief,
+    load_brief_content,
+    load_fold_config,
+)
 from grk.config.models import ProfileConfig, Brief  # Import for type checking
 
 
@@ -134,3 +144,70 @@ def test_load_brief_invalid(tmp_path, monkeypatch, caplog):
         result = load_brief()
     assert "Failed to load brief from .grkrc" in caplog.text
     assert result is None
+
+
+def test_config_parsed_once_per_modification(tmp_path, monkeypatch):
+    """Test .grkrc is parsed once until its modification time or size changes."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GRK_CONFIG_SNAPSHOT", "off")
+    Path(".grkrc").write_text("profiles:\n  default:\n    model: a\n")
+    with patch.object(config, "parse_config", wraps=config.parse_config) as parse:
+        assert load_config().model == "a"
+        load_brief()
+        load_fold_config()
+        assert parse.call_count == 1
+        Path(".grkrc").write_text("profiles:\n  default:\n    model: bb\n")
+        assert load_config().model == "bb"
+        assert parse.call_count == 2
+    # Profiles are copies, so callers cannot change the cached config
+    load_config().model = "changed"
+    assert load_config().model == "bb"
+    assert not list(Path(os.environ["XDG_CACHE_HOME"]).rglob("*.json"))
+
+
+def test_config_snapshot(tmp_path, monkeypatch, isolated_config_cache):
+    """Test a precompiled snapshot replaces YAML parsing in a fresh process."""
+    monkeypatch.chdir(tmp_path)
+    Path(".grkrc").write_text("profiles:\n  py:\n    model: m\nfold:\n  gitignore: false\n")
+    assert load_config("py").model == "m"
+    assert len(list(isolated_config_cache.glob("*.json"))) == 1
+    config.clear_config_cache()  # As in a new process
+    with patch.object(config, "parse_config", side_effect=AssertionError("parsed")):
+        assert load_config("py").model == "m"
+        fold = load_fold_config()
+        assert fold.gitignore is False
+        assert fold.max_file_size == 1024 * 1024
+    # A modified file is parsed again despite the snapshot
+    config.clear_config_cache()
+    Path(".grkrc").write_text("profiles:\n  py:\n    model: other\n")
+    assert load_config("py").model == "other"
+
+
+def test_invalid_config_not_snapshotted(tmp_path, monkeypatch, caplog, isolated_config_cache):
+    """Test a broken .grkrc keeps warning on every load and is never snapshotted."""
+    monkeypatch.chdir(tmp_path)
+    Path(".grkrc").write_text("brief: invalid")
+    with caplog.at_level("WARNING"):
+        assert load_brief() is None
+        caplog.clear()
+        assert load_brief() is None
+    assert "Failed to load brief from .grkrc" in caplog.text
+    assert not isolated_config_cache.exists()
+
+
+def test_load_brief_content(tmp_path):
+    """Test brief contents are read once per modification of the brief file."""
+    from grk.config.models import Brief
+
+    brief = Brief(file="brief.txt")
+    path = tmp_path / "brief.txt"
+    path.write_text("one")
+    assert load_brief_content(brief, tmp_path) == "one"
+    stat = path.stat()
+    path.write_text("two")  # Same size and, once restored, the same mtime
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert load_brief_content(brief, tmp_path) == "one"
+    path.write_text("three")
+    assert load_brief_content(brief, tmp_path) == "three"
+    with pytest.raises(FileNotFoundError):
+        load_brief_content(Brief(file="missing.txt"), tmp_path)
@@ -0,0 +1,116 @@
+"""Tests for in-process directory folding."""
+
+from grk.config.models import FoldConfig
+from grk.core.fold import PathMatcher, fold_directory, glob_regex, output_excludes
+from grk.utils.utils import split_globs
+import re
+
+
+def _tree(root, files):
+    for path, content in files.items():
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            target.write_bytes(content)
+        else:
+            target.write_text(content)
+
+
+def test_glob_regex():
+    """Test gitignore-style globs stay within path segments unless doubled."""
+    assert re.fullmatch(glob_regex("*.py"), "a.py")
+    assert not re.fullmatch(glob_regex("*.py"), "src/a.py")
+    assert re.fullmatch(glob_regex("src/**/*.py"), "src/a.py")
+    assert re.fullmatch(glob_regex("src/**/*.py"), "src/x/y/a.py")
+    assert re.fullmatch(glob_regex("file[!0-9].txt"), "filea.txt")
+    assert not re.fullmatch(glob_regex("file[!0-9].txt"), "file1.txt")
+
+
+def test_path_matcher():
+    """Test unanchored, anchored, directory-only and negated patterns."""
+    matcher = PathMatcher.from_patterns(
+        ["*.log", "/build", "cache/", "!keep.log", "# comment", ""]
+    )
+    assert matcher.match("x/debug.log")
+    assert not matcher.match("x/keep.log")
+    assert matcher.match("build", is_dir=True)
+    assert not matcher.match("src/build", is_dir=True)
+    assert matcher.match("src/cache", is_dir=True)
+    assert not matcher.match("src/cache")
+    nested = PathMatcher().extend(["*.tmp", "/local"], base="pkg")
+    assert nested.match("pkg/a/b.tmp")
+    assert not nested.match("other/b.tmp")
+    assert nested.match("pkg/local")
+    assert not nested.match("pkg/x/local")
+
+
+def test_fold_directory(tmp_path):
+    """Test folding honors .gitignore files, globs, binary detection and size caps."""
+    _tree(
+        tmp_path,
+        {
+            ".gitignore": "*.log\nbuild/\n",
+            ".git/HEAD": "ref",
+            "src/a.py": "print('a')\n",
+            "src/.gitignore": "gen_*\n!gen_keep.py\n",
+            "src/gen_x.py": "generated",
+            "src/gen_keep.py": "kept",
+            "src/img.png": b"\x89PNG\r\n\x1a\n\x00\x00",
+            "src/latin1.txt": "caf\xe9".encode("latin-1"),
+            "build/out.py": "built",
+            "debug.log": "log",
+            "big.txt": "x" * 200,
+            "docs/readme.md": "docs",
+        },
+    )
+    config = FoldConfig(max_file_size=100, workers=2)
+    result = fold_directory(tmp_path, config=config)
+    assert result.codebase.paths() == [
+        ".gitignore",
+        "docs/readme.md",
+        "src/.gitignore",
+        "src/a.py",
+        "src/gen_keep.py",
+    ]
+    assert result.codebase.content("src/a.py") == "print('a')\n"
+    assert sorted(result.skipped) == [
+        ("big.txt", "too large"),
+        ("src/img.png", "binary"),
+        ("src/latin1.txt", "binary"),
+    ]
+    assert "skipped 2 binary, 1 too large" in result.summary()
+
+    result = fold_directory(tmp_path, include=["*.py"], exclude=["docs/"], config=config)
+    assert result.codebase.paths() == ["src/a.py", "src/gen_keep.py"]
+
+    result = fold_directory(tmp_path, config=FoldConfig(gitignore=False))
+    assert "build/out.py" in result.codebase
+    assert ".git/HEAD" not in result.codebase
+
+
+def test_fold_directory_reads_grkrc(tmp_path, monkeypatch):
+    """Test the fold settings default to the .grkrc of the current directory."""
+    monkeypatch.chdir(tmp_path)
+    _tree(tmp_path, {".grkrc": "fold:\n  exclude: ['*.md']\n", "a.md": "a", "b.py": "b"})
+    assert fold_directory(".").codebase.paths() == [".grkrc", "b.py"]
+
+
+def test_split_globs():
+    """Test comma-separated globs from the command line."""
+    assert split_globs(None) == []
+    assert split_globs("*.py, docs/ ,") == ["*.py", "docs/"]
+
+
+def test_output_excludes(tmp_path, monkeypatch):
+    """Test outputs and the response cache under the folded directory are excluded."""
+    monkeypatch.chdir(tmp_path)
+    _tree(tmp_path, {".grkrc": "cache:\n  dir: cache/responses\n", "src/a.py": "a"})
+    assert output_excludes("src", ["src/out.json", "elsewhere.json"]) == ["/out.json"]
+    assert output_excludes(".", ["out.json"]) == [
+        "/out.json",
+        "/cache/responses",
+        "/.grk_cache.*",
+    ]
+    _tree(tmp_path, {"cache/responses/k.json": "{}", "out.json": "{}", ".grk_cache.json": "[]"})
+    excluded = output_excludes(".", ["out.json"])
+    assert fold_directory(".", exclude=excluded).codebase.paths() == [".grkrc", "src/a.py"]
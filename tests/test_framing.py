@@ -0,0 +1,94 @@
+import json
+import socket
+import threading
+import pytest
+from unittest.mock import Mock
+from grk.core.framing import (
+    FrameError,
+    encode_frame,
+    recv_frame,
+    recv_full,
+    send_frame,
+    sendmsg_all,
+)
+
+
+def _recv_into_chunks(*chunks):
+    """Return a recv_into side effect delivering chunks one call at a time."""
+    pending = list(chunks)
+
+    def recv_into(view, size):
+        data = pending.pop(0)[:size]
+        view[: len(data)] = data
+        return len(data)
+
+    return recv_into
+
+
+def test_recv_full():
+    """Test recv_full receives exact size."""
+    mock_conn = Mock()
+    mock_conn.recv_into.side_effect = _recv_into_chunks(b"ab", b"c")
+    assert recv_full(mock_conn, 3) == b"abc"
+
+
+def test_recv_full_incomplete():
+    """Test recv_full raises on incomplete data."""
+    mock_conn = Mock()
+    mock_conn.recv_into.side_effect = _recv_into_chunks(b"ab", b"")
+    with pytest.raises(ValueError):
+        recv_full(mock_conn, 3)
+
+
+def test_encode_frame_byte_length():
+    """Test the length prefix counts encoded bytes, not characters."""
+    frame = encode_frame({"text": "héllo ✓"})
+    body = json.dumps({"text": "héllo ✓"}).encode()
+    assert int.from_bytes(frame[:4], "big") == len(body)
+    assert frame[4:] == body
+
+
+def test_sendmsg_all_partial_writes():
+    """Test sendmsg_all resumes after partial scatter-gather writes."""
+    sent = bytearray()
+
+    def sendmsg(buffers):
+        data = b"".join(bytes(b) for b in buffers)[:3]  # Accept 3 bytes per call
+        sent.extend(data)
+        return len(data)
+
+    mock_conn = Mock()
+    mock_conn.sendmsg.side_effect = sendmsg
+    sendmsg_all(mock_conn, [b"head", b"", b"body-bytes"])
+    assert bytes(sent) == b"headbody-bytes"
+
+
+def test_send_frame_without_sendmsg():
+    """Test send_frame falls back to sendall where sendmsg is unavailable."""
+    mock_conn = Mock(spec=["sendall"])
+    send_frame(mock_conn, "ü")
+    assert mock_conn.sendall.call_args[0][0] == b"\x00\x00\x00\x02\xc3\xbc"
+
+
+def test_frame_roundtrip_large_payload():
+    """Test a multi-megabyte frame survives a real socket pair intact."""
+    payload = {"input_content": "x" * (8 * 1024 * 1024), "note": "ünïcode"}
+    left, right = socket.socketpair()
+    try:
+        sender = threading.Thread(target=send_frame, args=(left, payload))
+        sender.start()
+        assert json.loads(recv_frame(right)) == payload
+        sender.join(timeout=5)
+    finally:
+        left.close()
+        right.close()
+
+
+def test_frame_size_limits():
+    """Test oversized frames are refused on both send and receive."""
+    with pytest.raises(FrameError):
+        send_frame(Mock(), {"data": "x" * 100}, max_frame=50)
+    mock_conn = Mock()
+    mock_conn.recv_into.side_effect = _recv_into_chunks((100).to_bytes(4, "big"))
+    with pytest.raises(FrameError, match="exceeds"):
+        recv_frame(mock_conn, max_frame=50)
@@ -0,0 +1,92 @@
+"""Tests for the session codebase cache journal."""
+
+import gzip
+import json
+from pathlib import Path
+from grk.core.journal import (
+    CodebaseJournal,
+    cache_files,
+    read_codebase,
+    write_snapshot,
+)
+
+
+def _file(path, content="x"):
+    return {"path": path, "content": content}
+
+
+def test_journal_replays_over_snapshot(tmp_path):
+    """Test upserts and deletes are appended and replayed in order."""
+    journal = CodebaseJournal(tmp_path)
+    journal.reset([_file("a.py"), _file("b.py")])
+    journal.record([_file("a.py", "new"), _file("c.py")], [])
+    journal.record([{"path": "b.py", "delete": True}, _file("/etc/passwd")], [])
+    journal.close()
+    snapshot, log = cache_files(tmp_path)
+    assert json.loads(snapshot.read_text()) == [_file("a.py"), _file("b.py")]
+    assert len(log.read_text().splitlines()) == 3
+    assert read_codebase(tmp_path) == [_file("a.py", "new"), _file("c.py")]
+
+
+def test_journal_compaction(tmp_path):
+    """Test the journal is folded into a new snapshot every compact_every entries."""
+    journal = CodebaseJournal(tmp_path, compact_every=3)
+    journal.reset([])
+    journal.record([_file("a.py")], [_file("a.py")])
+    journal.record([_file("b.py")], [_file("a.py"), _file("b.py")])
+    journal.flush()
+    snapshot, log = cache_files(tmp_path)
+    assert log.exists()
+    state = [_file("a.py"), _file("b.py"), _file("c.py")]
+    journal.record([_file("c.py")], state)
+    journal.close()
+    assert not log.exists()
+    assert json.loads(snapshot.read_text()) == state
+    assert read_codebase(tmp_path) == state
+
+
+def test_journal_torn_final_entry(tmp_path, caplog):
+    """Test a partially written final entry is ignored on replay."""
+    write_snapshot([_file("a.py")], tmp_path)
+    _, log = cache_files(tmp_path)
+    log.write_text(json.dumps({"op": "upsert", "file": _file("b.py")}) + '\n{"op": "ups')
+    with caplog.at_level("WARNING"):
+        assert read_codebase(tmp_path) == [_file("a.py"), _file("b.py")]
+    assert "incomplete entry" in caplog.text
+
+
+def test_journal_compressed(tmp_path):
+    """Test compressed snapshots and journals, and switching formats."""
+    write_snapshot([_file("old.py")], tmp_path)
+    journal = CodebaseJournal(tmp_path, compress=True)
+    journal.reset([_file("a.py")])
+    journal.record([_file("b.py")], [])
+    journal.record([_file("c.py")], [])
+    journal.close()
+    snapshot, log = cache_files(tmp_path, compress=True)
+    assert json.loads(gzip.decompress(snapshot.read_bytes())) == [_file("a.py")]
+    assert len(gzip.decompress(log.read_bytes()).splitlines()) == 2
+    assert not Path(tmp_path / ".grk_cache.json").exists()
+    assert read_codebase(tmp_path) == [_file("a.py"), _file("b.py"), _file("c.py")]
+
+
+def test_named_sessions_keep_separate_caches(tmp_path):
+    """Test sessions of one project journal their codebases to their own files."""
+    assert cache_files(tmp_path, name="feature/x") == (
+        tmp_path / ".grk_cache.feature_x.json",
+        tmp_path / ".grk_cache.feature_x.journal",
+    )
+    default = CodebaseJournal(tmp_path)
+    named = CodebaseJournal(tmp_path, name="review")
+    default.reset([_file("a.py")])
+    named.reset([_file("b.py")])
+    default.record([_file("a.py", "new")], [])
+    named.record([{"path": "b.py", "delete": True}], [])
+    default.close()
+    named.close()
+    assert read_codebase(tmp_path) == [_file("a.py", "new")]
+    assert read_codebase(tmp_path, "review") == []
+    assert (tmp_path / ".grk_cache.review.journal").exists()
+    write_snapshot([_file("c.py")], tmp_path, compress=True, name="review")
+    assert read_codebase(tmp_path, "review") == [_file("c.py")]
+    assert read_codebase(tmp_path) == [_file("a.py", "new")]
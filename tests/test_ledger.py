@@ -0,0 +1,126 @@
+"""Tests for the usage ledger."""
+
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+from grk.core.ledger import (
+    _SCHEMA,
+    LedgerEntry,
+    aggregate,
+    ledger_path,
+    load_entries,
+    percentile,
+    record_request,
+)
+from grk.cli.cli import stats_recent_func, stats_summary_func
+from grk.utils.utils import GrkException
+
+
+def test_ledger_path(isolated_ledger, monkeypatch, tmp_path):
+    """Test the ledger lives in the data directory unless GRK_LEDGER overrides it."""
+    assert ledger_path() == isolated_ledger
+    monkeypatch.setenv("GRK_LEDGER", str(tmp_path / "custom.db"))
+    assert ledger_path() == tmp_path / "custom.db"
+    monkeypatch.setenv("GRK_LEDGER", "off")
+    assert ledger_path() is None
+    record_request(LedgerEntry(mode="single"))
+    assert not isolated_ledger.exists()
+
+
+def test_record_and_load(isolated_ledger):
+    """Test entries round-trip through the ledger, newest first."""
+    record_request(LedgerEntry(mode="single", model="m", timestamp=1000.0))
+    record_request(
+        LedgerEntry(
+            mode="session",
+            model="m",
+            first_token_time=0.25,
+            latency=1.5,
+            request_bytes=300,
+            response_bytes=40,
+            timestamp=2000.0,
+        )
+    )
+    entries = load_entries()
+    assert [e.mode for e in entries] == ["session", "single"]
+    assert entries[0].first_token_time == 0.25
+    assert entries[0].request_bytes == 300
+    assert entries[1].first_token_time is None
+    assert [e.mode for e in load_entries(limit=1)] == ["session"]
+    assert load_entries(days=1) == []
+
+
+def test_ledger_migration(tmp_path, monkeypatch):
+    """Test a ledger created before the retries column gains it on first use."""
+    path = tmp_path / "old.db"
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(_SCHEMA.replace(",\n    retries INTEGER NOT NULL DEFAULT 0", ""))
+        conn.execute(
+            "INSERT INTO requests (timestamp, mode, profile, model, prompt_tokens, "
+            "cached_prompt_tokens, completion_tokens, latency, request_bytes, "
+            "response_bytes, outcome) VALUES (1, 'single', 'default', 'm', 0, 0, 0, 1, 0, 0, 'ok')"
+        )
+    monkeypatch.setenv("GRK_LEDGER", str(path))
+    record_request(LedgerEntry(mode="batch", retries=3))
+    assert [(e.mode, e.retries) for e in load_entries()] == [("batch", 3), ("single", 0)]
+    assert aggregate(load_entries(), "model")[0].retries == 3
+
+
+def test_record_request_failure_is_logged(tmp_path, monkeypatch):
+    """Test an unwritable ledger never fails the request."""
+    (tmp_path / "ledger.db").mkdir()
+    monkeypatch.setenv("GRK_LEDGER", str(tmp_path / "ledger.db"))
+    record_request(LedgerEntry(mode="single"))
+
+
+def test_aggregate():
+    """Test per-group percentiles cover answered requests only."""
+    now = time.time()
+    entries = [
+        LedgerEntry(mode="single", model="a", latency=float(i), timestamp=now)
+        for i in range(1, 11)
+    ]
+    entries += [
+        LedgerEntry(mode="batch", model="a", outcome="error", latency=99.0, timestamp=now),
+        LedgerEntry(mode="batch", model="a", outcome="cached", timestamp=now),
+        LedgerEntry(
+            mode="session",
+            model="b",
+            latency=2.0,
+            first_token_time=0.5,
+            prompt_tokens=100,
+            cached_prompt_tokens=80,
+            timestamp=now,
+        ),
+    ]
+    a, b = aggregate(entries, "model")
+    assert (a.key, a.requests, a.errors, a.cached) == ("a", 12, 1, 1)
+    assert a.latency_p50 == percentile([float(i) for i in range(1, 11)], 50) == 5.0
+    assert a.latency_p99 == 10.0
+    assert a.ttft_p50 is None
+    assert (b.ttft_p50, b.prompt_tokens, b.cached_prompt_tokens) == (0.5, 100, 80)
+    assert [s.key for s in aggregate(entries, "mode")] == ["batch", "session", "single"]
+    assert [s.key for s in aggregate(entries, "day")] == [
+        time.strftime("%Y-%m-%d", time.localtime(now))
+    ]
+    with pytest.raises(ValueError):
+        aggregate(entries, "color")
+
+
+def test_stats_commands(capsys, monkeypatch):
+    """Test the stats commands print the aggregated and recent requests."""
+    monkeypatch.setenv("COLUMNS", "200")
+    stats_summary_func()
+    assert "No requests recorded" in capsys.readouterr().out
+    record_request(LedgerEntry(mode="single", model="grok-x", latency=1.0))
+    record_request(LedgerEntry(mode="batch", model="grok-x", outcome="error", error="boom"))
+    stats_summary_func(by="mode")
+    out = capsys.readouterr().out
+    assert "Requests per mode" in out
+    assert "single" in out and "batch" in out
+    stats_recent_func(limit=5)
+    assert "error: boom" in capsys.readouterr().out
+    with pytest.raises(GrkException):
+        stats_summary_func(by="color")
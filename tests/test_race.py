@@ -0,0 +1,91 @@
+"""Tests for race module."""
+
+import json
+import time
+from unittest.mock import patch
+
+from grk.config.models import ResilienceConfig
+from grk.core.ledger import load_entries
+from grk.core.race import RaceLeg, race_profiles, record_race, usable_answer
+
+VALID = json.dumps({"files": [{"path": "a.py", "content": "a = 2"}]})
+
+
+def accept_cfold(response):
+    return usable_answer(response, True)
+
+
+def test_usable_answer():
+    """Test cfold input needs cfold files in the answer, other input any text."""
+    assert usable_answer(VALID, True)
+    assert usable_answer(f"Done:\n```json\n{VALID}\n```", True)
+    assert usable_answer("===== FILE a.py\na = 2\n===== END\n", True)
+    assert not usable_answer("I cannot do that.", True)
+    assert not usable_answer('{"files": "nope"}', True)
+    assert usable_answer("Some prose", False)
+    assert not usable_answer("  ", False)
+
+
+def test_race_first_usable_answer_wins(fake_stream):
+    """Test an invalid fast answer loses to a valid one and silent legs are cancelled."""
+    answers = {
+        "fast": [(0, "Sorry, ")],
+        "good": [(0.05, VALID[:10]), (0, VALID[10:])],
+        "slow": [(30, "x")],  # Thinking for a long time before its first chunk
+    }
+    legs = [RaceLeg("a", "fast"), RaceLeg("b", "good"), RaceLeg("c", "slow")]
+    start = time.time()
+    with patch("grk.core.race.stream_grok", side_effect=fake_stream(answers)):
+        result = race_profiles([], legs, "key", accept_cfold)
+    assert time.time() - start < 5
+    assert result.response == VALID
+    assert result.winner.profile == "b"
+    assert result.winner.usage["prompt_tokens"] == 10
+    assert [t.outcome for t in result.timings] == ["invalid", "won", "cancelled"]
+    assert result.timings[2].error is None
+    assert "b (good) won after" in result.summary()
+
+    record_race(result, "single", 123)
+    entries = {e.profile: e for e in load_entries()}
+    assert entries["b"].outcome == "ok"
+    assert entries["b"].request_bytes == 123
+    assert entries["b"].completion_tokens == 2
+    assert entries["c"].outcome == "cancelled"
+
+
+def test_race_without_winner(fake_stream):
+    """Test a race where every leg fails or answers unusably has no winner."""
+    answers = {"fast": [(0, "prose")], "broken": [(0, RuntimeError("unavailable"))]}
+    legs = [RaceLeg("a", "fast"), RaceLeg("b", "broken")]
+    with patch("grk.core.race.stream_grok", side_effect=fake_stream(answers)):
+        result = race_profiles([], legs, "key", accept_cfold)
+    assert result.winner is None and result.response is None
+    assert [t.outcome for t in result.timings] == ["invalid", "error"]
+    assert result.timings[1].error == "unavailable"
+
+
+def test_race_timeout_and_repeated_profiles(fake_stream):
+    """Test hanging legs are cancelled at the timeout, even when they share a profile."""
+    answers = {"slow": [(30, VALID)]}
+    legs = [RaceLeg("a", "slow"), RaceLeg("a", "slow")]
+    start = time.time()
+    with patch("grk.core.race.stream_grok", side_effect=fake_stream(answers)):
+        result = race_profiles([], legs, "key", accept_cfold, timeout=0.1)
+    assert time.time() - start < 5
+    assert result.winner is None
+    assert [t.outcome for t in result.timings] == ["cancelled", "cancelled"]
+    assert result.timings[0].error == "timed out after 0.1 seconds"
+
+
+def test_race_leg_resilience(fake_stream):
+    """Test each leg streams with the resilience of its own profile."""
+    policy = ResilienceConfig(retries=1)
+    leg = RaceLeg.from_dict(
+        {"profile": "a", "model": "fast", "resilience": policy.model_dump()}
+    )
+    assert leg == RaceLeg("a", "fast", 0, policy)
+    assert RaceLeg.from_dict({"profile": "b", "model": "good"}).resilience is None
+    stream = fake_stream({"fast": [(0, VALID)], "good": [(30, "x")]})
+    with patch("grk.core.race.stream_grok", side_effect=stream):
+        race_profiles([], [leg, RaceLeg("b", "good")], "key", accept_cfold)
+    assert stream.policies == {"fast": policy, "good": None}
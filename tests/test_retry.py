@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+from grk.config.models import ResilienceConfig
+from grk.core.retry import (
+    CircuitBreaker,
+    Retry,
+    backoff_delay,
+    breaker_for,
+    hedge_delay,
+    hedged,
+    is_retryable,
+)
+from grk.core.ledger import LedgerEntry, record_request
+from grk.utils.utils import GrkException
+
+
+def test_is_retryable(rpc_error):
+    """Test only listed gRPC status codes and transport errors are retried."""
+    policy = ResilienceConfig()
+    assert is_retryable(rpc_error("UNAVAILABLE"), policy)
+    assert is_retryable(rpc_error("RESOURCE_EXHAUSTED"), policy)
+    assert not is_retryable(rpc_error("INVALID_ARGUMENT"), policy)
+    assert not is_retryable(rpc_error("CANCELLED"), policy)
+    assert is_retryable(ConnectionResetError(), policy)
+    assert not is_retryable(ValueError("bad"), policy)
+    policy = ResilienceConfig(retry_codes=["INTERNAL"])
+    assert is_retryable(rpc_error("INTERNAL"), policy)
+    assert not is_retryable(rpc_error("UNAVAILABLE"), policy)
+
+
+def test_backoff_delay():
+    """Test delays double up to the cap and jitter scales them down."""
+    policy = ResilienceConfig(backoff=1.0, max_backoff=5.0, jitter=False)
+    assert [backoff_delay(n, policy) for n in range(1, 5)] == [1.0, 2.0, 4.0, 5.0]
+    policy = ResilienceConfig(backoff=1.0, max_backoff=5.0)
+    assert backoff_delay(3, policy, rand=lambda: 0.25) == 1.0
+
+
+def test_retry_call(rpc_error):
+    """Test transient failures are retried with backoff until the call succeeds."""
+    outcomes = [
+        rpc_error("UNAVAILABLE"),
+        rpc_error("DEADLINE_EXCEEDED"),
+        "answer",
+    ]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    sleeps, counts = [], []
+    policy = ResilienceConfig(backoff=0.1, jitter=False)
+    retry = Retry("grok-4", policy, counts.append, sleeps.append)
+    assert retry.call(call) == "answer"
+    assert retry.retries == 2
+    assert counts == [1, 2]
+    assert sleeps == [0.1, 0.2]
+
+
+def test_retry_gives_up(rpc_error):
+    """Test retries stop at the configured count and on non-transient errors."""
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        raise rpc_error("UNAVAILABLE")
+
+    retry = Retry("grok-4", ResilienceConfig(retries=1), sleep=lambda s: None)
+    with pytest.raises(Exception, match="UNAVAILABLE") as exc_info:
+        retry.call(unavailable)
+    assert len(calls) == 2
+    assert retry.describe(exc_info.value) == "UNAVAILABLE (after 1 retries)"
+
+    def invalid():
+        calls.append(1)
+        raise rpc_error("INVALID_ARGUMENT")
+
+    retry = Retry("grok-4", ResilienceConfig(retries=3), sleep=lambda s: None)
+    with pytest.raises(Exception, match="INVALID_ARGUMENT"):
+        retry.call(invalid)
+    assert len(calls) == 3
+    assert retry.retries == 0
+
+
+def test_circuit_breaker():
+    """Test the breaker opens after consecutive failures and admits one trial after cooldown."""
+    now = [0.0]
+    breaker = CircuitBreaker(2, 10.0, clock=lambda: now[0])
+    breaker.failure()
+    breaker.check("grok-4")
+    breaker.failure()
+    with pytest.raises(GrkException, match="Circuit open for grok-4 after 2 consecutive"):
+        breaker.check("grok-4")
+    now[0] = 10.0
+    breaker.check("grok-4")  # The trial call
+    with pytest.raises(GrkException, match="Circuit open"):
+        breaker.check("grok-4")
+    breaker.failure()
+    now[0] = 15.0
+    with pytest.raises(GrkException, match="failing fast for 5 more seconds"):
+        breaker.check("grok-4")
+    now[0] = 20.0
+    breaker.check("grok-4")
+    breaker.success()
+    breaker.check("grok-4")
+    breaker.check("grok-4")
+
+    disabled = CircuitBreaker(0, 10.0)
+    for _ in range(10):
+        disabled.failure()
+    disabled.check("grok-4")
+
+
+def test_retry_fails_fast_on_open_breaker(rpc_error):
+    """Test an open breaker stops a request before it is sent."""
+    policy = ResilienceConfig(retries=5, breaker_threshold=3)
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        raise rpc_error("UNAVAILABLE")
+
+    with pytest.raises(GrkException, match="Circuit open"):
+        Retry("grok-4", policy, sleep=lambda s: None).call(unavailable)
+    assert len(calls) == 3
+    with pytest.raises(GrkException, match="Circuit open"):
+        Retry("grok-4", policy).call(unavailable)
+    assert len(calls) == 3
+    Retry("grok-3", policy).call(lambda: "other models are unaffected")
+    assert breaker_for("grok-4", policy).failures == 3
+
+
+def test_hedged():
+    """Test a slow call gets a duplicate and the first answer wins."""
+    calls = []
+    release = threading.Event()
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    start = time.time()
+    assert hedged(call, 0.05) == "fast"
+    assert time.time() - start < 1
+    release.set()
+    assert hedged(lambda: "only", None) == "only"
+    assert hedged(lambda: "quick", 5) == "quick"
+
+    failures = []
+
+    def failing():
+        failures.append(1)
+        time.sleep(0.1 if len(failures) == 1 else 0)
+        raise ValueError(f"failure {len(failures)}")
+
+    with pytest.raises(ValueError):
+        hedged(failing, 0.01)
+    assert len(failures) == 2
+
+
+def test_hedge_delay():
+    """Test the hedge threshold is fixed or taken from the model's recorded latencies."""
+    assert hedge_delay(ResilienceConfig(), "grok-4") is None
+    assert hedge_delay(ResilienceConfig(hedge_after=2.5), "grok-4") == 2.5
+    policy = ResilienceConfig(hedge_percentile=90)
+    assert hedge_delay(policy, "grok-4") is None
+    for latency in range(1, 21):
+        record_request(LedgerEntry(mode="single", model="grok-4", latency=float(latency)))
+    record_request(LedgerEntry(mode="single", model="grok-4", latency=99.0, outcome="error"))
+    assert hedge_delay(policy, "grok-4") == 18.0
+    assert hedge_delay(policy, "grok-3") is None
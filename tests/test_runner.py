@@ -1,12 +1,15 @@
 """Tests for runner module."""
 
 import pytest
-from grk.core.runner import run_grok
+from grk.core.ledger import load_entries
+from grk.core.race import RaceLeg
+from grk.core.runner import build_messages, run_grok
 from grk.config.config import ProfileConfig
+from grk.config.models import ResilienceConfig
 from grk.utils.utils import GrkException
 from pathlib import Path
 import json
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 
 def test_run_grok_invalid_file(tmp_path, monkeypatch):
@@ -66,4 +69,247 @@ def test_run_grok_with_brief(mock_load_brief, mock_call, tmp_path, monkeypatch):
     assert messages[2].role == 1  # ROLE_USER
     assert messages[2].content[0].text == "Current codebase files:\n```json\n[]\n```"
     assert messages[3].role == 1
-    assert messages[3].content[0].text == "prompt"
\ No newline at end of file
+    assert messages[3].content[0].text == "prompt"
+
+@patch("grk.core.runner.stream_grok")
+def test_run_grok_stream(mock_stream, tmp_path, monkeypatch, capsys):
+    """Test run_grok in streaming mode assembles chunks and postprocesses cfold output."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.json").write_text('{"files": []}')
+    response = Mock()
+    response.usage.completion_tokens = 4
+    response.usage.prompt_tokens = 1000
+    response.usage.cached_prompt_text_tokens = 750
+    chunks = ['```json\n{"files": ', '[{"path": "new.txt", ', '"content": "c"}]}\n```']
+    mock_stream.return_value = iter([(response, c) for c in chunks])
+    config = ProfileConfig(output="output.json")
+    run_grok("input.json", "prompt", config, "key", stream=True)
+    data = json.loads(Path("output.json").read_text())
+    assert data["files"][0]["path"] == "new.txt"
+    captured = capsys.readouterr()
+    assert "Time to first token:" in captured.out
+    assert "4 tokens" in captured.out
+    assert "Prompt tokens: 1000 (750 cached, 75%)" in captured.out
+    assert "New files:" in captured.out
+    (entry,) = load_entries()
+    assert entry.first_token_time is not None
+    assert entry.prompt_tokens == 1000
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_response_cache(mock_call, tmp_path, monkeypatch):
+    """Test run_grok reuses cached responses for identical requests."""
+    monkeypatch.chdir(tmp_path)
+    Path(".grkrc").write_text("cache:\n  dir: .responses\n")
+    Path("input.txt").write_text("content")
+    mock_call.return_value = "Response text"
+    config = ProfileConfig(output="output.txt")
+    run_grok("input.txt", "prompt", config, "key")
+    Path("output.txt").unlink()
+    run_grok("input.txt", "prompt", config, "key")
+    assert mock_call.call_count == 1
+    assert Path("output.txt").read_text() == "Response text"
+    run_grok("input.txt", "other prompt", config, "key")
+    assert mock_call.call_count == 2
+    assert [e.outcome for e in load_entries()] == ["ok", "cached", "ok"]
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_ledger(mock_call, tmp_path, monkeypatch):
+    """Test run_grok records answered and failed requests in the ledger."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.txt").write_text("content")
+
+    def answer(*args, on_usage=None, **kwargs):
+        on_usage({"prompt_tokens": 12, "cached_prompt_tokens": 4, "completion_tokens": 3})
+        return "Response text"
+
+    mock_call.side_effect = answer
+    run_grok("input.txt", "prompt", ProfileConfig(model="grok-x"), "key", profile="py")
+    mock_call.side_effect = GrkException("API call failed: boom")
+    with pytest.raises(GrkException):
+        run_grok("input.txt", "prompt", ProfileConfig(), "key")
+    failed, answered = load_entries()
+    assert (answered.mode, answered.profile, answered.model) == ("single", "py", "grok-x")
+    assert (answered.prompt_tokens, answered.cached_prompt_tokens) == (12, 4)
+    assert answered.completion_tokens == 3
+    assert answered.request_bytes > 0
+    assert answered.response_bytes == len("Response text")
+    assert (failed.outcome, failed.error) == ("error", "API call failed: boom")
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_retries(mock_call, tmp_path, monkeypatch, capsys):
+    """Test run_grok passes the profile's resilience settings and reports retries."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.txt").write_text("content")
+    resilience = ResilienceConfig(retries=4)
+
+    def answer(*args, on_usage=None, resilience=None, on_retry=None):
+        assert resilience.retries == 4
+        on_retry(1)
+        on_retry(2)
+        return "Response text"
+
+    mock_call.side_effect = answer
+    run_grok("input.txt", "prompt", ProfileConfig(resilience=resilience), "key")
+    assert "Retries: 2" in capsys.readouterr().out
+    (entry,) = load_entries()
+    assert (entry.outcome, entry.retries) == ("ok", 2)
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_token_budget(mock_call, tmp_path, monkeypatch, capsys):
+    """Test the token budget warns by default and refuses when configured to."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.json").write_text(
+        json.dumps({"files": [{"path": "big.py", "content": "word " * 200}]})
+    )
+    mock_call.return_value = '{"files": []}'
+    run_grok("input.json", "prompt", ProfileConfig(token_budget=50), "key")
+    out = capsys.readouterr().out
+    assert "big.py: ~" in out
+    assert "exceeds the token budget of 50" in out
+    assert mock_call.called
+
+    mock_call.reset_mock()
+    config = ProfileConfig(token_budget=50, budget_action="refuse")
+    with pytest.raises(GrkException, match="exceeds the token budget"):
+        run_grok("input.json", "prompt", config, "key")
+    assert not mock_call.called
+
+
+def test_build_messages_stable_prefix(tmp_path, monkeypatch):
+    """Test the stable layout puts a canonical codebase ahead of the instructions."""
+    monkeypatch.chdir(tmp_path)
+    config = ProfileConfig(role="role", stable_prefix=True)
+    instructions = [{"type": "user", "content": "do it"}]
+    files = [{"path": "b.py", "content": "b"}, {"content": "a", "path": "a.py"}]
+    with patch("grk.core.runner.load_brief", return_value=None):
+        messages, is_cfold, _ = build_messages(
+            json.dumps({"instructions": instructions, "files": files}), "go", config
+        )
+        reordered, _, _ = build_messages(
+            json.dumps({"files": [files[1], files[0]], "instructions": instructions}),
+            "go",
+            config,
+        )
+    assert is_cfold
+    texts = [m.content[0].text for m in messages]
+    assert texts[0] == "role"
+    assert texts[1].startswith("Current codebase files:")
+    assert texts[1].index('"a.py"') < texts[1].index('"b.py"')
+    assert texts[2:] == ["do it", "go"]
+    assert [m.SerializeToString() for m in messages] == [
+        m.SerializeToString() for m in reordered
+    ]
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_file_blocks(mock_call, tmp_path, monkeypatch, capsys):
+    """Test the block context format is sent, reported and accepted in answers."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.json").write_text(
+        json.dumps({"files": [{"path": "a.py", "content": 'print("a")\n'}]})
+    )
+    mock_call.return_value = "Updated:\n===== FILE a.py\nprint('b')\n===== END\n"
+    config = ProfileConfig(output="output.json", context_format="blocks")
+    run_grok("input.json", "prompt", config, "key")
+    codebase = mock_call.call_args[0][0][-2].content[0].text
+    assert '===== FILE a.py\nprint("a")\n\n===== END' in codebase
+    assert "Codebase encoding: blocks" in capsys.readouterr().out
+    data = json.loads(Path("output.json").read_text())
+    assert data == {"files": [{"path": "a.py", "content": "print('b')"}]}
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_directory(mock_call, tmp_path, monkeypatch, capsys):
+    """Test run_grok folds a directory in-process, leaving out its own output."""
+    monkeypatch.chdir(tmp_path)
+    Path("src").mkdir()
+    Path("src/a.py").write_text("a = 1\n")
+    Path("src/b.txt").write_text("b")
+    Path("output.json").write_text('{"files": []}')
+    mock_call.return_value = '{"files": [{"path": "src/a.py", "content": "a = 2\\n"}]}'
+    run_grok("src", "prompt", ProfileConfig(), "key", exclude=["*.txt"])
+    run_grok(".", "prompt", ProfileConfig(), "key", include=["*.py", "*.json"])
+    first, second = (call[0][0][-2].content[0].text for call in mock_call.call_args_list)
+    assert '"path": "a.py"' in first and "b.txt" not in first
+    assert '"path": "src/a.py"' in second and "output.json" not in second
+    out = capsys.readouterr().out
+    assert "Folded 1 files" in out
+    assert "Changed files:" in out
+
+
+@patch("grk.core.runner.call_grok")
+def test_run_grok_apply(mock_call, tmp_path, monkeypatch, capsys):
+    """Test --apply writes only the changed files of the answer into the folded directory."""
+    monkeypatch.chdir(tmp_path)
+    Path("src").mkdir()
+    Path("src/a.py").write_text("a = 1\n")
+    Path("src/b.py").write_text("b = 1\n")
+    mock_call.return_value = json.dumps(
+        {
+            "files": [
+                {"path": "a.py", "content": "a = 2\n"},
+                {"path": "b.py", "content": "b = 1\n"},
+                {"path": "c.py", "delete": True},
+            ]
+        }
+    )
+    run_grok("src", "prompt", ProfileConfig(), "key", apply=True)
+    assert Path("src/a.py").read_text() == "a = 2\n"
+    out = capsys.readouterr().out
+    assert "Applied: Wrote 1 files" in out
+    assert "2 unchanged" in out  # The deleted file did not exist
+
+    mock_call.return_value = "Just prose"
+    run_grok("src", "other prompt", ProfileConfig(output="out.txt"), "key", apply=True)
+    assert "nothing to apply" in capsys.readouterr().out
+
+
+def test_run_grok_race(fake_stream, tmp_path, monkeypatch, capsys):
+    """Test racing profiles keeps the first usable cfold answer and reports every leg."""
+    monkeypatch.chdir(tmp_path)
+    Path("input.json").write_text('{"files": [{"path": "a.py", "content": "a"}]}')
+    answer = 'Here:\n```json\n{"files": [{"path": "a.py", "content": "b"}]}\n```'
+    stream = fake_stream({"grok-code-fast-1": [(0, "Sorry")], "grok-4": [(0.05, answer)]})
+    legs = [RaceLeg("fast", "grok-code-fast-1"), RaceLeg("doc", "grok-4", 0.7)]
+    with patch("grk.core.race.stream_grok", side_effect=stream):
+        run_grok("input.json", "prompt", ProfileConfig(output="output.json"), "key", race=legs)
+    assert json.loads(Path("output.json").read_text()) == {
+        "files": [{"path": "a.py", "content": "b"}]
+    }
+    out = capsys.readouterr().out
+    assert "Race won by: doc (grok-4)" in out
+    assert "fast (grok-code-fast-1) invalid" in out
+    assert "Message from Grok: Here:" in out
+
+    legs = [RaceLeg("fast", "grok-code-fast-1"), RaceLeg("doc", "grok-code-fast-1", 0.7)]
+    with patch("grk.core.race.stream_grok", side_effect=stream):
+        with pytest.raises(GrkException, match="No raced profile returned a usable answer"):
+            run_grok("input.json", "prompt", ProfileConfig(), "key", race=legs)
+    with pytest.raises(GrkException, match="cannot be combined with streaming"):
+        run_grok("input.json", "prompt", ProfileConfig(), "key", stream=True, race=legs)
+
+
+def test_run_grok_race_response_cache(fake_stream, tmp_path, monkeypatch, capsys):
+    """Test a race reuses the cached winning answer for the same prompt and legs."""
+    monkeypatch.chdir(tmp_path)
+    Path(".grkrc").write_text("cache:\n  dir: .responses\n")
+    Path("input.json").write_text('{"files": []}')
+    answer = 'Done\n```json\n{"files": [{"path": "a.py", "content": "b"}]}\n```'
+    stream = Mock(side_effect=fake_stream({"grok-4": [(0, answer)]}))
+    legs = [RaceLeg("doc", "grok-4"), RaceLeg("doc2", "grok-4", 0.7)]
+    config = ProfileConfig(output="output.json")
+    with patch("grk.core.race.stream_grok", stream):
+        run_grok("input.json", "prompt", config, "key", race=legs)
+        calls = stream.call_count
+        Path("output.json").unlink()
+        run_grok("input.json", "prompt", config, "key", race=legs)
+        assert stream.call_count == calls
+        run_grok("input.json", "prompt", config, "key", race=legs[:1])
+        assert stream.call_count == calls + 1
+    assert json.loads(Path("output.json").read_text())["files"][0]["content"] == "b"
+    assert capsys.readouterr().out.count("Message from Grok: Done") == 3
+    assert [e.outcome for e in load_entries()].count("cached") == 1
@@ -0,0 +1,90 @@
+"""Tests for runtime module."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from grk.core.runtime import (
+    READY_FD_ENV,
+    ReadyChannel,
+    daemon_files,
+    daemon_lock,
+    release_daemon_files,
+    wait_ready,
+)
+
+
+def test_daemon_files(isolated_runtime_dir):
+    """Test the daemon files live in the per-user runtime directory."""
+    files = daemon_files()
+    assert files.pid == isolated_runtime_dir / "daemon.pid"
+    assert files.sock.parent == isolated_runtime_dir
+    assert isolated_runtime_dir.stat().st_mode & 0o777 == 0o700
+
+
+def test_ready_channel_round_trip():
+    """Test the first message on a ready channel is delivered and the pipe closed."""
+    read_fd, write_fd = os.pipe()
+    channel = ReadyChannel(write_fd)
+    channel.send(ready=True, pid=42)
+    channel.send(error="ignored")
+    assert channel.fd is None
+    assert wait_ready(read_fd, 1) == {"ready": True, "pid": 42}
+    assert os.read(read_fd, 1) == b""  # The write end was closed
+    os.close(read_fd)
+
+
+def test_wait_ready_closed_and_silent_pipes():
+    """Test a pipe closed without a message yields None and a silent one times out."""
+    read_fd, write_fd = os.pipe()
+    os.close(write_fd)
+    assert wait_ready(read_fd, 1) is None
+    os.close(read_fd)
+
+    read_fd, write_fd = os.pipe()
+    with pytest.raises(TimeoutError):
+        wait_ready(read_fd, 0.05)
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_ready_channel_from_env(monkeypatch):
+    """Test the inherited channel is taken from the environment only once."""
+    assert ReadyChannel.from_env().fd is None
+    monkeypatch.setenv(READY_FD_ENV, "7")
+    assert ReadyChannel.from_env().fd == 7
+    assert READY_FD_ENV not in os.environ
+
+
+def test_daemon_lock(isolated_runtime_dir):
+    """Test the daemon lock admits one holder at a time."""
+    held = []
+
+    def hold():
+        with daemon_lock():
+            held.append("in")
+            time.sleep(0.1)
+            held.append("out")
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert held == ["in", "out", "in", "out"]
+
+
+def test_release_daemon_files(isolated_runtime_dir):
+    """Test a daemon removes its runtime files but leaves those of its successor."""
+    files = daemon_files()
+    files.pid.write_text("42")
+    files.port.write_text("1234")
+    release_daemon_files(files, 41)
+    assert files.pid.exists() and files.port.exists()
+    release_daemon_files(files, 42)
+    assert not files.pid.exists() and not files.port.exists()
+    files.port.write_text("1234")
+    release_daemon_files(files, 41)
+    assert not files.port.exists()
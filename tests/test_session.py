@@ -1,8 +1,16 @@
 """Tests for core.session module."""
 
-from grk.core.session import apply_cfold_changes, postprocess_response, load_cached_codebase, save_cached_codebase, recv_full, send_response, daemon_process
+from grk.core.framing import FrameError, recv_full, send_frame
+from grk.core.ledger import load_entries
+from grk.core.journal import read_codebase, write_snapshot
+from grk.core.runtime import ReadyChannel, daemon_files, session_id, use_unix_socket, wait_ready
+from grk.core.session_client import SessionConnection
+from grk.config.models import ProfileConfig, ResilienceConfig
+from grk.core.session import Session, apply_cfold_changes, postprocess_response, daemon_process
 from pathlib import Path
+import os
 import socket
+import threading
 import pytest
 from unittest.mock import patch, Mock
 import json
@@ -10,6 +18,7 @@ import time
 from xai_sdk import Client
 from xai_sdk.chat import system, user, assistant
 from grk.config.models import ProfileConfig
+from grk.utils.tokens import file_tokens
 from grk.utils.utils import GrkException
 
 
@@ -51,6 +60,17 @@ def test_postprocess_response_no_json():
     assert message == "Just text"
 
 
+def test_postprocess_response_file_blocks():
+    """Test answers in the file block format become cfold JSON."""
+    cleaned, message = postprocess_response(
+        "Done.\n===== FILE a.py\nx = 1\n===== END\n===== DELETE b.py"
+    )
+    assert json.loads(cleaned) == {
+        "files": [{"path": "a.py", "content": "x = 1"}, {"path": "b.py", "delete": True}]
+    }
+    assert message == "Done."
+
+
 def test_postprocess_response_embedded_json():
     """Test postprocess_response with embedded JSON."""
     response = "Intro [{\"path\": \"file.txt\"}] end"
@@ -59,124 +79,599 @@ def test_postprocess_response_embedded_json():
     assert message == "Intro  end"
 
 
-def test_load_cached_codebase_no_file(tmp_path, monkeypatch):
-    """Test load_cached_codebase with no cache file."""
+def test_read_codebase_no_file(tmp_path, monkeypatch):
+    """Test read_codebase with no cache file."""
     monkeypatch.chdir(tmp_path)
-    assert load_cached_codebase() == []
+    assert read_codebase() == []
 
 
-def test_load_cached_codebase_corrupted(tmp_path, monkeypatch, caplog):
-    """Test load_cached_codebase with corrupted file."""
+def test_read_codebase_corrupted(tmp_path, monkeypatch, caplog):
+    """Test read_codebase with corrupted file."""
     monkeypatch.chdir(tmp_path)
     Path(".grk_cache.json").write_text("invalid json")
     with caplog.at_level("WARNING"):
-        assert load_cached_codebase() == []
+        assert read_codebase() == []
     assert "Cache file is corrupted" in caplog.text
 
 
-def test_save_cached_codebase(tmp_path, monkeypatch, caplog):
-    """Test save_cached_codebase."""
+def test_write_snapshot(tmp_path, monkeypatch, caplog):
+    """Test write_snapshot."""
     monkeypatch.chdir(tmp_path)
     codebase = [{"path": "file.txt", "content": "content"}]
-    save_cached_codebase(codebase)
+    write_snapshot(codebase)
     assert Path(".grk_cache.json").exists()
     assert "file.txt" in Path(".grk_cache.json").read_text()
 
 
-def test_recv_full():
-    """Test recv_full receives exact size."""
-    mock_conn = Mock()
-    mock_conn.recv.side_effect = [b"ab", b"c"]
-    assert recv_full(mock_conn, 3) == b"abc"
-
-
-def test_recv_full_incomplete():
-    """Test recv_full raises on incomplete data."""
-    mock_conn = Mock()
-    mock_conn.recv.side_effect = [b"ab", b""]
-    with pytest.raises(ValueError):
-        recv_full(mock_conn, 3)
-
-
-def test_send_response():
-    """Test send_response sends with length prefix."""
-    mock_conn = Mock()
-    send_response(mock_conn, {"key": "value"})
-    sent = mock_conn.send.call_args[0][0]
+def test_send_frame():
+    """Test send_frame sends with length prefix."""
+    mock_conn = Mock(spec=["sendall"])
+    send_frame(mock_conn, {"key": "value"})
+    sent = mock_conn.sendall.call_args[0][0]
     length = int.from_bytes(sent[:4], "big")
     data = sent[4:]
     assert json.loads(data) == {"key": "value"}
     assert length == len(data)
 
 
-def test_daemon_process(tmp_path, monkeypatch):
-    """Test daemon_process with mocks."""
-    with patch("grk.core.session.load_brief") as mock_load_brief, \
-         patch("grk.core.session.Client") as mock_client_class, \
-         patch("grk.core.session.socket") as mock_socket_module, \
-         patch("grk.core.session.Path") as mock_path_class, \
-         patch("grk.core.session.recv_full") as mock_recv_full:
-        mock_load_brief.return_value = None  # Skip brief loading
-        monkeypatch.chdir(tmp_path)
-        initial_file = "initial.json"
-        # Setup mock for initial file read
-        mock_initial_path = Mock()
-        mock_initial_path.read_text.return_value = '{"files": [], "instructions": []}'
-        # Setup mock for port file
-        mock_port_path = Mock()
-        mock_port_path.write_text = Mock()
-        # Mock Path calls
-        def path_side_effect(path):
-            if path == initial_file:
-                return mock_initial_path
-            elif path == ".grk_session.port":
-                return mock_port_path
+def _request(address, payload):
+    """Send one framed request to the daemon and return the decoded reply."""
+    if isinstance(address, str):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(5)
+        client.connect(address)
+    else:
+        client = socket.create_connection(("127.0.0.1", address), timeout=5)
+    try:
+        data = json.dumps(payload).encode()
+        client.sendall(len(data).to_bytes(4, "big") + data)
+        length = int.from_bytes(recv_full(client, 4), "big")
+        reply = recv_full(client, length).decode()
+        return reply if reply == "Shutting down" else json.loads(reply)
+    finally:
+        client.close()
+
+
+def _start_daemon(run_dir):
+    """Start daemon_process in a thread and return the address it listens on."""
+    thread = threading.Thread(target=daemon_process, daemon=True)
+    thread.start()
+    sock_file = run_dir / "daemon.sock"
+    port_file = run_dir / "daemon.port"
+    for _ in range(100):
+        if sock_file.exists():
+            return thread, str(sock_file)
+        if port_file.exists() and port_file.read_text():
+            return thread, int(port_file.read_text())
+        time.sleep(0.05)
+    raise AssertionError("Daemon did not start listening")
+
+
+def _up(port, project, name="default"):
+    """Register a session for project with the daemon."""
+    Path(project).mkdir(exist_ok=True)
+    (Path(project) / "initial.json").write_text(
+        '{"files": [{"path": "a.py", "content": "x"}], "instructions": []}'
+    )
+    sid = session_id(name, project)
+    reply = _request(
+        port,
+        {
+            "cmd": "up",
+            "session": sid,
+            "name": name,
+            "project": str(project),
+            "file": "initial.json",
+            "api_key": "test_key",
+        },
+    )
+    assert "error" not in reply
+    return sid
+
+
+@pytest.mark.parametrize("transport", ["unix", "tcp"])
+def test_daemon_process(tmp_path, monkeypatch, isolated_runtime_dir, transport):
+    """Test the daemon hosts several sessions and exits with the last one."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GRK_TRANSPORT", transport)
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ):
+        thread, port = _start_daemon(isolated_runtime_dir)
+        assert isinstance(port, str) == (transport == "unix")
+        first = _up(port, tmp_path / "p1")
+        second = _up(port, tmp_path / "p2", name="other")
+        assert "already running" in _request(
+            port, {"cmd": "up", "session": first, "file": "initial.json"}
+        )["error"]
+        data = _request(port, {"cmd": "list", "session": first})
+        assert data["files"] == ["a.py"]
+        assert data["busy"] is False
+        sessions = _request(port, {"cmd": "sessions"})["sessions"]
+        assert {s["id"] for s in sessions} == {first, second}
+        assert _request(port, {"cmd": "bogus", "session": first}) == {
+            "error": "Unknown command"
+        }
+        assert "No session" in _request(port, {"cmd": "list", "session": "x"})["error"]
+        assert _request(port, {"cmd": "down", "session": first}) == "Shutting down"
+        assert thread.is_alive()
+        assert _request(port, {"cmd": "down", "session": second}) == "Shutting down"
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert read_codebase(tmp_path / "p2", "other")[0]["path"] == "a.py"
+    assert read_codebase(tmp_path / "p2") == []
+    assert not (isolated_runtime_dir / "daemon.sock").exists()
+    assert not (isolated_runtime_dir / "daemon.port").exists()
+
+
+def test_daemon_process_reports_readiness(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test the daemon signals its ready channel once listening, or the startup error."""
+    monkeypatch.chdir(tmp_path)
+    read_fd, write_fd = os.pipe()
+    thread = threading.Thread(
+        target=daemon_process, args=(ReadyChannel(write_fd),), daemon=True
+    )
+    thread.start()
+    message = wait_ready(read_fd, 10)
+    os.close(read_fd)
+    assert message["ready"] is True
+    assert message["pid"] == os.getpid()
+    assert _request(message["address"], {"cmd": "shutdown"}) == "Shutting down"
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+    read_fd, write_fd = os.pipe()
+    with patch("grk.core.session.serve", side_effect=OSError("Address in use")):
+        daemon_process(ReadyChannel(write_fd))
+    assert wait_ready(read_fd, 1) == {"error": "OSError: Address in use"}
+    os.close(read_fd)
+
+
+def test_daemon_process_leaves_successor_files(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test an exiting daemon leaves the runtime files of a daemon started in its place."""
+    monkeypatch.chdir(tmp_path)
+    files = daemon_files()
+    files.pid.write_text(str(os.getpid() + 1))
+    files.port.write_text("1234")
+    with patch("grk.core.session.serve", side_effect=OSError("Address in use")):
+        daemon_process(ReadyChannel())
+    assert files.pid.read_text() == str(os.getpid() + 1)
+    assert files.port.exists()
+
+
+def test_daemon_stays_warm(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test a warm daemon outlives its last session for the idle time, then exits."""
+    monkeypatch.chdir(tmp_path)
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ) as mock_get_client:
+        thread, port = _start_daemon(isolated_runtime_dir)
+        reply = _request(port, {"cmd": "warm", "idle": 0.3, "api_key": "test_key"})
+        assert reply == {"message": "Daemon warm.", "idle": 0.3}
+        mock_get_client.assert_called_with("test_key")
+        sid = _up(port, tmp_path / "p1")
+        assert _request(port, {"cmd": "down", "session": sid}) == "Shutting down"
+        # A session started within the idle time cancels the exit
+        sid = _up(port, tmp_path / "p1")
+        time.sleep(0.5)
+        assert thread.is_alive()
+        assert _request(port, {"cmd": "sessions"})["warm_idle"] == 0.3
+        assert _request(port, {"cmd": "down", "session": sid}) == "Shutting down"
+        assert thread.is_alive()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_daemon_status_during_query(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test control commands are answered while a query is generating."""
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    mock_client = Mock()
+    if not use_unix_socket():
+        pytest.skip("Unix domain sockets not available")
+    mock_chat = mock_client.chat.create.return_value
+
+    def slow_sample():
+        release.wait(5)
+        return Mock(content='{"files": []}')
+
+    mock_chat.sample.side_effect = slow_sample
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=mock_client
+    ):
+        thread, port = _start_daemon(isolated_runtime_dir)
+        sid = _up(port, tmp_path / "p1")
+        results = {}
+        query = threading.Thread(
+            target=lambda: results.update(
+                _request(
+                    port,
+                    {"cmd": "query", "session": sid, "prompt": "go", "output": "out.json"},
+                )
+            )
+        )
+        query.start()
+        for _ in range(100):
+            status = _request(port, {"cmd": "status", "session": sid})
+            if status["busy"]:
+                break
+            time.sleep(0.02)
+        assert status["busy"] is True
+        assert status["files"] == 1
+        release.set()
+        query.join(timeout=5)
+        assert "summary" in results
+        assert (tmp_path / "p1" / "out.json").exists()
+        _request(port, {"cmd": "shutdown"})
+        thread.join(timeout=5)
+
+
+def test_daemon_down_during_query(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test down is answered at once while the running query still replies and is journaled."""
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    mock_client = Mock()
+    mock_chat = mock_client.chat.create.return_value
+
+    def slow_sample():
+        release.wait(5)
+        return Mock(content='{"files": [{"path": "a.py", "content": "new"}]}')
+
+    mock_chat.sample.side_effect = slow_sample
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=mock_client
+    ):
+        thread, port = _start_daemon(isolated_runtime_dir)
+        sid = _up(port, tmp_path / "p1")
+        results = {}
+        query = threading.Thread(
+            target=lambda: results.update(
+                query=_request(
+                    port,
+                    {"cmd": "query", "session": sid, "prompt": "go", "output": "out.json"},
+                )
+            )
+        )
+        query.start()
+        for _ in range(100):
+            if _request(port, {"cmd": "status", "session": sid})["busy"]:
+                break
+            time.sleep(0.02)
+        assert _request(port, {"cmd": "down", "session": sid}) == "Shutting down"
+        assert query.is_alive()
+        assert "No session" in _request(port, {"cmd": "status", "session": sid})["error"]
+        assert thread.is_alive()  # Kept up until the query is done
+        release.set()
+        query.join(timeout=5)
+        thread.join(timeout=5)
+    assert "summary" in results["query"]
+    assert not thread.is_alive()
+    assert read_codebase(tmp_path / "p1") == [{"path": "a.py", "content": "new"}]
+
+
+def test_daemon_multiplexed_connection(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test one connection carries several requests answered in completion order."""
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    mock_client = Mock()
+    mock_chat = mock_client.chat.create.return_value
+
+    def slow_sample():
+        release.wait(5)
+        return Mock(content='{"files": []}')
+
+    mock_chat.sample.side_effect = slow_sample
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=mock_client
+    ):
+        thread, address = _start_daemon(isolated_runtime_dir)
+        sid = _up(address, tmp_path / "p1")
+        if isinstance(address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(("127.0.0.1", address), timeout=5)
+        with SessionConnection(sock) as conn:
+            query_id = conn.send(
+                {
+                    "cmd": "query",
+                    "session": sid,
+                    "prompt": "go",
+                    "output": "out.json",
+                    "backlog": True,
+                }
+            )
+            backlog = conn.next_frame(query_id)
+            assert backlog["type"] == "backlog"
+            assert backlog["data"]["files"] == ["a.py"]
+            # The status request overtakes the query still in flight
+            status = conn.call({"cmd": "status", "session": sid})
+            assert status["busy"] is True
+            release.set()
+            result = conn.next_frame(query_id)
+            assert result["id"] == query_id
+            assert result["type"] == "result"
+            assert "summary" in result["data"]
+            assert conn.call({"cmd": "shutdown"}) == "Shutting down"
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_daemon_negotiated_frame_size(tmp_path, monkeypatch, isolated_runtime_dir):
+    """Test the daemon enforces the frame size negotiated on a connection."""
+    monkeypatch.chdir(tmp_path)
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ):
+        thread, address = _start_daemon(isolated_runtime_dir)
+        sid = _up(address, tmp_path / "p1")
+
+        def connect(max_frame):
+            if isinstance(address, str):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(5)
+                sock.connect(address)
             else:
-                return Mock()  # For other paths like cache
-        mock_path_class.side_effect = path_side_effect
-
-        config = ProfileConfig()
-        api_key = "test_key"
-
-        mock_server = Mock()
-        mock_socket_module.socket.return_value = mock_server
-        mock_conn = Mock()
-        mock_server.accept.return_value = (mock_conn, ("addr"))
-        mock_server.getsockname.return_value = ("127.0.0.1", 12345)
-
-        # Mock recv_full for length and data
-        def mock_recv_full_func(conn, size):
-            if size == 4:
-                return (18).to_bytes(4, "big")  # Length for '{"cmd": "down"}'
-            elif size == 18:
-                return b'{"cmd": "down"}'
-            return b""
-
-        mock_recv_full.side_effect = mock_recv_full_func
-        daemon_process(initial_file, config, api_key)
-
-        assert mock_server.bind.called
-        assert mock_server.listen.called
-        assert mock_conn.close.called
-        assert mock_port_path.write_text.called
-        assert mock_server.close.called
-
-
-def test_load_cached_codebase_valid(tmp_path, monkeypatch):
-    """Test load_cached_codebase with valid cache file."""
+                sock = socket.create_connection(("127.0.0.1", address), timeout=5)
+            conn = SessionConnection(sock, max_frame=max_frame)
+            conn.negotiate()
+            return conn
+
+        with connect(150) as conn:
+            # Too large to send back within the negotiated size
+            reply = conn.call({"cmd": "list", "session": sid})
+            assert "exceeds the maximum of 150 bytes" in reply["error"]
+            assert conn.max_frame == 150
+            # Too large to be accepted, which ends the connection
+            conn.max_frame = 10_000
+            with pytest.raises(FrameError, match="closed the connection"):
+                conn.call({"cmd": "status", "session": sid, "pad": "x" * 500})
+        with connect(10_000) as conn:
+            assert conn.call({"cmd": "list", "session": sid})["files"] == ["a.py"]
+            assert conn.call({"cmd": "shutdown"}) == "Shutting down"
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def _session(project, files, instructions=()):
+    """Create a session on a mocked client for the given files."""
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ):
+        return Session(
+            ProfileConfig(),
+            "test_key",
+            {"files": files, "instructions": list(instructions)},
+            project=project,
+        )
+
+
+def test_session_renew_delta(tmp_path):
+    """Test session new appends only the changed files when few files differ."""
+    files = [{"path": f"f{i}.py", "content": "x" * 100} for i in range(10)]
+    session = _session(tmp_path, files)
+    chat = session.chat
+    renewed = [dict(f) for f in files[1:]]
+    renewed[0]["content"] = "changed"
+    renewed.append({"path": "new.py", "content": "y"})
+    (tmp_path / "new.json").write_text(json.dumps({"files": renewed}))
+    with patch("grk.core.session.load_brief", return_value=None):
+        reply = session.renew("new.json")
+    assert reply["mode"] == "delta"
+    assert session.chat is chat  # The chat was kept
+    delta = session.messages[-1].content[0].text
+    assert "changed since the last turn" in delta
+    changes = json.loads(delta.split("```json\n")[1].split("\n```")[0])
+    assert changes == [
+        {"path": "f1.py", "content": "changed"},
+        {"path": "new.py", "content": "y"},
+        {"path": "f0.py", "delete": True},
+    ]
+    assert session.codebase.paths() == [f"f{i}.py" for i in range(1, 10)] + ["new.py"]
+    session.close()
+    assert read_codebase(tmp_path) == session.codebase.to_files()
+
+
+def test_session_renew_full(tmp_path):
+    """Test session new restarts the chat for large deltas, new instructions or --full."""
+    files = [{"path": "a.py", "content": "x" * 10}, {"path": "b.py", "content": "y"}]
+    session = _session(tmp_path, files)
+    (tmp_path / "big.json").write_text(
+        json.dumps({"files": [{"path": "a.py", "content": "z" * 10}, files[1]]})
+    )
+    (tmp_path / "same.json").write_text(json.dumps({"files": files}))
+    (tmp_path / "instr.json").write_text(
+        json.dumps({"files": files, "instructions": [{"type": "user", "content": "hi"}]})
+    )
+    with patch("grk.core.session.load_brief", return_value=None):
+        assert session.renew("same.json")["message"].startswith("Codebase unchanged")
+        assert session.renew("same.json", full=True)["mode"] == "full"
+        assert session.renew("big.json")["mode"] == "full"
+        assert session.renew("instr.json")["mode"] == "full"
+        assert session.renew("instr.json")["mode"] == "delta"
+    session.close()
+
+
+def test_session_query_token_budget(tmp_path):
+    """Test a refused prompt leaves the chat untouched and a warned one reports it."""
+    files = [{"path": "big.py", "content": "word " * 200}]
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ):
+        session = Session(
+            ProfileConfig(token_budget=50, budget_action="refuse"),
+            "test_key",
+            {"files": files},
+            project=tmp_path,
+        )
+        count = len(session.messages)
+        with pytest.raises(GrkException, match="exceeds the token budget"):
+            session.query({"prompt": "go"}, lambda frame: None)
+        assert len(session.messages) == count
+        assert session.list()["file_tokens"][0][0] == "big.py"
+
+        session.budget_action = "warn"
+        session.chat.sample.return_value = Mock(content='{"files": []}')
+        reply = session.query({"prompt": "go", "output": "out.json"}, lambda frame: None)
+        assert "exceeds the token budget of 50" in reply["warning"]
+    session.close()
+    (entry,) = load_entries()  # The refused prompt was never sent
+    assert (entry.mode, entry.outcome) == ("session", "ok")
+    assert entry.request_bytes > 1000
+    assert entry.response_bytes == len('{"files": []}')
+
+
+def test_read_codebase_valid(tmp_path, monkeypatch):
+    """Test read_codebase with valid cache file."""
     monkeypatch.chdir(tmp_path)
     Path(".grk_cache.json").write_text('[{"path": "file.txt", "content": "content"}]')
-    result = load_cached_codebase()
+    result = read_codebase()
     assert len(result) == 1
     assert result[0]["path"] == "file.txt"
 
 
-def test_send_response_str():
-    """Test send_response with string input."""
-    mock_conn = Mock()
-    send_response(mock_conn, "test message")
-    sent = mock_conn.send.call_args[0][0]
+def test_send_frame_str():
+    """Test send_frame with string input."""
+    mock_conn = Mock(spec=["sendall"])
+    send_frame(mock_conn, "test message")
+    sent = mock_conn.sendall.call_args[0][0]
     length = int.from_bytes(sent[:4], "big")
     data = sent[4:]
     assert data.decode() == "test message"
-    assert length == len(data)
\ No newline at end of file
+    assert length == len(data)
+
+def test_session_renew_directory(tmp_path):
+    """Test session new folds a directory and sends only the changed files."""
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("a")
+    (tmp_path / "pkg" / "b.py").write_text("b" * 100)
+    session = _session(
+        tmp_path,
+        [{"path": "a.py", "content": "old"}, {"path": "b.py", "content": "b" * 100}],
+    )
+    with patch("grk.core.session.load_brief", return_value=None):
+        reply = session.renew("pkg", exclude=["*.txt"])
+    assert reply["mode"] == "delta"
+    assert reply["fold"].startswith("Folded 2 files")
+    assert session.codebase.content("a.py") == "a"
+    session.close()
+
+
+def test_session_renew_leaves_out_own_files(tmp_path):
+    """Test a folded renewal uses the project's fold settings and skips grk's own files."""
+    (tmp_path / ".grkrc").write_text("fold:\n  exclude: ['*.log']\n")
+    (tmp_path / "a.py").write_text("a")
+    (tmp_path / "debug.log").write_text("log")
+    (tmp_path / ".grk_responses").mkdir()
+    (tmp_path / ".grk_responses" / "k.json").write_text("{}")
+    session = _session(tmp_path, [{"path": "a.py", "content": "a"}])
+    session.chat.sample.return_value = Mock(content='{"files": []}')
+    with patch("grk.core.session.load_brief", return_value=None):
+        session.query({"prompt": "go"}, lambda frame: None)
+        session.query({"prompt": "go", "output": "answer.json"}, lambda frame: None)
+        session.renew(".", full=True)
+    session.close()
+    assert (tmp_path / "__temp.json").exists()
+    assert (tmp_path / "answer.json").exists()
+    assert session.codebase.paths() == [".grkrc", "a.py"]
+
+
+def test_session_query_apply(tmp_path):
+    """Test a query with apply writes the answer's changed files to the project."""
+    (tmp_path / "a.py").write_text("a")
+    session = _session(tmp_path, [{"path": "a.py", "content": "a"}])
+    session.chat.sample.return_value = Mock(
+        content='{"files": [{"path": "a.py", "content": "b"}, {"path": "n.py", "content": "n"}]}'
+    )
+    with patch("grk.core.session.load_brief", return_value=None):
+        reply = session.query({"prompt": "go", "apply": True}, lambda frame: None)
+    session.close()
+    assert sorted(reply["applied"]["written"]) == ["a.py", "n.py"]
+    assert reply["applied"]["summary"].startswith("Wrote 2 files")
+    assert (tmp_path / "a.py").read_text() == "b"
+
+
+def test_session_query_race(tmp_path, fake_stream):
+    """Test a raced query continues the chat with the winning answer and reports the legs."""
+    session = _session(tmp_path, [{"path": "a.py", "content": "a"}])
+    answer = '{"files": [{"path": "a.py", "content": "b"}]}'
+    legs = [
+        {"profile": "fast", "model": "grok-code-fast-1", "temperature": 0},
+        {"profile": "doc", "model": "grok-4", "temperature": 0.7},
+    ]
+    stream = fake_stream({"grok-code-fast-1": [(0, "no files here")], "grok-4": [(0.05, answer)]})
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.race.stream_grok", side_effect=stream
+    ):
+        reply = session.query({"prompt": "go", "race": legs}, lambda frame: None)
+    session.close()
+    assert [(t["profile"], t["outcome"]) for t in reply["race"]] == [
+        ("fast", "invalid"),
+        ("doc", "won"),
+    ]
+    assert reply["usage"]["completion_tokens"] == 2
+    assert session.messages[-1].content[0].text == answer
+    assert not session.chat.sample.called
+    assert session.codebase.to_files() == [{"path": "a.py", "content": "b"}]
+    assert {e.profile: e.outcome for e in load_entries()} == {"fast": "invalid", "doc": "ok"}
+
+
+def test_session_query_retries(tmp_path, rpc_error):
+    """Test a query retries transient failures, streamed ones only before the first chunk."""
+    with patch("grk.core.session.load_brief", return_value=None), patch(
+        "grk.core.session.get_client", return_value=Mock()
+    ):
+        session = Session(
+            ProfileConfig(resilience=ResilienceConfig(backoff=0)),
+            "test_key",
+            {"files": []},
+            project=tmp_path,
+        )
+        session.chat.sample.side_effect = [
+            rpc_error("UNAVAILABLE"),
+            rpc_error("RESOURCE_EXHAUSTED"),
+            Mock(content='{"files": []}'),
+        ]
+        reply = session.query({"prompt": "go"}, lambda frame: None)
+        assert reply["retries"] == 2
+
+        def failing(chunks):
+            yield from chunks
+            raise rpc_error("UNAVAILABLE")
+
+        answer = Mock(content='{"files": []}')
+        session.chat.stream.side_effect = [
+            failing([]),
+            iter([(answer, Mock(content=answer.content))]),
+            failing([(answer, Mock(content="{"))]),
+        ]
+        emitted = []
+        reply = session.query({"prompt": "go", "stream": True}, emitted.append)
+        assert reply["retries"] == 1
+        with pytest.raises(Exception, match="UNAVAILABLE"):
+            session.query({"prompt": "go", "stream": True}, emitted.append)
+        assert emitted == [{"chunk": '{"files": []}'}, {"chunk": "{"}]
+    session.close()
+    assert [(e.outcome, e.retries) for e in reversed(load_entries())] == [
+        ("ok", 2),
+        ("ok", 1),
+        ("error", 0),
+    ]
+
+
+def test_session_list_reads_a_snapshot(tmp_path):
+    """Test listing is unaffected by files deleted while it estimates tokens."""
+    files = [{"path": "a.py", "content": "a"}, {"path": "b.py", "content": "b"}]
+    session = _session(tmp_path, files)
+
+    def delete_during_estimate(codebase):
+        session.codebase.apply([{"path": "b.py", "delete": True}])
+        return file_tokens(codebase)
+
+    with patch("grk.core.session.file_tokens", side_effect=delete_during_estimate):
+        listing = session.list()
+    session.close()
+    assert listing["files"] == ["a.py", "b.py"]
+    assert sorted(path for path, _ in listing["file_tokens"]) == ["a.py", "b.py"]
+    assert session.codebase.paths() == ["a.py"]
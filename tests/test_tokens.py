@@ -0,0 +1,62 @@
+"""Tests for prompt token estimates."""
+
+from unittest.mock import patch
+from grk.utils import tokens
+from grk.utils.codebase import CONTEXT_FORMATS, Codebase, codebase_message
+from grk.utils.tokens import encoding_tokens, estimate_tokens, file_tokens
+
+
+def test_estimate_tokens():
+    """Test words and punctuation count as tokens, long words per 4 chars."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("def f(x):") == 6
+    assert estimate_tokens("internationalization") == 5
+
+
+def test_estimate_tokens_cached_by_hash():
+    """Test estimates are computed once per content hash."""
+    text = "cached estimate " * 10
+    first = estimate_tokens(text)
+    with patch.object(tokens, "_PIECE") as mock_piece:
+        assert estimate_tokens(text) == first
+    mock_piece.findall.assert_not_called()
+
+
+def test_file_tokens_largest_first():
+    """Test per-file estimates are sorted largest first."""
+    codebase = Codebase(
+        [
+            {"path": "small.py", "content": "x = 1"},
+            {"path": "big.py", "content": "value = compute(x) " * 20},
+            {"path": "empty.py"},
+        ]
+    )
+    result = file_tokens(codebase)
+    assert [path for path, _ in result] == ["big.py", "small.py", "empty.py"]
+    assert result[-1][1] == 0
+
+
+def test_encoding_tokens():
+    """Test escaping-free encodings estimate fewer tokens for source code."""
+    source = 'def f(x):\n    return "value: \\"%s\\"" % x\n' * 20
+    tokens = encoding_tokens([{"path": "f.py", "content": source}])
+    assert set(tokens) == {"json", "compact", "blocks"}
+    assert tokens["blocks"] < tokens["compact"] <= tokens["json"]
+
+
+def test_encoding_tokens_from_file_estimates():
+    """Test the per-file estimate tracks the serialized message and is cached per file."""
+    files = [
+        {"path": "a.py", "content": 'x = "é"\n===== not a marker\n\tdone\\\n' * 20},
+        {"path": "docs/b.md", "content": "# Title\n\n==\nbody text for the docs\n" * 20},
+        {"path": "c.txt", "content": ""},
+    ]
+    estimate = encoding_tokens(files)
+    exact = {fmt: tokens.count_tokens(codebase_message(files, fmt)) for fmt in CONTEXT_FORMATS}
+    assert estimate["blocks"] == exact["blocks"]
+    assert estimate["json"] == estimate["compact"]
+    assert abs(estimate["json"] - exact["json"]) <= 0.05 * exact["json"]
+    with patch.object(tokens, "longest_marker_run") as mock_run:
+        encoding_tokens(Codebase(files))
+    mock_run.assert_not_called()
+    assert encoding_tokens([])["blocks"] == tokens.count_tokens(codebase_message([], "blocks"))
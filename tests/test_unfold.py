@@ -0,0 +1,80 @@
+"""Tests for applying cfold output to the working tree."""
+
+import os
+
+from grk.core.unfold import apply_changes
+
+
+def test_apply_changes_only_touches_changed_files(tmp_path):
+    """Test unchanged files keep their mtime while changed and new files are written."""
+    (tmp_path / "same.py").write_text("same")
+    (tmp_path / "size.py").write_text("old")
+    (tmp_path / "hash.py").write_text("abc")
+    for name in ("same.py", "size.py", "hash.py"):
+        os.utime(tmp_path / name, (1, 1))
+    result = apply_changes(
+        [
+            {"path": "same.py", "content": "same"},
+            {"path": "size.py", "content": "longer"},
+            {"path": "hash.py", "content": "xyz"},
+            {"path": "pkg/new.py", "content": "new"},
+        ],
+        tmp_path,
+        workers=2,
+    )
+    assert sorted(result.written) == ["hash.py", "pkg/new.py", "size.py"]
+    assert result.unchanged == ["same.py"]
+    assert result.bytes == len("longer") + len("xyz") + len("new")
+    assert (tmp_path / "same.py").stat().st_mtime == 1
+    assert (tmp_path / "hash.py").read_text() == "xyz"
+    assert (tmp_path / "pkg" / "new.py").read_text() == "new"
+    assert not [p for p in tmp_path.rglob("*.tmp")]
+    assert result.summary().startswith("Wrote 3 files")
+
+
+def test_apply_changes_deletes_and_protects(tmp_path):
+    """Test deletions, protected files and paths outside the root."""
+    (tmp_path / "gone.py").write_text("x")
+    (tmp_path / "brief.typ").write_text("brief")
+    (tmp_path / "outside").mkdir()
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "gone.py").write_text("x")
+    (root / "brief.typ").write_text("brief")
+    (root / "link").symlink_to(tmp_path / "outside")
+    result = apply_changes(
+        [
+            {"path": "gone.py", "delete": True},
+            {"path": "missing.py", "delete": True},
+            {"path": "brief.typ", "content": "changed"},
+            {"path": "../escape.py", "content": "x"},
+            {"path": "a/../../escape.py", "content": "x"},
+            {"path": "link/escape.py", "content": "x"},
+            {"path": ".git/config", "content": "x"},
+        ],
+        root,
+        protected={"brief.typ"},
+    )
+    assert result.deleted == ["gone.py"]
+    assert result.unchanged == ["missing.py"]
+    assert not (root / "gone.py").exists()
+    assert (root / "brief.typ").read_text() == "brief"
+    assert dict(result.skipped) == {
+        "brief.typ": "protected",
+        "../escape.py": "unsafe path",
+        "a/../../escape.py": "unsafe path",
+        "link/escape.py": "unsafe path",
+        ".git/config": "unsafe path",
+    }
+    assert not (tmp_path / "escape.py").exists()
+    assert not (tmp_path / "outside" / "escape.py").exists()
+
+
+def test_apply_changes_keeps_mode(tmp_path):
+    """Test a rewritten file keeps its permission bits."""
+    script = tmp_path / "run.sh"
+    script.write_text("echo old")
+    script.chmod(0o755)
+    apply_changes([{"path": "run.sh", "content": "echo new"}], tmp_path)
+    assert script.read_text() == "echo new"
+    assert script.stat().st_mode & 0o777 == 0o755